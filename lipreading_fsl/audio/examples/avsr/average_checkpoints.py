@@ -1,28 +1,170 @@
+#!/usr/bin/env python3
+"""Averages the weights of several Lightning checkpoints into one model.
+
+Checkpoints are memory-mapped and averaged one tensor at a time in float64, so the peak memory stays
+near the size of one model however many checkpoints are averaged. They are found by `--pattern` in
+`--checkpoint-dir` and either the `--num-checkpoints` latest ones, by global step, or the best ones by
+the score of the `ModelCheckpoint` that monitored `--metric` are averaged. `--ema-decay` weights the
+i-th newest checkpoint by `decay ** i` instead of uniformly.
+
+Example:
+python average_checkpoints.py --checkpoint-dir=[exp_dir]/[exp_name] --output-path=[output_path]
+"""
+
+import glob
+import logging
 import os
+from argparse import ArgumentParser, RawTextHelpFormatter
 
 import torch
 
+logger = logging.getLogger(__name__)
+
+
+def _load(path):
+    # Tensors are only read from disk when they are accessed.
+    return torch.load(path, map_location="cpu", mmap=True, weights_only=False)
+
+
+def _monitored_score(ckpt, metric):
+    for key, state in ckpt.get("callbacks", {}).items():
+        if key.startswith("ModelCheckpoint") and state.get("monitor") == metric:
+            score = state.get("current_score")
+            return None if score is None else float(score)
+    return None
+
+
+def find_checkpoints(checkpoint_dir, pattern="epoch=*.ckpt", num_checkpoints=10, metric=None, mode="max"):
+    """Returns the paths of the checkpoints to average, from oldest to newest.
+
+    :param checkpoint_dir: str, directory of the checkpoints.
+    :param pattern: str, glob pattern of the checkpoint file names.
+    :param num_checkpoints: int, maximum number of checkpoints returned.
+    :param metric: str or None, if given, the checkpoints with the best score of the ``ModelCheckpoint``
+        monitoring this metric are returned, otherwise the ones with the latest global step.
+    :param mode: str, ``"max"`` or ``"min"``, whether a higher or lower score of ``metric`` is better.
+    rtype: List[str]
+    """
+    candidates = []
+    for path in glob.glob(os.path.join(checkpoint_dir, pattern)):
+        ckpt = _load(path)
+        step = ckpt.get("global_step", 0)
+        if metric is None:
+            candidates.append((step, step, path))
+            continue
+        score = _monitored_score(ckpt, metric)
+        if score is None:
+            logger.warning(f"{path} has no score for {metric}, skipping it.")
+            continue
+        candidates.append((score if mode == "max" else -score, step, path))
+    if not candidates:
+        raise ValueError(f"No checkpoints match {os.path.join(checkpoint_dir, pattern)}.")
+    selected = sorted(candidates)[-num_checkpoints:]
+    return [path for _, _, path in sorted(selected, key=lambda c: c[1])]
+
 
-def average_checkpoints(last):
-    avg = None
-    for path in last:
-        states = torch.load(path, map_location=lambda storage, loc: storage)["state_dict"]
-        if avg is None:
-            avg = states
-        else:
-            for k in avg.keys():
-                avg[k] += states[k]
-    # average
-    for k in avg.keys():
-        if avg[k] is not None:
-            if avg[k].is_floating_point():
-                avg[k] /= len(last)
-            else:
-                avg[k] //= len(last)
+def ema_weights(num_checkpoints, decay):
+    """Returns the weights ``decay ** i`` of the ``i``-th newest of ``num_checkpoints``, normalized to sum to 1.
+
+    rtype: List[float], from oldest to newest.
+    """
+    weights = [decay ** (num_checkpoints - 1 - i) for i in range(num_checkpoints)]
+    return [w / sum(weights) for w in weights]
+
+
+def average_checkpoints(last, weights=None):
+    """Returns the weighted average of the ``state_dict`` of the checkpoints ``last``.
+
+    Every tensor is summed over all checkpoints in float64 before it is cast back to its dtype, so only
+    the averaged model and one float64 tensor are held in memory. Integer tensors are rounded down.
+
+    :param last: List[str], paths of the checkpoints.
+    :param weights: List[float] or None, weight of every checkpoint, uniform if ``None``.
+    rtype: dict, averaged state dict.
+    """
+    if weights is None:
+        weights = [1.0 / len(last)] * len(last)
+    if len(weights) != len(last):
+        raise ValueError(f"Got {len(weights)} weights for {len(last)} checkpoints.")
+    total = sum(weights)
+    states = [_load(path)["state_dict"] for path in last]
+    avg = {}
+    for k, v in states[0].items():
+        if not isinstance(v, torch.Tensor):
+            avg[k] = v
+            continue
+        acc = torch.zeros(v.shape, dtype=torch.float64)
+        for state, weight in zip(states, weights):
+            acc.add_(state[k], alpha=weight / total)
+        if not v.is_floating_point():
+            acc.floor_()
+        avg[k] = acc.to(v.dtype)
     return avg
 
 
 def ensemble(args):
-    last = [os.path.join(args.exp_dir, args.exp_name, f"epoch={n}.ckpt") for n in range(args.epochs - 10, args.epochs)]
-    model_path = os.path.join(args.exp_dir, args.exp_name, "model_avg_10.pth")
+    checkpoint_dir = os.path.join(args.exp_dir, args.exp_name)
+    # train.py keeps the ten checkpoints with the highest monitoring_step, i.e. the latest ones.
+    last = find_checkpoints(checkpoint_dir, num_checkpoints=10, metric="monitoring_step", mode="max")
+    model_path = os.path.join(checkpoint_dir, "model_avg_10.pth")
     torch.save({"state_dict": average_checkpoints(last)}, model_path)
+
+
+def parse_args():
+    parser = ArgumentParser(description=__doc__, formatter_class=RawTextHelpFormatter)
+    parser.add_argument(
+        "--checkpoint-dir",
+        type=str,
+        help="Directory of the checkpoints.",
+        required=True,
+    )
+    parser.add_argument(
+        "--output-path",
+        type=str,
+        help="Path of the averaged model.",
+        required=True,
+    )
+    parser.add_argument(
+        "--pattern",
+        default="epoch=*.ckpt",
+        type=str,
+        help="Glob pattern of the checkpoint file names. (Default: 'epoch=*.ckpt')",
+    )
+    parser.add_argument(
+        "--num-checkpoints",
+        default=10,
+        type=int,
+        help="Number of checkpoints to average. (Default: 10)",
+    )
+    parser.add_argument(
+        "--metric",
+        type=str,
+        help="Select the checkpoints by the score of the ModelCheckpoint monitoring this metric. "
+        "(Default: the latest checkpoints)",
+    )
+    parser.add_argument(
+        "--mode",
+        default="max",
+        choices=["max", "min"],
+        help="Whether a higher or lower score of --metric is better. (Default: 'max')",
+    )
+    parser.add_argument(
+        "--ema-decay",
+        type=float,
+        help="Weight the i-th newest checkpoint by decay ** i. (Default: uniform weights)",
+    )
+    return parser.parse_args()
+
+
+def cli_main():
+    logging.basicConfig(format="%(asctime)s %(message)s", level=logging.INFO, datefmt="%Y-%m-%d %H:%M:%S")
+    args = parse_args()
+    last = find_checkpoints(args.checkpoint_dir, args.pattern, args.num_checkpoints, args.metric, args.mode)
+    weights = None if args.ema_decay is None else ema_weights(len(last), args.ema_decay)
+    for i, path in enumerate(last):
+        logger.info(f"{path}: weight {1.0 / len(last) if weights is None else weights[i]:.4f}")
+    torch.save({"state_dict": average_checkpoints(last, weights)}, args.output_path)
+
+
+if __name__ == "__main__":
+    cli_main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Measures the training input pipeline throughput in samples per second.
+
+The train DataLoader of `LRS3DataModule` is iterated for a few epochs and every batch
+is copied to the GPU, once with the plain setup (no pinned memory, workers forked
+every epoch, synchronous copies) and once with pinned batches, persistent workers and
+`CUDAPrefetcher`. No model is run, so the numbers are an upper bound of the rate at
+which the pipeline can feed a training step.
+
+Example:
+python benchmark_dataloader.py --modality=[modality] --root-dir=[root_dir] --sp-model-path=[sp_model_path]
+"""
+
+import logging
+import time
+from argparse import ArgumentParser, RawTextHelpFormatter
+
+import torch
+from data_module import CUDAPrefetcher, move_to_device
+from transforms import get_data_module
+
+logger = logging.getLogger(__name__)
+
+
+def _num_samples(batch):
+    return batch.targets.size(0)
+
+
+def benchmark(args, tuned):
+    args.no_pin_memory = not tuned
+    args.no_persistent_workers = not tuned
+    data_module = get_data_module(args, str(args.sp_model_path))
+    device = torch.device(args.device)
+
+    # Build the datasets and the bucket plan outside of the timed region.
+    data_module.train_dataloader()
+    num_samples = 0
+    start = time.perf_counter()
+    for epoch in range(args.epochs):
+        dataloader = data_module.train_dataloader()
+        data_module.train_sampler.set_epoch(epoch)
+        if tuned:
+            dataloader = CUDAPrefetcher(dataloader, device)
+        for idx, batch in enumerate(dataloader):
+            if idx == args.num_batches:
+                break
+            if not tuned:
+                batch = move_to_device(batch, device)
+            num_samples += _num_samples(batch)
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+    elapsed = time.perf_counter() - start
+    return num_samples / elapsed
+
+
+def parse_args():
+    parser = ArgumentParser(description=__doc__, formatter_class=RawTextHelpFormatter)
+    parser.add_argument(
+        "--modality",
+        type=str,
+        help="Modality",
+        choices=["audio", "video", "audiovisual"],
+        required=True,
+    )
+    parser.add_argument(
+        "--root-dir",
+        type=str,
+        help="Root directory to LRS3 audio-visual datasets.",
+        required=True,
+    )
+    parser.add_argument(
+        "--packed-dir",
+        type=str,
+        help="Directory of the shards written by pack_lrs3.py.",
+    )
+    parser.add_argument(
+        "--sp-model-path",
+        type=str,
+        help="Path to SentencePiece model.",
+        required=True,
+    )
+    parser.add_argument(
+        "--num-workers",
+        default=10,
+        type=int,
+        help="Number of DataLoader workers. (Default: 10)",
+    )
+    parser.add_argument(
+        "--prefetch-factor",
+        default=2,
+        type=int,
+        help="Number of batches loaded in advance by each worker. (Default: 2)",
+    )
+    parser.add_argument(
+        "--epochs",
+        default=3,
+        type=int,
+        help="Number of epochs to iterate over. (Default: 3)",
+    )
+    parser.add_argument(
+        "--num-batches",
+        default=200,
+        type=int,
+        help="Number of batches per epoch. (Default: 200)",
+    )
+    parser.add_argument(
+        "--device",
+        default="cuda" if torch.cuda.is_available() else "cpu",
+        type=str,
+        help="Device the batches are copied to. (Default: 'cuda' if available)",
+    )
+    return parser.parse_args()
+
+
+def cli_main():
+    logging.basicConfig(format="%(asctime)s %(message)s", level=logging.INFO, datefmt="%Y-%m-%d %H:%M:%S")
+    args = parse_args()
+    baseline = benchmark(args, tuned=False)
+    logger.info(f"Baseline: {baseline:.1f} samples/sec")
+    tuned = benchmark(args, tuned=True)
+    logger.info(f"Pinned memory, persistent workers and prefetching: {tuned:.1f} samples/sec")
+    logger.info(f"Speed-up: {tuned / baseline:.2f}x")
+
+
+if __name__ == "__main__":
+    cli_main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""Compares the real-time factor and the WER of the RNN-T decoders of the AVSR models.
+
+The first `--num-batches` test batches of `--batch-size` utterances are loaded once and
+decoded by every search of `--decoders`, as `eval.py --decoder` would run it. The
+real-time factor is the decoding time, front-end included, divided by the duration of
+the decoded clips at 25 frames per second.
+
+Example:
+python benchmark_decoders.py --modality=[modality] --mode=[mode] --root-dir=[root_dir] \\
+                             --sp-model-path=[sp_model_path] --checkpoint-path=[checkpoint_path]
+"""
+
+import logging
+import time
+from argparse import ArgumentParser, Namespace, RawTextHelpFormatter
+
+import sentencepiece as spm
+import torch
+import torchaudio
+from data_module import move_to_device
+from transforms import get_data_module
+
+logger = logging.getLogger(__name__)
+
+_FPS = 25
+
+
+def _get_module(args):
+    module_args = Namespace(
+        modality=args.modality,
+        mode=args.mode,
+        lr=8e-4,
+        epochs=1,
+        pretrained_model_path=None,
+    )
+    sp_model = spm.SentencePieceProcessor(model_file=args.sp_model_path)
+    if args.modality == "audiovisual":
+        from lightning_av import AVConformerRNNTModule
+
+        module = AVConformerRNNTModule(module_args, sp_model)
+    else:
+        from lightning import ConformerRNNTModule
+
+        module = ConformerRNNTModule(module_args, sp_model)
+    ckpt = torch.load(args.checkpoint_path, map_location=lambda storage, loc: storage)["state_dict"]
+    module.load_state_dict(ckpt)
+    return module.eval().to(args.device)
+
+
+def _load_batches(args):
+    data_module = get_data_module(args, str(args.sp_model_path))
+    batches = []
+    for idx, (batch, samples) in enumerate(data_module.test_dataloader(batch_size=args.batch_size)):
+        if idx == args.num_batches:
+            break
+        batches.append((move_to_device(batch, torch.device(args.device)), [sample[-1] for sample in samples]))
+    return batches
+
+
+def _num_frames(batch):
+    lengths = batch.video_lengths if hasattr(batch, "video_lengths") else batch.input_lengths
+    return int(lengths.sum())
+
+
+def benchmark(module, batches, decoder, beam_width):
+    device = torch.device(module.device)
+    num_frames = 0
+    total_edit_distance = 0
+    total_length = 0
+    elapsed = 0.0
+    with torch.no_grad():
+        for batch, transcripts in batches:
+            if device.type == "cuda":
+                torch.cuda.synchronize(device)
+            start = time.perf_counter()
+            predictions = module.decode(batch, beam_width, decoder)
+            if device.type == "cuda":
+                torch.cuda.synchronize(device)
+            elapsed += time.perf_counter() - start
+            num_frames += _num_frames(batch)
+            for actual, predicted in zip(transcripts, predictions):
+                total_edit_distance += torchaudio.functional.edit_distance(
+                    actual.lower().split(), predicted.lower().split()
+                )
+                total_length += len(actual.split())
+    return elapsed / (num_frames / _FPS), total_edit_distance / total_length
+
+
+def parse_args():
+    parser = ArgumentParser(description=__doc__, formatter_class=RawTextHelpFormatter)
+    parser.add_argument(
+        "--modality",
+        type=str,
+        help="Modality",
+        choices=["audio", "video", "audiovisual"],
+        required=True,
+    )
+    parser.add_argument(
+        "--mode",
+        type=str,
+        help="Perform online or offline recognition.",
+        choices=["online", "offline"],
+        required=True,
+    )
+    parser.add_argument(
+        "--root-dir",
+        type=str,
+        help="Root directory to LRS3 audio-visual datasets.",
+        required=True,
+    )
+    parser.add_argument(
+        "--sp-model-path",
+        type=str,
+        help="Path to SentencePiece model.",
+        required=True,
+    )
+    parser.add_argument(
+        "--checkpoint-path",
+        type=str,
+        help="Path to a checkpoint model.",
+        required=True,
+    )
+    parser.add_argument(
+        "--decoders",
+        default=["beam", "modified_beam", "greedy"],
+        nargs="+",
+        choices=["beam", "modified_beam", "greedy"],
+        help="Searches to compare. (Default: beam modified_beam greedy)",
+    )
+    parser.add_argument(
+        "--beam-width",
+        default=20,
+        type=int,
+        help="Beam width of the beam searches. (Default: 20)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        default=16,
+        type=int,
+        help="Number of utterances decoded together. (Default: 16)",
+    )
+    parser.add_argument(
+        "--num-batches",
+        default=20,
+        type=int,
+        help="Number of test batches to decode. (Default: 20)",
+    )
+    parser.add_argument(
+        "--device",
+        default="cuda" if torch.cuda.is_available() else "cpu",
+        type=str,
+        help="Device the model runs on. (Default: 'cuda' if available)",
+    )
+    return parser.parse_args()
+
+
+def cli_main():
+    logging.basicConfig(format="%(asctime)s %(message)s", level=logging.INFO, datefmt="%Y-%m-%d %H:%M:%S")
+    args = parse_args()
+    module = _get_module(args)
+    batches = _load_batches(args)
+    # Warm up the kernels, so that the first decoder is not charged for their compilation.
+    benchmark(module, batches[:1], "greedy", args.beam_width)
+    for decoder in args.decoders:
+        rtf, wer = benchmark(module, batches, decoder, args.beam_width)
+        logger.info(f"{decoder}: RTF {rtf:.4f}, WER {wer:.4f}")
+
+
+if __name__ == "__main__":
+    cli_main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""Measures the training step time and the peak GPU memory of the AVSR models per precision mode.
+
+A synthetic batch of `--batch-size` clips of `--num-frames` frames and `--num-tokens`
+target tokens is passed through the forward pass, the RNN-T loss, the backward pass
+and the optimizer step of the Lightning module, as `train.py` would run them with the
+corresponding `--precision` and `--channels-last` settings.
+
+Example:
+python benchmark_precision.py --modality=[modality] --mode=[mode] --sp-model-path=[sp_model_path]
+"""
+
+import logging
+import time
+import warnings
+from argparse import ArgumentParser, Namespace, RawTextHelpFormatter
+
+import sentencepiece as spm
+import torch
+
+logger = logging.getLogger(__name__)
+
+_DTYPES = {"32-true": None, "16-mixed": torch.float16, "bf16-mixed": torch.bfloat16}
+
+
+def _get_module(args, channels_last):
+    module_args = Namespace(
+        modality=args.modality,
+        mode=args.mode,
+        lr=8e-4,
+        epochs=1,
+        pretrained_model_path=None,
+        channels_last=channels_last,
+    )
+    sp_model = spm.SentencePieceProcessor(model_file=args.sp_model_path)
+    if args.modality == "audiovisual":
+        from lightning_av import AVConformerRNNTModule
+
+        return AVConformerRNNTModule(module_args, sp_model)
+    from lightning import ConformerRNNTModule
+
+    return ConformerRNNTModule(module_args, sp_model)
+
+
+def _get_batch(args, device):
+    B, T, U = args.batch_size, args.num_frames, args.num_tokens
+    videos = torch.randn(B, T, 1, 88, 88, device=device)
+    audios = torch.randn(B, T * 640, 1, device=device)
+    lengths = torch.full((B,), T, dtype=torch.int32, device=device)
+    targets = torch.randint(0, 1023, (B, U), dtype=torch.int32, device=device)
+    target_lengths = torch.full((B,), U, dtype=torch.int32, device=device)
+    if args.modality == "audiovisual":
+        from lightning_av import AVBatch
+
+        return AVBatch(audios, videos, lengths, lengths, targets, target_lengths)
+    from lightning import Batch
+
+    inputs = videos if args.modality == "video" else audios
+    return Batch(inputs, lengths, targets, target_lengths)
+
+
+def benchmark(args, precision, channels_last):
+    device = torch.device("cuda")
+    module = _get_module(args, channels_last).to(device)
+    module.train()
+    optimizer = module.optimizer
+    dtype = _DTYPES[precision]
+    scaler = torch.cuda.amp.GradScaler(enabled=dtype == torch.float16)
+    batch = _get_batch(args, device)
+
+    torch.cuda.reset_peak_memory_stats(device)
+    elapsed = []
+    for step in range(args.warmup_steps + args.num_steps):
+        torch.cuda.synchronize(device)
+        start = time.perf_counter()
+        with torch.autocast(device_type="cuda", dtype=dtype, enabled=dtype is not None):
+            loss = module._step(batch, step, "train")
+        optimizer.zero_grad(set_to_none=True)
+        scaler.scale(loss).backward()
+        scaler.step(optimizer)
+        scaler.update()
+        torch.cuda.synchronize(device)
+        if step >= args.warmup_steps:
+            elapsed.append(time.perf_counter() - start)
+    peak_memory = torch.cuda.max_memory_allocated(device)
+    del module, optimizer, batch
+    torch.cuda.empty_cache()
+    return sum(elapsed) / len(elapsed), peak_memory
+
+
+def parse_args():
+    parser = ArgumentParser(description=__doc__, formatter_class=RawTextHelpFormatter)
+    parser.add_argument(
+        "--modality",
+        type=str,
+        help="Modality",
+        choices=["audio", "video", "audiovisual"],
+        required=True,
+    )
+    parser.add_argument(
+        "--mode",
+        type=str,
+        help="Perform online or offline recognition.",
+        choices=["online", "offline"],
+        required=True,
+    )
+    parser.add_argument(
+        "--sp-model-path",
+        type=str,
+        help="Path to SentencePiece model.",
+        required=True,
+    )
+    parser.add_argument(
+        "--batch-size",
+        default=8,
+        type=int,
+        help="Number of clips per batch. (Default: 8)",
+    )
+    parser.add_argument(
+        "--num-frames",
+        default=100,
+        type=int,
+        help="Number of video frames per clip. (Default: 100)",
+    )
+    parser.add_argument(
+        "--num-tokens",
+        default=30,
+        type=int,
+        help="Number of target tokens per clip. (Default: 30)",
+    )
+    parser.add_argument(
+        "--warmup-steps",
+        default=3,
+        type=int,
+        help="Number of untimed steps. (Default: 3)",
+    )
+    parser.add_argument(
+        "--num-steps",
+        default=10,
+        type=int,
+        help="Number of timed steps. (Default: 10)",
+    )
+    return parser.parse_args()
+
+
+def cli_main():
+    logging.basicConfig(format="%(asctime)s %(message)s", level=logging.INFO, datefmt="%Y-%m-%d %H:%M:%S")
+    args = parse_args()
+    # ``self.log`` warns when the module is not attached to a Trainer.
+    warnings.filterwarnings("ignore", message=".*self.log.*")
+    for precision in _DTYPES:
+        if precision == "bf16-mixed" and not torch.cuda.is_bf16_supported():
+            logger.info(f"{precision}: not supported on this GPU")
+            continue
+        for channels_last in [False, True]:
+            if channels_last and args.modality == "audio":
+                continue
+            step_time, peak_memory = benchmark(args, precision, channels_last)
+            logger.info(
+                f"{precision}{' channels-last' if channels_last else ''}: "
+                f"{step_time * 1000:.1f} ms/step, {peak_memory / 1024**3:.2f} GiB peak memory"
+            )
+
+
+if __name__ == "__main__":
+    cli_main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Compares the peak GPU memory and the time of the full and the chunked RNN-T loss.
+
+The encoder outputs of a synthetic batch are passed through the joiner and the RNN-T
+loss of the model returned by `conformer_rnnt()`, once on the whole batch and once per
+`--rnnt-chunk-size` samples with `chunked_rnnt_loss`, followed by the backward pass.
+The memory reported is the peak on top of the encoder outputs.
+
+Example:
+python benchmark_rnnt_loss.py --batch-size 16 --num-frames 400 --num-tokens 80 --rnnt-chunk-size 4
+"""
+
+import logging
+import time
+from argparse import ArgumentParser, RawTextHelpFormatter
+
+import torch
+import torchaudio
+from models.conformer_rnnt import conformer_rnnt
+from rnnt_loss import chunked_rnnt_loss
+
+logger = logging.getLogger(__name__)
+
+
+def _get_inputs(args, model, device):
+    B, T, U = args.batch_size, args.num_frames, args.num_tokens
+    blank_idx = 1023
+    source_encodings = torch.randn(B, T, 1024, device=device, requires_grad=True)
+    source_lengths = torch.randint(T // 2, T + 1, (B,), dtype=torch.int32, device=device)
+    source_lengths[0] = T
+    targets = torch.randint(0, blank_idx, (B, U), dtype=torch.int32, device=device)
+    target_lengths = torch.randint(U // 2, U + 1, (B,), dtype=torch.int32, device=device)
+    target_lengths[0] = U
+    prepended_targets = torch.cat([torch.full((B, 1), blank_idx, dtype=torch.int32, device=device), targets], dim=1)
+    target_encodings, target_encoding_lengths, _ = model.predict(prepended_targets, target_lengths + 1, None)
+    return source_encodings, source_lengths, target_encodings, target_encoding_lengths, targets, target_lengths
+
+
+def _full_loss(model, loss_fn, inputs):
+    source_encodings, source_lengths, target_encodings, target_encoding_lengths, targets, target_lengths = inputs
+    output, source_lengths, _ = model.join(source_encodings, source_lengths, target_encodings, target_encoding_lengths)
+    return loss_fn(output, targets, source_lengths, target_lengths)
+
+
+def benchmark(model, loss_fn, inputs, chunk_size, device):
+    torch.cuda.synchronize(device)
+    torch.cuda.reset_peak_memory_stats(device)
+    base_memory = torch.cuda.memory_allocated(device)
+    start = time.perf_counter()
+    if chunk_size:
+        loss = chunked_rnnt_loss(model.join, loss_fn, *inputs, chunk_size)
+    else:
+        loss = _full_loss(model, loss_fn, inputs)
+    loss.backward(retain_graph=True)
+    torch.cuda.synchronize(device)
+    elapsed = time.perf_counter() - start
+    peak_memory = torch.cuda.max_memory_allocated(device) - base_memory
+    model.zero_grad(set_to_none=True)
+    inputs[0].grad = None
+    return loss.item(), elapsed, peak_memory
+
+
+def parse_args():
+    parser = ArgumentParser(description=__doc__, formatter_class=RawTextHelpFormatter)
+    parser.add_argument("--batch-size", default=16, type=int, help="Number of samples per batch. (Default: 16)")
+    parser.add_argument("--num-frames", default=400, type=int, help="Number of encoder frames. (Default: 400)")
+    parser.add_argument("--num-tokens", default=80, type=int, help="Number of target tokens. (Default: 80)")
+    parser.add_argument("--rnnt-chunk-size", default=4, type=int, help="Number of samples per chunk. (Default: 4)")
+    return parser.parse_args()
+
+
+def cli_main():
+    logging.basicConfig(format="%(asctime)s %(message)s", level=logging.INFO, datefmt="%Y-%m-%d %H:%M:%S")
+    args = parse_args()
+    device = torch.device("cuda")
+    torch.manual_seed(0)
+    model = conformer_rnnt().to(device)
+    loss_fn = torchaudio.transforms.RNNTLoss(reduction="sum")
+    inputs = _get_inputs(args, model, device)
+
+    full_loss, full_time, full_memory = benchmark(model, loss_fn, inputs, None, device)
+    logger.info(f"Full batch: loss {full_loss:.3f}, {full_time * 1000:.1f} ms, {full_memory / 1024**3:.2f} GiB peak")
+    chunked_loss, chunked_time, chunked_memory = benchmark(model, loss_fn, inputs, args.rnnt_chunk_size, device)
+    logger.info(
+        f"Chunks of {args.rnnt_chunk_size}: loss {chunked_loss:.3f}, {chunked_time * 1000:.1f} ms, "
+        f"{chunked_memory / 1024**3:.2f} GiB peak"
+    )
+    logger.info(
+        f"Relative loss difference {abs(chunked_loss - full_loss) / abs(full_loss):.2e}, "
+        f"memory saved {1 - chunked_memory / full_memory:.1%}"
+    )
+
+
+if __name__ == "__main__":
+    cli_main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""Measures the per-chunk latency of `StreamingAVSREngine` for a number of concurrent sessions.
+
+Every session receives a synthetic chunk of `--chunk-frames` video frames and the matching
+audio samples per tick, and the engine decodes all ready segments after every tick. The
+latency of a segment is the time from the push that completed it to the end of the step
+that decoded it. The percentiles are reported per number of sessions, together with the
+real-time factor of the whole run.
+
+Example:
+python benchmark_streaming.py --sp-model-path=[sp_model_path] --checkpoint-path=[checkpoint_path]
+"""
+
+import logging
+import time
+from argparse import ArgumentParser, Namespace, RawTextHelpFormatter
+
+import sentencepiece as spm
+import torch
+from lightning_av import AVConformerRNNTModule
+from streaming import StreamingAVSREngine
+
+logger = logging.getLogger(__name__)
+
+_FPS = 25
+
+
+def _get_module(args):
+    module_args = Namespace(modality="audiovisual", mode="online", lr=8e-4, epochs=1, pretrained_model_path=None)
+    sp_model = spm.SentencePieceProcessor(model_file=args.sp_model_path)
+    module = AVConformerRNNTModule(module_args, sp_model)
+    if args.checkpoint_path:
+        ckpt = torch.load(args.checkpoint_path, map_location=lambda storage, loc: storage)["state_dict"]
+        module.load_state_dict(ckpt)
+    return module.eval().to(args.device)
+
+
+def benchmark(args, module, num_sessions):
+    engine = StreamingAVSREngine(module, beam_width=args.beam_width, max_batch_size=args.max_batch_size)
+    video = torch.randn(args.chunk_frames, 1, 88, 88)
+    audio = torch.randn(args.chunk_frames * 640, 1)
+    for session_id in range(num_sessions):
+        engine.open_session(session_id)
+
+    latencies = []
+    ready_since = {}
+    start = time.perf_counter()
+    for _ in range(args.num_chunks):
+        pushed_at = {}
+        for session_id in range(num_sessions):
+            engine.push(session_id, video, audio)
+            pushed_at[session_id] = time.perf_counter()
+            if engine.is_ready(session_id):
+                ready_since.setdefault(session_id, pushed_at[session_id])
+        decoded = engine.step()
+        if args.device.startswith("cuda"):
+            torch.cuda.synchronize()
+        end = time.perf_counter()
+        for session_id in decoded:
+            latencies.append(end - ready_since.pop(session_id))
+            # With chunks longer than a segment, the next segment was completed by this tick's push already.
+            if engine.is_ready(session_id):
+                ready_since[session_id] = pushed_at[session_id]
+    for session_id in range(num_sessions):
+        engine.close_session(session_id)
+    elapsed = time.perf_counter() - start
+
+    latencies = torch.tensor(latencies)
+    percentiles = torch.quantile(latencies, torch.tensor([0.5, 0.9, 0.99], dtype=latencies.dtype)).tolist()
+    rtf = elapsed / (num_sessions * args.num_chunks * args.chunk_frames / _FPS)
+    return percentiles, rtf
+
+
+def parse_args():
+    parser = ArgumentParser(description=__doc__, formatter_class=RawTextHelpFormatter)
+    parser.add_argument(
+        "--sp-model-path",
+        type=str,
+        help="Path to SentencePiece model.",
+        required=True,
+    )
+    parser.add_argument(
+        "--checkpoint-path",
+        type=str,
+        help="Path to a checkpoint trained with --mode=online. Random weights are used if omitted.",
+    )
+    parser.add_argument(
+        "--num-sessions",
+        default=[1, 8, 32],
+        type=int,
+        nargs="+",
+        help="Numbers of concurrent sessions to measure. (Default: 1 8 32)",
+    )
+    parser.add_argument(
+        "--chunk-frames",
+        default=16,
+        type=int,
+        help="Number of video frames per pushed chunk. (Default: 16)",
+    )
+    parser.add_argument(
+        "--num-chunks",
+        default=40,
+        type=int,
+        help="Number of chunks pushed to every session. (Default: 40)",
+    )
+    parser.add_argument(
+        "--beam-width",
+        default=10,
+        type=int,
+        help="Beam width of the search. (Default: 10)",
+    )
+    parser.add_argument(
+        "--max-batch-size",
+        default=32,
+        type=int,
+        help="Maximum number of sessions decoded together. (Default: 32)",
+    )
+    parser.add_argument(
+        "--device",
+        default="cuda" if torch.cuda.is_available() else "cpu",
+        type=str,
+        help="Device the model runs on. (Default: 'cuda' if available)",
+    )
+    return parser.parse_args()
+
+
+def cli_main():
+    logging.basicConfig(format="%(asctime)s %(message)s", level=logging.INFO, datefmt="%Y-%m-%d %H:%M:%S")
+    args = parse_args()
+    module = _get_module(args)
+    for num_sessions in args.num_sessions:
+        (p50, p90, p99), rtf = benchmark(args, module, num_sessions)
+        logger.info(
+            f"{num_sessions} sessions: latency p50 {p50 * 1000:.1f} ms, p90 {p90 * 1000:.1f} ms, "
+            f"p99 {p99 * 1000:.1f} ms, RTF {rtf:.3f}"
+        )
+
+
+if __name__ == "__main__":
+    cli_main()
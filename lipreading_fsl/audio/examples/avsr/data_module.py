@@ -1,8 +1,11 @@
+import math
 import random
+from typing import Iterator, List, Optional, Union
 
 import torch
+import torch.distributed as dist
 
-from lrs3 import LRS3
+from lrs3 import LRS3, PackedLRS3
 from pytorch_lightning import LightningDataModule
 
 
@@ -25,6 +28,16 @@ def _batch_by_token_count(idx_target_lengths, max_frames, batch_size=None):
     return batches
 
 
+def _get_dataset(args, subset):
+    # Training and validation read pre-tokenized targets; the test set keeps the text for computing the WER.
+    sp_model_path = getattr(args, "sp_model_path", None) if subset != "test" else None
+    if sp_model_path is not None:
+        sp_model_path = str(sp_model_path)
+    if getattr(args, "packed_dir", None):
+        return PackedLRS3(args, subset=subset, sp_model_path=sp_model_path)
+    return LRS3(args, subset=subset, sp_model_path=sp_model_path)
+
+
 class CustomBucketDataset(torch.utils.data.Dataset):
     def __init__(
         self,
@@ -70,6 +83,203 @@ class CustomBucketDataset(torch.utils.data.Dataset):
         return len(self.batches)
 
 
+class DistributedBucketBatchSampler(torch.utils.data.BatchSampler):
+    """Bucketized batch sampler that reshuffles every epoch, balances frames across DDP ranks and can be resumed.
+
+    Samples are grouped into ``num_buckets`` length buckets once. Every epoch the buckets are
+    reshuffled and packed into batches of at most ``max_frames`` frames. The batches are then
+    sorted by their padded number of frames and dealt out in rounds of ``num_replicas``
+    consecutive batches, so that all ranks work on batches of similar cost at every step and
+    the fast ranks do not wait at the all-reduce.
+
+    Args:
+        lengths (List[int]): The number of frames of every sample in the dataset.
+        max_frames (int): The maximal number of frames in one mini-batch.
+        num_buckets (int): The number of buckets to split the data samples.
+        batch_size (int or None, optional): The maximal number of samples in one mini-batch.
+            (Default: ``None``)
+        shuffle (bool, optional): Whether to reshuffle the buckets and the order of the batches every epoch.
+            (Default: ``True``)
+        seed (int, optional): The seed of the shuffling RNG. It must be identical across all ranks. (Default: 0)
+        num_replicas (int or None, optional): Number of processes participating in distributed training.
+            Retrieved from the current distributed group if not provided. (Default: ``None``)
+        rank (int or None, optional): Rank of the current process within ``num_replicas``.
+            Retrieved from the current distributed group if not provided. (Default: ``None``)
+        drop_last (bool, optional): If ``True``, the batches that cannot be evenly split across the ranks
+            are dropped. Otherwise the cheapest batches are repeated. (Default: ``False``)
+
+    Note:
+        Call ``set_epoch`` before creating the DataLoader iterator of every epoch. The position inside
+        the current epoch is exposed by ``state_dict`` and restored by ``load_state_dict``, so a resumed
+        run continues with the first batch it has not seen yet.
+    """
+
+    def __init__(
+        self,
+        lengths: List[int],
+        max_frames: int,
+        num_buckets: int,
+        batch_size: Optional[int] = None,
+        shuffle: bool = True,
+        seed: int = 0,
+        num_replicas: Optional[int] = None,
+        rank: Optional[int] = None,
+        drop_last: bool = False,
+    ) -> None:
+        if num_replicas is None:
+            num_replicas = dist.get_world_size() if dist.is_available() and dist.is_initialized() else 1
+        if rank is None:
+            rank = dist.get_rank() if dist.is_available() and dist.is_initialized() else 0
+
+        lengths = torch.as_tensor(lengths)
+        if max_frames < int(lengths.max()):
+            raise AssertionError("``max_frames`` must be greater than or equal to the maximum value of ``lengths``.")
+
+        self.lengths = lengths
+        self.max_frames = max_frames
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.drop_last = drop_last
+        self.epoch = 0
+        self.consumed = 0
+        self.resume_state = None
+        self._batches = None
+        self._batches_epoch = None
+        self.buckets = self._get_buckets(lengths, num_buckets)
+
+    def _get_buckets(self, lengths: torch.Tensor, num_buckets: int) -> List[torch.Tensor]:
+        """Groups the sample indices by length, longest samples first within a bucket."""
+        boundaries = torch.linspace(int(lengths.min()), int(lengths.max()), num_buckets)
+        bucket_ids = torch.bucketize(lengths, boundaries)
+        order = torch.argsort(lengths, descending=True, stable=True)
+        return [order[bucket_ids[order] == k] for k in torch.unique(bucket_ids).tolist()]
+
+    def _get_batches(self) -> List[List[int]]:
+        """Returns the batches of the current rank for ``self.epoch``."""
+        if self._batches_epoch == self.epoch:
+            return self._batches
+        g = torch.Generator()
+        g.manual_seed(self.seed + self.epoch)
+        idx_lengths = []
+        for bucket in self.buckets:
+            if self.shuffle:
+                bucket = bucket[torch.randperm(bucket.size(0), generator=g)]
+            idx_lengths.extend(zip(bucket.tolist(), self.lengths[bucket].tolist()))
+        batches = _batch_by_token_count(idx_lengths, self.max_frames, batch_size=self.batch_size)
+
+        lengths = self.lengths.tolist()
+        costs = [len(batch) * max(lengths[idx] for idx in batch) for batch in batches]
+        batches = [batches[i] for i in sorted(range(len(batches)), key=lambda i: costs[i], reverse=True)]
+        if self.drop_last:
+            batches = batches[: len(batches) - len(batches) % self.num_replicas]
+        elif len(batches) % self.num_replicas != 0:
+            padding_size = self.num_replicas - len(batches) % self.num_replicas
+            batches += (batches * math.ceil(padding_size / len(batches)))[-padding_size:]
+
+        num_steps = len(batches) // self.num_replicas
+        steps = torch.randperm(num_steps, generator=g).tolist() if self.shuffle else range(num_steps)
+        self._batches = [batches[step * self.num_replicas + self.rank] for step in steps]
+        self._batches_epoch = self.epoch
+        return self._batches
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+
+    def state_dict(self):
+        return {"epoch": self.epoch, "consumed": self.consumed, "seed": self.seed}
+
+    def load_state_dict(self, state_dict) -> None:
+        if state_dict["seed"] != self.seed:
+            raise ValueError(f"Cannot resume a sampler seeded with {state_dict['seed']} using seed {self.seed}.")
+        self.resume_state = state_dict
+
+    def __iter__(self) -> Iterator[List[int]]:
+        batches = self._get_batches()
+        start = 0
+        if self.resume_state is not None and self.resume_state["epoch"] == self.epoch:
+            start = self.resume_state["consumed"]
+        self.resume_state = None
+        self.consumed = start
+        return iter(batches[start:])
+
+    def __len__(self) -> int:
+        return len(self._get_batches())
+
+
+def move_to_device(data, device, non_blocking=False):
+    """Moves the tensors of a (nested) batch to ``device``; other elements are returned as they are."""
+    if isinstance(data, torch.Tensor) or (hasattr(data, "_fields") and hasattr(data, "to")):
+        return data.to(device, non_blocking=non_blocking)
+    if isinstance(data, (list, tuple)):
+        return type(data)(move_to_device(elem, device, non_blocking) for elem in data)
+    return data
+
+
+def _record_stream(data, stream):
+    if isinstance(data, torch.Tensor):
+        data.record_stream(stream)
+    elif isinstance(data, (list, tuple)):
+        for elem in data:
+            _record_stream(elem, stream)
+
+
+class CUDAPrefetcher:
+    """Wraps a DataLoader and copies the next batch to the GPU on a side stream while the current one is used.
+
+    The batches should come from a DataLoader with ``pin_memory=True``, otherwise the copies are synchronous
+    and nothing is overlapped. On a CPU device the batches are moved as usual.
+
+    Args:
+        dataloader (Iterable): yields the batches on the host.
+        device (torch.device or str): device to move the batches to.
+        transfer_fn (callable or None, optional): ``transfer_fn(batch, device)`` moves a batch to the device.
+            Use it to leave host-only parts of a batch, e.g. raw samples, where they are.
+            (Default: every tensor and ``Batch``/``AVBatch`` is moved)
+    """
+
+    def __init__(self, dataloader, device: Union[torch.device, str], transfer_fn=None):
+        self.dataloader = dataloader
+        self.device = torch.device(device)
+        self.transfer_fn = transfer_fn
+
+    def _transfer(self, batch):
+        if self.transfer_fn is not None:
+            return self.transfer_fn(batch, self.device)
+        return move_to_device(batch, self.device, non_blocking=True)
+
+    def __iter__(self):
+        if self.device.type != "cuda":
+            for batch in self.dataloader:
+                yield self._transfer(batch)
+            return
+
+        stream = torch.cuda.Stream(self.device)
+        iterator = iter(self.dataloader)
+
+        def preload():
+            batch = next(iterator, None)
+            if batch is None:
+                return None
+            with torch.cuda.stream(stream):
+                return self._transfer(batch)
+
+        next_batch = preload()
+        while next_batch is not None:
+            current_stream = torch.cuda.current_stream(self.device)
+            current_stream.wait_stream(stream)
+            batch = next_batch
+            # The memory was allocated on the side stream; keep the allocator from reusing it too early.
+            _record_stream(batch, current_stream)
+            next_batch = preload()
+            yield batch
+
+    def __len__(self):
+        return len(self.dataloader)
+
+
 class TransformDataset(torch.utils.data.Dataset):
     def __init__(self, dataset, transform_fn):
         self.dataset = dataset
@@ -95,6 +305,9 @@ class LRS3DataModule(LightningDataModule):
         train_num_buckets=50,
         train_shuffle=True,
         num_workers=10,
+        pin_memory=True,
+        persistent_workers=True,
+        prefetch_factor=2,
     ):
         super().__init__()
         self.args = args
@@ -108,27 +321,116 @@ class LRS3DataModule(LightningDataModule):
         self.train_num_buckets = train_num_buckets
         self.train_shuffle = train_shuffle
         self.num_workers = num_workers
+        self.pin_memory = pin_memory
+        self.persistent_workers = persistent_workers
+        self.prefetch_factor = prefetch_factor
+        # Datasets, the bucket plan of the train sampler and the validation batches are built once and
+        # reused when the dataloaders are re-created every epoch; only the reshuffling is redone.
+        self.datasets = {}
+        self.train_sampler = None
+        self.train_sampler_state = None
+        self.val_dataset = None
+        # With persistent workers the DataLoaders themselves are kept, so that their worker processes
+        # survive ``reload_dataloaders_every_n_epochs`` instead of being forked again every epoch.
+        self._train_dataloader = None
+        self._val_dataloader = None
+        self._feature_cache_attached = False
+
+    def setup(self, stage=None):
+        # Front-end features are cached once the trainer exists, so that under DDP only global rank 0
+        # extracts them and the other ranks load its stores.
+        feature_cache_dir = getattr(self.args, "feature_cache_dir", None)
+        if feature_cache_dir and stage in (None, "fit") and not self._feature_cache_attached:
+            from feature_cache import attach_feature_cache
+
+            attach_feature_cache(self.trainer.lightning_module, self, feature_cache_dir)
+            self._feature_cache_attached = True
+
+    def get_dataset(self, subset):
+        """Returns the dataset of ``subset``, parsing its file list only on the first call."""
+        if subset not in self.datasets:
+            self.datasets[subset] = _get_dataset(self.args, subset)
+        return self.datasets[subset]
+
+    def _dataloader_kwargs(self, persistent_workers=None):
+        kwargs = {"num_workers": self.num_workers, "pin_memory": self.pin_memory and torch.cuda.is_available()}
+        if self.num_workers > 0:
+            kwargs["persistent_workers"] = self.persistent_workers if persistent_workers is None else persistent_workers
+            kwargs["prefetch_factor"] = self.prefetch_factor
+        return kwargs
 
     def train_dataloader(self):
-        dataset = LRS3(self.args, subset="train")
-        dataset = CustomBucketDataset(
-            dataset, dataset.lengths, self.max_frames, self.train_num_buckets, batch_size=self.batch_size
-        )
-        dataset = TransformDataset(dataset, self.train_transform)
+        dataset = self.get_dataset("train")
+        if self.train_sampler is None:
+            self.train_sampler = DistributedBucketBatchSampler(
+                dataset.lengths,
+                self.max_frames,
+                self.train_num_buckets,
+                batch_size=self.batch_size,
+                shuffle=self.train_shuffle,
+            )
+        self.train_sampler.set_epoch(self.trainer.current_epoch if self.trainer is not None else 0)
+        if self.train_sampler_state is not None:
+            self.train_sampler.load_state_dict(self.train_sampler_state)
+            self.train_sampler_state = None
+        if self._train_dataloader is not None:
+            return self._train_dataloader
         dataloader = torch.utils.data.DataLoader(
-            dataset, num_workers=self.num_workers, batch_size=None, shuffle=self.train_shuffle
+            dataset,
+            batch_sampler=self.train_sampler,
+            collate_fn=self.train_transform,
+            **self._dataloader_kwargs(),
         )
+        if self.persistent_workers:
+            self._train_dataloader = dataloader
         return dataloader
 
     def val_dataloader(self):
-        dataset = LRS3(self.args, subset="val")
-        dataset = CustomBucketDataset(dataset, dataset.lengths, self.max_frames, 1, batch_size=self.batch_size)
-        dataset = TransformDataset(dataset, self.val_transform)
-        dataloader = torch.utils.data.DataLoader(dataset, batch_size=None, num_workers=self.num_workers)
+        if self.val_dataset is None:
+            dataset = self.get_dataset("val")
+            dataset = CustomBucketDataset(dataset, dataset.lengths, self.max_frames, 1, batch_size=self.batch_size)
+            self.val_dataset = TransformDataset(dataset, self.val_transform)
+        if self._val_dataloader is not None:
+            return self._val_dataloader
+        sampler = None
+        if dist.is_available() and dist.is_initialized():
+            sampler = torch.utils.data.DistributedSampler(self.val_dataset, shuffle=False)
+        dataloader = torch.utils.data.DataLoader(
+            self.val_dataset, batch_size=None, sampler=sampler, **self._dataloader_kwargs()
+        )
+        if self.persistent_workers:
+            self._val_dataloader = dataloader
         return dataloader
 
-    def test_dataloader(self):
-        dataset = LRS3(self.args, subset="test")
-        dataset = TransformDataset(dataset, self.test_transform)
-        dataloader = torch.utils.data.DataLoader(dataset, batch_size=None)
-        return dataloader
+    def test_dataloader(self, batch_size=None):
+        """Yields ``(batch, samples)`` pairs of single samples, or of up to ``batch_size`` samples of similar length."""
+        dataset = self.get_dataset("test")
+        if batch_size is None:
+            dataset = TransformDataset(dataset, self.test_transform)
+            return torch.utils.data.DataLoader(
+                dataset, batch_size=None, **self._dataloader_kwargs(persistent_workers=False)
+            )
+        # Sorting by length keeps the padding of a batch, and thus the decoding work wasted on it, small.
+        order = torch.argsort(torch.as_tensor(dataset.lengths), descending=True).tolist()
+        batches = [order[i : i + batch_size] for i in range(0, len(order), batch_size)]
+        return torch.utils.data.DataLoader(
+            dataset,
+            batch_sampler=batches,
+            collate_fn=self.test_transform.collate,
+            **self._dataloader_kwargs(persistent_workers=False),
+        )
+
+    def on_before_batch_transfer(self, batch, dataloader_idx):
+        if self.trainer is not None and self.trainer.training and self.train_sampler is not None:
+            self.train_sampler.consumed += 1
+        return batch
+
+    def state_dict(self):
+        if self.train_sampler is None:
+            return {}
+        return {"train_sampler": self.train_sampler.state_dict()}
+
+    def load_state_dict(self, state_dict):
+        self.train_sampler_state = state_dict.get("train_sampler")
+        if self.train_sampler is not None and self.train_sampler_state is not None:
+            self.train_sampler.load_state_dict(self.train_sampler_state)
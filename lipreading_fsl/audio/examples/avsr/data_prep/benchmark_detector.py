@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Compares strided face detection with per-frame detection on a sample clip.
+
+The clip is detected once per stride of `--strides`; stride 1 runs the detector on every frame and is the
+reference. For every stride, the frames per second of the detection, the share of frames passed to the
+detector and the drift of the interpolated face boxes from the reference are reported. The drift is the
+distance between the box centers, in pixels, after both were interpolated by `VideoProcess`.
+
+Example:
+python benchmark_detector.py --video-path=[video_path] --detector=retinaface --strides 1 5 10
+"""
+
+import argparse
+import time
+
+import numpy as np
+import torchvision
+
+
+def _get_detector(detector):
+    if detector == "retinaface":
+        from detectors.retinaface.detector import LandmarksDetector
+        from detectors.retinaface.video_process import VideoProcess
+
+        return LandmarksDetector(device="cuda:0"), VideoProcess()
+    from detectors.mediapipe.detector import LandmarksDetector
+    from detectors.mediapipe.video_process import VideoProcess
+
+    return LandmarksDetector(), VideoProcess()
+
+
+def _centers(video_process, landmarks):
+    landmarks = video_process.interpolate_landmarks(list(landmarks))
+    if landmarks is None:
+        return None
+    return np.array([np.mean(lm, axis=0) for lm in landmarks])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--video-path", type=str, required=True, help="Path to the sample clip.")
+    parser.add_argument(
+        "--detector",
+        type=str,
+        default="retinaface",
+        choices=["retinaface", "mediapipe"],
+        help="Face detector. (Default: retinaface)",
+    )
+    parser.add_argument(
+        "--strides", type=int, nargs="+", default=[1, 5, 10], help="Strides to compare. (Default: 1 5 10)"
+    )
+    args = parser.parse_args()
+
+    video = torchvision.io.read_video(args.video_path, pts_unit="sec")[0].numpy()
+    landmarks_detector, video_process = _get_detector(args.detector)
+    detect_frame = landmarks_detector.detect_frame
+    num_calls = [0]
+
+    def counting_detect_frame(*frame_args):
+        num_calls[0] += 1
+        return detect_frame(*frame_args)
+
+    landmarks_detector.detect_frame = counting_detect_frame
+
+    reference = None
+    for stride in sorted(set(args.strides) | {1}):
+        landmarks_detector.stride = stride
+        num_calls[0] = 0
+        start = time.perf_counter()
+        landmarks = landmarks_detector(video)
+        elapsed = time.perf_counter() - start
+        centers = _centers(video_process, landmarks)
+        if stride == 1:
+            reference = centers
+        if centers is None or reference is None:
+            drift = "no face detected"
+        else:
+            distances = np.linalg.norm(centers - reference, axis=1)
+            drift = f"drift mean {distances.mean():.2f} px, max {distances.max():.2f} px"
+        print(
+            f"stride {stride}: {len(video) / elapsed:.1f} frames/s, "
+            f"{num_calls[0] / len(video):.1%} of the frames detected, {drift}"
+        )
+
+
+if __name__ == "__main__":
+    main()
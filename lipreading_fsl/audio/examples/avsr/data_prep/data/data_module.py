@@ -12,20 +12,20 @@ import cv2
 
 
 class AVSRDataLoader:
-    def __init__(self, modality, detector="retinaface", resize=None):
+    def __init__(self, modality, detector="retinaface", resize=None, detector_stride=1):
         self.modality = modality
         if modality == "video":
             if detector == "retinaface":
                 from detectors.retinaface.detector import LandmarksDetector
                 from detectors.retinaface.video_process import VideoProcess
 
-                self.landmarks_detector = LandmarksDetector(device="cuda:0")
+                self.landmarks_detector = LandmarksDetector(device="cuda:0", stride=detector_stride)
                 self.video_process = VideoProcess(resize=resize)
             if detector == "mediapipe":
                 from detectors.mediapipe.detector import LandmarksDetector
                 from detectors.mediapipe.video_process import VideoProcess
 
-                self.landmarks_detector = LandmarksDetector()
+                self.landmarks_detector = LandmarksDetector(stride=detector_stride)
                 self.video_process = VideoProcess(resize=resize)
 
     def load_data(self, data_filename, transform=True):
@@ -11,17 +11,22 @@ import mediapipe as mp
 import numpy as np
 
 import cv2
+from detectors.strided import detect_strided
 
 warnings.filterwarnings("ignore")
 
 
 class LandmarksDetector:
-    def __init__(self):
+    def __init__(self, stride=1, min_confidence=0.7, max_shift=0.1):
         self.mp_face_detection = mp.solutions.face_detection
         self.short_range_detector = self.mp_face_detection.FaceDetection(
             min_detection_confidence=0.5, model_selection=0
         )
         self.full_range_detector = self.mp_face_detection.FaceDetection(min_detection_confidence=0.5, model_selection=1)
+        # With stride > 1, only every stride-th frame is detected, see detect_strided.
+        self.stride = stride
+        self.min_confidence = min_confidence
+        self.max_shift = max_shift
 
     def __call__(self, video_frames):
         landmarks = self.detect(video_frames, self.full_range_detector)
@@ -32,41 +37,34 @@ class LandmarksDetector:
         return landmarks
 
     def detect(self, video_frames, detector):
-        landmarks = []
-        for frame in video_frames:
-            results = detector.process(frame)
-            if not results.detections:
-                landmarks.append(None)
-                continue
-            face_points = []
-            for idx, detected_faces in enumerate(results.detections):
-                max_id, max_size = 0, 0
-                bboxC = detected_faces.location_data.relative_bounding_box
-                ih, iw, ic = frame.shape
-                #import cv2
-                x_min = int(bboxC.xmin * 256)
-                y_min = int(bboxC.ymin * 256)
-                x_max = int(x_min + bboxC.width * 256)
-                y_max = int(y_min + bboxC.height * 256)
-                # frame = cv2.rectangle(frame, (int(x_min), int(y_min)), (int(x_max), int(y_max)), (255, 255, 255),
-                #                       thickness=5)
-                #cv2.imshow('Test', frame)
-                #cv2.waitKey(10)
-                #import matplotlib.pyplot as plt
-                #plt.imshow(frame)
-                #plt.show()
+        return detect_strided(
+            video_frames,
+            lambda frame: self.detect_frame(frame, detector),
+            self.stride,
+            self.min_confidence,
+            self.max_shift,
+        )
 
-                # print(ih, iw, x_min, y_min, bboxC.width, bboxC.height)
-                # bbox = int(bboxC.xmin * iw), int(bboxC.ymin * ih), int(bboxC.width * iw), int(bboxC.height * ih)
-                # bbox = int(bboxC.xmin * iw), int(bboxC.ymin * ih), int(bboxC.xmin + bboxC.width * iw), int(bboxC.ymin + bboxC.height * ih)
-                bbox = x_min, y_min, x_max, y_max
-                bbox_size = (bbox[2] - bbox[0]) + (bbox[3] - bbox[1])
-                if bbox_size > max_size:  # todo?
-                    max_id, max_size = idx, bbox_size
-                # lmx = [[int(bboxC.xmin * iw), int(bboxC.ymin * ih)], [int(bboxC.xmin + bboxC.width * iw), int(bboxC.ymin + bboxC.height * ih)]]
-                # lmx = [[int(bboxC.xmin * iw), int(bboxC.ymin * ih)], [int(bboxC.width * iw), int(bboxC.height * ih)]]
-                lmx = [[int(x_min), int(y_min)], [int(x_max), int(y_max)]]
+    def detect_frame(self, frame, detector):
+        results = detector.process(frame)
+        if not results.detections:
+            return None, 0.0
+        face_points = []
+        scores = []
+        max_id, max_size = 0, 0
+        for idx, detected_faces in enumerate(results.detections):
+            bboxC = detected_faces.location_data.relative_bounding_box
+            ih, iw, ic = frame.shape
+            x_min = int(bboxC.xmin * 256)
+            y_min = int(bboxC.ymin * 256)
+            x_max = int(x_min + bboxC.width * 256)
+            y_max = int(y_min + bboxC.height * 256)
+            bbox = x_min, y_min, x_max, y_max
+            bbox_size = (bbox[2] - bbox[0]) + (bbox[3] - bbox[1])
+            if bbox_size > max_size:
+                max_id, max_size = idx, bbox_size
+            lmx = [[int(x_min), int(y_min)], [int(x_max), int(y_max)]]
 
-                face_points.append(lmx)
-            landmarks.append(np.reshape(np.array(face_points[max_id]), (2, 2)))
-        return landmarks
\ No newline at end of file
+            face_points.append(lmx)
+            scores.append(float(detected_faces.score[0]))
+        return np.reshape(np.array(face_points[max_id]), (2, 2)), scores[max_id]
@@ -25,21 +25,31 @@ def apply_transform(transform, img, std_size):
     return warped
 
 
-def cut_patch(img, landmarks, height, width, threshold=5):
-    center_x, center_y = np.mean(landmarks, axis=0)
-    # Check for too much bias in height and width
-    if abs(center_y - img.shape[0] / 2) > height + threshold:
-        raise Exception("too much bias in height")
-    if abs(center_x - img.shape[1] / 2) > width + threshold:
-        raise Exception("too much bias in width")
-    # Calculate bounding box coordinates
-    y_min = int(round(np.clip(center_y - height, 0, img.shape[0])))
-    y_max = int(round(np.clip(center_y + height, 0, img.shape[0])))
-    x_min = int(round(np.clip(center_x - width, 0, img.shape[1])))
-    x_max = int(round(np.clip(center_x + width, 0, img.shape[1])))
-    # Cut the image
-    cutted_img = np.copy(img[y_min:y_max, x_min:x_max])
-    return cutted_img
+def estimate_similarity_transforms(src, dst):
+    """Returns the (T, 2, 3) similarity transforms that map the points ``src[t]`` onto ``dst`` by least squares.
+
+    Closed form of ``cv2.estimateAffinePartial2D``, computed for all frames at once with the points as complex
+    numbers. Two point pairs, as with the default stable points, are fitted exactly.
+
+    :param src: np.ndarray, (T, N, 2) points of every frame.
+    :param dst: np.ndarray, (N, 2) reference points.
+    rtype: np.ndarray, (T, 2, 3).
+    """
+    src = src[..., 0] + 1j * src[..., 1]
+    dst = dst[:, 0] + 1j * dst[:, 1]
+    src_mean = src.mean(axis=1, keepdims=True)
+    dst_mean = dst.mean()
+    src_centered = src - src_mean
+    scale_rotation = (np.conj(src_centered) * (dst - dst_mean)).sum(axis=1)
+    scale_rotation /= (np.abs(src_centered) ** 2).sum(axis=1)
+    translation = dst_mean - scale_rotation * src_mean[:, 0]
+    return np.stack(
+        [
+            np.stack([scale_rotation.real, -scale_rotation.imag, translation.real], axis=-1),
+            np.stack([scale_rotation.imag, scale_rotation.real, translation.imag], axis=-1),
+        ],
+        axis=1,
+    )
 
 
 class VideoProcess:
@@ -72,22 +82,61 @@ class VideoProcess:
         assert sequence is not None, "crop an empty patch."
         return sequence
 
-    def crop_patch(self, video, landmarks):
-        sequence = []
+    def crop_patch(self, video, landmarks, target_size=(224, 224), threshold=5):
+        """Aligns every frame to the reference, cuts the patch around the landmarks and resizes it.
+
+        The alignment, the crop and the resize of each frame are folded into one affine map from the output
+        pixels to the frame, so every frame is sampled once, directly at the output size, into a preallocated
+        array. This matches warping the frame to the reference with ``cv2.warpAffine``, cutting the patch and
+        resizing it with ``cv2.resize``, up to the rounding of interpolating once instead of twice.
+        """
+        landmarks = np.asarray(landmarks, dtype=np.float64)
+        stable_reference = self.get_stable_reference(self.reference, (0, 1), target_size, target_size)
+        transforms = estimate_similarity_transforms(landmarks[:, [0, 1]], stable_reference)
+        transformed_landmarks = np.einsum("tij,tnj->tni", transforms[:, :, :2], landmarks) + transforms[:, None, :, 2]
+        center_x, center_y = transformed_landmarks[:, self.start_idx : self.stop_idx].mean(axis=1).T
+        height, width = self.crop_height // 2, self.crop_width // 2
+        # Check for too much bias in height and width
+        if np.any(np.abs(center_y - target_size[1] / 2) > height + threshold):
+            raise Exception("too much bias in height")
+        if np.any(np.abs(center_x - target_size[0] / 2) > width + threshold):
+            raise Exception("too much bias in width")
+        # Patch boundaries in the aligned frame
+        y_min = np.round(np.clip(center_y - height, 0, target_size[1]))
+        y_max = np.round(np.clip(center_y + height, 0, target_size[1]))
+        x_min = np.round(np.clip(center_x - width, 0, target_size[0]))
+        x_max = np.round(np.clip(center_x + width, 0, target_size[0]))
+
+        output_width, output_height = self.resize if self.resize else (self.crop_width, self.crop_height)
+        scale_x = (x_max - x_min) / output_width
+        scale_y = (y_max - y_min) / output_height
+        # Output pixel (j, i) samples the aligned frame at the pixel-center aligned position of cv2.resize
+        output_to_aligned = np.zeros((len(landmarks), 2, 3))
+        output_to_aligned[:, 0, 0] = scale_x
+        output_to_aligned[:, 1, 1] = scale_y
+        output_to_aligned[:, 0, 2] = x_min + scale_x / 2 - 0.5
+        output_to_aligned[:, 1, 2] = y_min + scale_y / 2 - 0.5
+        aligned_to_frame = np.linalg.inv(transforms[:, :, :2])
+        output_to_frame = np.concatenate(
+            [
+                aligned_to_frame @ output_to_aligned[:, :, :2],
+                aligned_to_frame @ (output_to_aligned[:, :, 2:] - transforms[:, :, 2:]),
+            ],
+            axis=2,
+        )
+
+        sequence = np.empty((len(video), output_height, output_width) + video[0].shape[2:], dtype=video[0].dtype)
         for frame_idx, frame in enumerate(video):
-            transformed_frame, transformed_landmarks = self.affine_transform(
-                frame, landmarks[frame_idx], self.reference
+            cv2.warpAffine(
+                frame,
+                output_to_frame[frame_idx],
+                dsize=(output_width, output_height),
+                dst=sequence[frame_idx],
+                flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+                borderMode=cv2.BORDER_CONSTANT,
+                borderValue=0,
             )
-            patch = cut_patch(
-                transformed_frame,
-                transformed_landmarks[self.start_idx : self.stop_idx],
-                self.crop_height // 2,
-                self.crop_width // 2,
-            )
-            if self.resize:
-                patch = cv2.resize(patch, self.resize)
-            sequence.append(patch)
-        return np.array(sequence)
+        return sequence
 
     def interpolate_landmarks(self, landmarks):
         valid_frames_idx = [idx for idx, lm in enumerate(landmarks) if lm is not None]
@@ -112,47 +161,8 @@ class VideoProcess:
 
         return landmarks
 
-    def affine_transform(
-        self,
-        frame,
-        landmarks,
-        reference,
-        target_size=(224, 224),
-        reference_size=(224, 224),
-        stable_points=(0, 1),
-        interpolation=cv2.INTER_LINEAR,
-        border_mode=cv2.BORDER_CONSTANT,
-        border_value=0,
-    ):
-        stable_reference = self.get_stable_reference(reference, stable_points, reference_size, target_size)
-        transform = self.estimate_affine_transform(landmarks, stable_points, stable_reference)
-        transformed_frame, transformed_landmarks = self.apply_affine_transform(
-            frame, landmarks, transform, target_size, interpolation, border_mode, border_value
-        )
-
-        return transformed_frame, transformed_landmarks
-
     def get_stable_reference(self, reference, stable_points, reference_size, target_size):
         stable_reference = np.vstack([reference[x] for x in stable_points])
         stable_reference[:, 0] -= (reference_size[0] - target_size[0]) / 2.0
         stable_reference[:, 1] -= (reference_size[1] - target_size[1]) / 2.0
         return stable_reference
-
-    def estimate_affine_transform(self, landmarks, stable_points, stable_reference):
-        return cv2.estimateAffinePartial2D(
-            np.vstack([landmarks[x] for x in stable_points]), stable_reference, method=cv2.LMEDS
-        )[0]
-
-    def apply_affine_transform(
-        self, frame, landmarks, transform, target_size, interpolation, border_mode, border_value
-    ):
-        transformed_frame = cv2.warpAffine(
-            frame,
-            transform,
-            dsize=(target_size[0], target_size[1]),
-            flags=interpolation,
-            borderMode=border_mode,
-            borderValue=border_value,
-        )
-        transformed_landmarks = np.matmul(landmarks, transform[:, :2].transpose()) + transform[:, 2].transpose()
-        return transformed_frame, transformed_landmarks
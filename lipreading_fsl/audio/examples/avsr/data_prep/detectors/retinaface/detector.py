@@ -7,23 +7,27 @@
 import warnings
 
 import numpy as np
+from detectors.strided import detect_strided
 from ibug.face_detection import RetinaFacePredictor
 
 warnings.filterwarnings("ignore")
 
 
 class LandmarksDetector:
-    def __init__(self, device="cuda:0", model_name="resnet50"):
+    def __init__(self, device="cuda:0", model_name="resnet50", stride=1, min_confidence=0.9, max_shift=0.1):
         self.face_detector = RetinaFacePredictor(
             device=device, threshold=0.8, model=RetinaFacePredictor.get_model(model_name)
         )
+        # With stride > 1, only every stride-th frame is detected, see detect_strided.
+        self.stride = stride
+        self.min_confidence = min_confidence
+        self.max_shift = max_shift
 
     def __call__(self, video_frames):
-        landmarks = []
-        for frame in video_frames:
-            detected_faces = self.face_detector(frame, rgb=False)
-            if len(detected_faces) >= 1:
-                landmarks.append(np.reshape(detected_faces[0][:4], (2, 2)))
-            else:
-                landmarks.append(None)
-        return landmarks
+        return detect_strided(video_frames, self.detect_frame, self.stride, self.min_confidence, self.max_shift)
+
+    def detect_frame(self, frame):
+        detected_faces = self.face_detector(frame, rgb=False)
+        if len(detected_faces) >= 1:
+            return np.reshape(detected_faces[0][:4], (2, 2)), float(detected_faces[0][4])
+        return None, 0.0
@@ -0,0 +1,56 @@
+import numpy as np
+
+
+def _center_and_size(landmarks):
+    (x_min, y_min), (x_max, y_max) = landmarks
+    return np.array([(x_min + x_max) / 2.0, (y_min + y_max) / 2.0]), ((x_max - x_min) + (y_max - y_min)) / 2.0
+
+
+def needs_redetection(start, stop, min_confidence, max_shift):
+    """Whether the frames between two key frames have to be detected rather than interpolated.
+
+    :param start: tuple, ``(landmarks, score)`` of the first key frame, ``landmarks`` being None if no face was found.
+    :param stop: tuple, ``(landmarks, score)`` of the second key frame.
+    :param min_confidence: float, key frames detected with a lower score are not trusted.
+    :param max_shift: float, maximal shift of the face center between the key frames, relative to the face size.
+    rtype: bool
+    """
+    (start_landmarks, start_score), (stop_landmarks, stop_score) = start, stop
+    if start_landmarks is None or stop_landmarks is None:
+        return True
+    if min(start_score, stop_score) < min_confidence:
+        return True
+    start_center, start_size = _center_and_size(start_landmarks)
+    stop_center, stop_size = _center_and_size(stop_landmarks)
+    return np.linalg.norm(stop_center - start_center) > max_shift * max(start_size, stop_size, 1.0)
+
+
+def detect_strided(video_frames, detect_frame, stride, min_confidence=0.0, max_shift=0.1):
+    """Detects the face in every ``stride``-th frame and in the frames between unreliable key frames only.
+
+    The first and the last frame are always key frames. Where two consecutive key frames both found a face
+    with at least ``min_confidence`` and the face moved by at most ``max_shift`` of its size, the frames in
+    between are left as ``None`` and filled by ``VideoProcess.interpolate_landmarks`` with ``linear_interpolate``.
+    Otherwise, the detector is run on all of them. With ``stride=1``, every frame is detected.
+
+    :param video_frames: sequence, frames of the video.
+    :param detect_frame: callable, returns the (2, 2) landmarks of a frame, or None, and their score.
+    :param stride: int, number of frames between key frames.
+    :param min_confidence: float, see ``needs_redetection``.
+    :param max_shift: float, see ``needs_redetection``.
+    rtype: list, landmarks of every frame, None where the face was not detected.
+    """
+    num_frames = len(video_frames)
+    detections = [None] * num_frames
+    keyframes = list(range(0, num_frames, stride))
+    if keyframes and keyframes[-1] != num_frames - 1:
+        keyframes.append(num_frames - 1)
+    for idx in keyframes:
+        detections[idx] = detect_frame(video_frames[idx])
+    for start_idx, stop_idx in zip(keyframes[:-1], keyframes[1:]):
+        if stop_idx - start_idx > 1 and needs_redetection(
+            detections[start_idx], detections[stop_idx], min_confidence, max_shift
+        ):
+            for idx in range(start_idx + 1, stop_idx):
+                detections[idx] = detect_frame(video_frames[idx])
+    return [None if detection is None else detection[0] for detection in detections]
@@ -5,6 +5,7 @@ import string
 import cv2
 import multiprocessing
 import glob
+from segment_extractor import extract_segments
 from textgrid import TextGrid
 
 # Paths (Updated Output Directory)
@@ -21,6 +22,8 @@ os.makedirs(BACKUP_DIR, exist_ok=True)
 # Constants
 NUM_INTERVALS = 8
 NUM_WORKERS = 1
+# Stream copy the segments that start on a keyframe instead of re-encoding them
+STREAM_COPY = False
 
 def clean_word(word):
     """Removes punctuation and converts word to lowercase."""
@@ -155,7 +158,9 @@ def process_video(video_id, video_title):
         print(f"⏩ Skipping {video_id}, already processed.")
         return
 
-    # Process in groups of NUM_INTERVALS
+    # Collect the segments in groups of NUM_INTERVALS
+    segments = []
+    texts = {}
     for i in range(0, len(timestamps), NUM_INTERVALS):
         start_time = timestamps[i][1]
         end_time = timestamps[min(i + NUM_INTERVALS, len(timestamps) - 1)][2]
@@ -169,19 +174,16 @@ def process_video(video_id, video_title):
             print(f"⏩ Skipping segment {output_video_path}, already exists.")
             continue
 
-        print(f"🎬 Extracting segment from {start_time:.2f} sec to {end_time:.2f} sec")
-        print(f"   Text: {text_content}")
-        print(f"   Output Video: {output_video_path}")
-        print(f"   Output Text: {output_text_path}")
-
-        ffmpeg_cmd = [
-            "ffmpeg", "-i", video_path,
-            "-ss", str(start_time), "-to", str(end_time),
-            "-c:v", "libx264", "-preset", "fast", "-c:a", "aac", "-b:a", "128k",
-            output_video_path
-        ]
-        subprocess.run(ffmpeg_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        segments.append((start_time, end_time, output_video_path))
+        texts[output_video_path] = (output_text_path, text_content)
 
+    # All segments are cut in one sequential pass over the video
+    print(f"🎬 Extracting {len(segments)} segments from {video_path}")
+    failed = dict(extract_segments(video_path, segments, copy=STREAM_COPY))
+    for output_video_path, (output_text_path, text_content) in texts.items():
+        if output_video_path in failed:
+            print(f"❌ Extraction failed for {output_video_path}:\n{failed[output_video_path]}")
+            continue
         with open(output_text_path, "w") as txt_file:
             txt_file.write(text_content)
 
@@ -5,6 +5,7 @@ import string
 import cv2
 import multiprocessing
 import glob
+from segment_extractor import extract_segments
 from textgrid import TextGrid
 
 # Paths (Adjust as needed)
@@ -23,6 +24,9 @@ TOTAL_CPUS = 12
 RESERVED_CPUS = 2
 NUM_WORKERS = max(1, TOTAL_CPUS - RESERVED_CPUS)
 
+# Stream copy the words that start on a keyframe instead of re-encoding them
+STREAM_COPY = False
+
 print(f"⚙️ Using {NUM_WORKERS} CPUs for processing, reserving {RESERVED_CPUS} for system operations.")
 
 
@@ -149,37 +153,34 @@ def process_video(video_id, video_title):
         print(f"⚠️ Skipping {video_path} due to missing duration information.")
         return
 
+    output_subdir = os.path.join(OUTPUT_DIR, video_id)
+    os.makedirs(output_subdir, exist_ok=True)
+
+    segments = []
+    texts = {}
     for word, times in timestamps.items():
         for start_time, end_time in times:
-            clip_duration = end_time - start_time
-
             if start_time < 0 or start_time > video_duration:
                 print(f"🚨 Skipping extraction: Start time ({start_time:.2f}s) out of bounds.")
                 continue
 
-            output_subdir = os.path.join(OUTPUT_DIR, video_id)
-            os.makedirs(output_subdir, exist_ok=True)
-
             output_filename = f"{word}_{video_id}_{int(start_time * 1000)}.mp4"
             output_txt = f"{word}_{video_id}_{int(start_time * 1000)}.txt"
             output_video_path = os.path.join(output_subdir, output_filename)
             output_text_path = os.path.join(output_subdir, output_txt)
 
-            print(f"🎬 Extracting '{word}' from {video_path}")
-            print(f"   Start Time: {start_time:.2f} sec, Duration: {clip_duration:.2f} sec")
-            print(f"   Output Video: {output_video_path}")
-            print(f"   Output Text: {output_text_path}")
-
-            ffmpeg_cmd = [
-                "ffmpeg", "-i", video_path,
-                "-ss", str(start_time), "-t", str(clip_duration),
-                "-c:v", "libx264", "-preset", "fast", "-c:a", "aac", "-b:a", "128k",
-                output_video_path
-            ]
-            subprocess.run(ffmpeg_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-            with open(output_text_path, "w") as txt_file:
-                txt_file.write(word)
+            segments.append((start_time, end_time, output_video_path))
+            texts[output_video_path] = (output_text_path, word)
+
+    # All words are cut in one sequential pass over the video
+    print(f"🎬 Extracting {len(segments)} words from {video_path}")
+    failed = dict(extract_segments(video_path, segments, copy=STREAM_COPY))
+    for output_video_path, (output_text_path, word) in texts.items():
+        if output_video_path in failed:
+            print(f"❌ Extraction failed for {output_video_path}:\n{failed[output_video_path]}")
+            continue
+        with open(output_text_path, "w") as txt_file:
+            txt_file.write(word)
 
 
 if __name__ == "__main__":
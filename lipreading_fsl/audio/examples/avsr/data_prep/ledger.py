@@ -0,0 +1,72 @@
+import os
+import sqlite3
+import time
+
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+class Ledger:
+    """Persistent status of every input file of a preprocessing run, kept in an SQLite database.
+
+    Every processed file is recorded as ``done`` with its label row, ``skipped`` with the reason it has no
+    output, or ``failed`` with the error. Only the process driving the run writes to the ledger, so that
+    the workers never contend for the database. A restarted run skips the files that are done or skipped,
+    and the failed ones unless they are retried.
+
+    Args:
+        path (str): path of the SQLite database, created if it does not exist.
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS files "
+            "(filename TEXT PRIMARY KEY, status TEXT NOT NULL, reason TEXT, label TEXT, updated REAL NOT NULL)"
+        )
+        self.connection.commit()
+
+    def completed(self, include_failed=False):
+        """Returns the files that are done or skipped, and optionally the failed ones."""
+        statuses = (DONE, SKIPPED, FAILED) if include_failed else (DONE, SKIPPED)
+        rows = self.connection.execute(
+            f"SELECT filename FROM files WHERE status IN ({', '.join('?' * len(statuses))})", statuses
+        )
+        return {filename for (filename,) in rows}
+
+    def record(self, filename, status, reason=None, label=None, commit=True):
+        """Records the status of a file. With ``commit=False``, it is only persisted by the next ``commit``."""
+        self.connection.execute(
+            "INSERT OR REPLACE INTO files (filename, status, reason, label, updated) VALUES (?, ?, ?, ?, ?)",
+            (filename, status, reason, label, time.time()),
+        )
+        if commit:
+            self.connection.commit()
+
+    def commit(self):
+        self.connection.commit()
+
+    def counts(self):
+        """Returns the number of files by status."""
+        return dict(self.connection.execute("SELECT status, COUNT(*) FROM files GROUP BY status"))
+
+    def labels(self):
+        """Returns the label rows of all files that are done, ordered by file name."""
+        rows = self.connection.execute(
+            "SELECT label FROM files WHERE status = ? AND label IS NOT NULL ORDER BY filename", (DONE,)
+        )
+        return [label for (label,) in rows]
+
+    def write_labels(self, label_filename):
+        """Writes the label rows of all files that are done to ``label_filename``, replacing it atomically."""
+        lines = self.labels()
+        tmp_filename = f"{label_filename}.tmp"
+        with open(tmp_filename, "w") as f:
+            f.write("".join(f"{line}\n" for line in lines))
+        os.replace(tmp_filename, label_filename)
+        return lines
+
+    def close(self):
+        self.connection.close()
@@ -1,219 +1,227 @@
 import argparse
 import glob
-import math
+import multiprocessing
 import os
-import shutil
+import sys
 import warnings
-import cv2
 
-import ffmpeg
+import torch
 from data.data_module import AVSRDataLoader
+from ledger import DONE, FAILED, Ledger, SKIPPED
 from tqdm import tqdm
-from utils import save_vid_aud_txt, split_file
+from utils import save_av_txt
 
 warnings.filterwarnings("ignore")
 
-# Argument Parsing
-parser = argparse.ArgumentParser(description="LRS3 Preprocessing")
-parser.add_argument(
-    "--data-dir",
-    type=str,
-    help="The directory for sequence.",
-)
-parser.add_argument(
-    "--detector",
-    type=str,
-    default="retinaface",
-    help="Face detector used in the experiment.",
-)
-parser.add_argument(
-    "--dataset",
-    type=str,
-    help="Specify the dataset name used in the experiment",
-)
-parser.add_argument(
-    "--root-dir",
-    type=str,
-    help="The root directory of cropped-face dataset.",
-)
-parser.add_argument(
-    "--subset",
-    type=str,
-    required=True,
-    help="Subset of the dataset used in the experiment.",
-)
-parser.add_argument(
-    "--seg-duration",
-    type=int,
-    default=16,
-    help="Length of the segment in seconds.",
-)
-parser.add_argument(
-    "--groups",
-    type=int,
-    default=1,
-    help="Number of threads to be used in parallel.",
-)
-parser.add_argument(
-    "--job-index",
-    type=int,
-    default=0,
-    help="Index to identify separate jobs (useful for parallel processing).",
-)
-args = parser.parse_args()
-
-seg_duration = args.seg_duration
-dataset = args.dataset
-
-args.data_dir = os.path.normpath(args.data_dir)
-vid_dataloader = AVSRDataLoader(modality="video", detector=args.detector, resize=(96, 96))
-aud_dataloader = AVSRDataLoader(modality="audio")
-
-# Create label file
-label_filename = os.path.join(
-    args.root_dir,
-    "labels",
-    f"{dataset}_{args.subset}_transcript_lengths_seg{args.seg_duration}s.csv"
-    if args.groups <= 1
-    else f"{dataset}_{args.subset}_transcript_lengths_seg{args.seg_duration}s.{args.groups}.{args.job_index}.csv",
-)
-os.makedirs(os.path.dirname(label_filename), exist_ok=True)
-print(f"📂 Directory {os.path.dirname(label_filename)} created")
-
-f = open(label_filename, "w")
-
-# Output directories
-dst_vid_dir = os.path.join(args.root_dir, dataset, dataset + f"_video_seg{args.seg_duration}s")
-dst_txt_dir = os.path.join(args.root_dir, dataset, dataset + f"_text_seg{args.seg_duration}s")
-
-# Search for video files
-if args.subset == "test":
-    filenames = glob.glob(os.path.join(args.data_dir, args.subset, "**", "*.mp4"), recursive=True)
-elif args.subset == "train":
-    filenames = glob.glob(os.path.join(args.data_dir, "trainval", "**", "*.mp4"), recursive=True)
-    filenames.extend(glob.glob(os.path.join(args.data_dir, "pretrain", "**", "*.mp4"), recursive=True))
-    filenames.sort()
-else:
-    raise NotImplementedError("Subset must be 'train' or 'test'.")
-
-print(f"✅ Found {len(filenames)} videos to process in {args.data_dir}")
-
-# Parallel job distribution
-unit = math.ceil(len(filenames) / args.groups)
-filenames = filenames[args.job_index * unit : (args.job_index + 1) * unit]
-print(f"📂 {len(filenames)} videos assigned to this job.")
-
-# Process each video
-for data_filename in tqdm(filenames, desc="Processing Videos"):
-    try:
-        print(f"🎥 Processing file: {data_filename}")
-        video_data = vid_dataloader.load_data(data_filename)
-        audio_data = aud_dataloader.load_data(data_filename)
 
-        if video_data is None or len(video_data) == 0:
-            print(f"⚠️ Skipping {data_filename}: No video data!")
-            continue
+def parse_args():
+    parser = argparse.ArgumentParser(description="LRS3 Preprocessing")
+    parser.add_argument(
+        "--data-dir",
+        type=str,
+        help="The directory for sequence.",
+    )
+    parser.add_argument(
+        "--detector",
+        type=str,
+        default="retinaface",
+        help="Face detector used in the experiment.",
+    )
+    parser.add_argument(
+        "--detector-stride",
+        type=int,
+        default=1,
+        help="Run the face detector on every n-th frame only and interpolate the frames in between, "
+        "unless the detections around them are missing, unconfident or far apart.",
+    )
+    parser.add_argument(
+        "--dataset",
+        type=str,
+        help="Specify the dataset name used in the experiment",
+    )
+    parser.add_argument(
+        "--root-dir",
+        type=str,
+        help="The root directory of cropped-face dataset.",
+    )
+    parser.add_argument(
+        "--subset",
+        type=str,
+        required=True,
+        help="Subset of the dataset used in the experiment.",
+    )
+    parser.add_argument(
+        "--seg-duration",
+        type=int,
+        default=16,
+        help="Length of the segment in seconds.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes, each with its own face detector.",
+    )
+    parser.add_argument(
+        "--packed-dir",
+        type=str,
+        help="If given, the cropped clips are appended to the shards of PackedLRS3 in [packed_dir]/[subset] "
+        "instead of being encoded to MP4 files.",
+    )
+    parser.add_argument(
+        "--shard-size",
+        type=float,
+        default=4.0,
+        help="Maximal size of a shard in GiB, with --packed-dir.",
+    )
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="Whether to process the files that failed in a previous run again.",
+    )
+    args = parser.parse_args()
+    args.data_dir = os.path.normpath(args.data_dir)
+    return args
 
-        if audio_data is None or audio_data.size(1) == 0:
-            print(f"⚠️ Skipping {data_filename}: No audio data!")
-            continue
 
-        # ✅ Fix: Define segment lengths AFTER loading video
-        video_length = len(video_data)
-        audio_length = audio_data.size(1)
+def get_filenames(data_dir, subset):
+    if subset == "test":
+        filenames = glob.glob(os.path.join(data_dir, subset, "**", "*.mp4"), recursive=True)
+    elif subset == "train":
+        filenames = glob.glob(os.path.join(data_dir, "trainval", "**", "*.mp4"), recursive=True)
+        filenames.extend(glob.glob(os.path.join(data_dir, "pretrain", "**", "*.mp4"), recursive=True))
+    else:
+        raise NotImplementedError("Subset must be 'train' or 'test'.")
+    return sorted(filenames)
+
 
-        print(f"🎬 Video frames: {video_length}, 🎵 Audio samples: {audio_length}")
+# Set in every worker by init_worker, so that the face detector is loaded once per process.
+_worker = {}
 
-        expected_ratio = 640  # Approximate expected ratio
-        tolerance = 200  # Allow flexibility
 
-        actual_ratio = audio_length / video_length
-        if abs(actual_ratio - expected_ratio) > tolerance:
-            print(f"⚠️ Unusual audio/video ratio {actual_ratio:.2f}, but proceeding")
+def init_worker(args):
+    _worker["args"] = args
+    _worker["video"] = AVSRDataLoader(
+        modality="video", detector=args.detector, resize=(96, 96), detector_stride=args.detector_stride
+    )
+    _worker["audio"] = AVSRDataLoader(modality="audio")
 
+
+def process_file(data_filename):
+    """Crops, saves and labels one video.
+
+    With ``--packed-dir``, the clip is returned as ``sample`` instead of being saved, as NumPy arrays, which
+    are cheaper to send to the main process than tensors.
+
+    rtype: (str, str, str or None, str or None, tuple or None), file name, status, reason, label row and
+        sample.
+    """
+    args = _worker["args"]
+    dataset = args.dataset
+    dst_vid_dir = os.path.join(args.root_dir, dataset, dataset + f"_video_seg{args.seg_duration}s")
+    dst_txt_dir = os.path.join(args.root_dir, dataset, dataset + f"_text_seg{args.seg_duration}s")
+
+    try:
+        video_data = _worker["video"].load_data(data_filename)
+        audio_data = _worker["audio"].load_data(data_filename)
     except Exception as e:
-        print(f"❌ Can't process {data_filename}: {e}")
-        continue
+        return data_filename, FAILED, f"Can't process: {e}", None, None
+
+    if video_data is None or len(video_data) == 0:
+        return data_filename, SKIPPED, "No video data", None, None
+    if audio_data is None or audio_data.size(1) == 0:
+        return data_filename, SKIPPED, "No audio data", None, None
+    video_length = len(video_data)
 
     dst_vid_filename = f"{data_filename.replace(args.data_dir, dst_vid_dir)[:-4]}.mp4"
-    dst_aud_filename = f"{data_filename.replace(args.data_dir, dst_vid_dir)[:-4]}.wav"
     dst_txt_filename = f"{data_filename.replace(args.data_dir, dst_txt_dir)[:-4]}.txt"
 
-    # 🛠 Fix: Load transcript from the existing .txt file
+    # Load transcript from the existing .txt file, empty if not found
     transcript_path = data_filename[:-4] + ".txt"
+    transcript_data = ""
+    try:
+        if os.path.exists(transcript_path):
+            with open(transcript_path, "r", encoding="utf-8") as txt_file:
+                transcript_data = txt_file.read().strip()
+    except Exception as e:
+        return data_filename, FAILED, f"Can't read transcript: {e}", None, None
 
-    if os.path.exists(transcript_path):
-        with open(transcript_path, "r", encoding="utf-8") as txt_file:
-            transcript_data = txt_file.read().strip()  # Read and clean transcript
-    else:
-        print(f"⚠️ Missing transcript file: {transcript_path}")
-        transcript_data = ""  # Leave empty if not found
-
-    # 🛠 Add Debugging Print Here
-    print(f"📜 Transcript for {data_filename}: {transcript_data}")  # ✅ Debugging print statement
-
-    # Pass the actual transcript to save function
-    save_vid_aud_txt(
-        dst_vid_filename,
-        dst_aud_filename,
-        dst_txt_filename,
-        video_data,
-        audio_data,
-        transcript_data,  # ✅ Fix - Use the actual transcript data
-        video_fps=25,
-        audio_sample_rate=16000,
-    )
+    if args.packed_dir:
+        return data_filename, DONE, None, None, (audio_data.t().numpy(), video_data.numpy(), transcript_data)
 
-    # Merge Video + Audio
     try:
-        in1 = ffmpeg.input(dst_vid_filename)
-        in2 = ffmpeg.input(dst_aud_filename)
-        out = ffmpeg.output(
-            in1["v"], in2["a"], dst_vid_filename[:-4] + ".m.mp4",
-            vcodec="copy", acodec="aac", strict="experimental", loglevel="panic"
+        # Video and audio are encoded into one MP4 in a single pass
+        save_av_txt(
+            dst_vid_filename,
+            dst_txt_filename,
+            video_data,
+            audio_data,
+            transcript_data,
+            video_fps=25,
+            audio_sample_rate=16000,
         )
-        out.run()
-        os.remove(dst_aud_filename)
-        os.remove(dst_vid_filename)
-        shutil.move(dst_vid_filename[:-4] + ".m.mp4", dst_vid_filename)
-        print(f"✅ Merged video saved: {dst_vid_filename}")
-
     except Exception as e:
-        print(f"❌ Error merging {data_filename}: {e}")
+        return data_filename, FAILED, f"Error saving: {e}", None, None
 
-    # Save label info
     basename = os.path.relpath(dst_vid_filename, start=os.path.join(args.root_dir, dataset))
     transcript_text = transcript_data.strip() if transcript_data else "MISSING"
-    f.write(f"{dataset},{basename},{video_length},{len(transcript_text)}\n")
+    return data_filename, DONE, None, f"{dataset},{basename},{video_length},{len(transcript_text)}", None
 
-f.close()
-print("✅ Processing complete!")
 
+def get_shard_writer(args):
+    # The shards are read by PackedLRS3 of the training recipe in the parent directory.
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    from pack_lrs3 import ShardWriter
 
-'''
-parallel --jobs 8 
+    output_dir = os.path.join(args.packed_dir, args.subset)
+    os.makedirs(output_dir, exist_ok=True)
+    return ShardWriter(output_dir, int(args.shard_size * 1024**3), resume=True)
 
-python preprocess_lrs3.py \
-    --data-dir=/media/frb6002/e788e444-2cfa-4c6c-9b1b-16400370567d/home/audi/Documents/soi_1_cutted \
-    --detector=mediapipe \
-    --dataset=lrs3 \
-    --root-dir=/media/frb6002/e788e444-2cfa-4c6c-9b1b-16400370567d/home/audi/Documents/cut_vid_preprocessed \
-    --subset=train \
-    --groups 2 \
-     --job-index {}
-      
-      ::: $(seq 0 7)
-
-parallel --jobs 10 --progress --eta --bar \
-    python preprocess_lrs3.py \
-        --data-dir=/media/frb6002/e788e444-2cfa-4c6c-9b1b-16400370567d/home/audi/Documents/soi_1_cutted \
-        --detector=mediapipe \
-        --dataset=lrs3 \
-        --root-dir=/media/frb6002/e788e444-2cfa-4c6c-9b1b-16400370567d/home/audi/Documents/soi_1_cutted_prepro \
-        --subset=train \
-        --groups 4 \
-        --job-index {} ::: $(seq 0 9)
 
+def main():
+    args = parse_args()
+    label_prefix = os.path.join(
+        args.root_dir, "labels", f"{args.dataset}_{args.subset}_transcript_lengths_seg{args.seg_duration}s"
+    )
+    ledger = Ledger(f"{label_prefix}.ledger.sqlite")
+
+    filenames = get_filenames(args.data_dir, args.subset)
+    completed = ledger.completed(include_failed=not args.retry_failed)
+    filenames = [filename for filename in filenames if filename not in completed]
+    print(f"✅ {len(filenames)} videos to process in {args.data_dir}, {len(completed)} already processed")
+
+    # With --packed-dir, files are only recorded as processed once the shard index covers them.
+    shard_writer = get_shard_writer(args) if args.packed_dir else None
+
+    # Workers are spawned so that every one of them can initialize CUDA for its own detector.
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(args.workers, initializer=init_worker, initargs=(args,)) as pool:
+        results = pool.imap_unordered(process_file, filenames)
+        for idx, (data_filename, status, reason, label, sample) in enumerate(
+            tqdm(results, total=len(filenames), desc="Processing Videos")
+        ):
+            if sample is not None:
+                audio, video, transcript = sample
+                shard_writer.write(torch.from_numpy(audio), torch.from_numpy(video).permute(0, 3, 1, 2), transcript)
+            ledger.record(data_filename, status, reason, label, commit=shard_writer is None)
+            if shard_writer is not None and idx % 100 == 99:
+                shard_writer.flush()
+                ledger.commit()
+            if status != DONE:
+                tqdm.write(f"⚠️ {status} {data_filename}: {reason}")
+
+    print(f"Status: {ledger.counts()}")
+    if shard_writer is not None:
+        shard_writer.close()
+        ledger.commit()
+        print(f"The packed set in {shard_writer.output_dir} has {len(shard_writer.index)} files.")
+    else:
+        # Merge the label rows of all runs
+        lines = ledger.write_labels(f"{label_prefix}.csv")
+        total_duration = sum(int(line.split(",")[2]) for line in lines) / 3600.0 / 25.0
+        print(f"The completed set has {len(lines)} files with a total of {total_duration:.2f} hours.")
+    ledger.close()
 
 
-'''
\ No newline at end of file
+if __name__ == "__main__":
+    main()
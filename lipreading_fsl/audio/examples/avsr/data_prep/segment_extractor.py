@@ -0,0 +1,88 @@
+import bisect
+import os
+import subprocess
+
+ENCODE_ARGS = ["-c:v", "libx264", "-preset", "fast", "-c:a", "aac", "-b:a", "128k"]
+COPY_ARGS = ["-c", "copy"]
+
+
+def get_keyframe_times(video_path):
+    """Returns the sorted timestamps, in seconds, of the keyframes of the first video stream.
+
+    Only the packet headers are read, so this is much faster than decoding the video.
+    """
+    command = [
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", video_path,
+    ]
+    result = subprocess.run(command, capture_output=True, text=True, check=True)
+    times = []
+    for line in result.stdout.splitlines():
+        pts_time, _, flags = line.partition(",")
+        if "K" in flags and pts_time not in ("", "N/A"):
+            times.append(float(pts_time))
+    return sorted(times)
+
+
+def _snap_to_keyframe(start, keyframes, tolerance):
+    """Returns the keyframe within ``tolerance`` seconds of ``start``, or None."""
+    idx = bisect.bisect_left(keyframes, start - tolerance)
+    if idx < len(keyframes) and keyframes[idx] <= start + tolerance:
+        return keyframes[idx]
+    return None
+
+
+def _cut(video_path, window):
+    """Cuts the planned segments of ``window`` with one ``ffmpeg`` process and returns its error, or None."""
+    input_start = window[0][0]
+    command = ["ffmpeg", "-y", "-loglevel", "error", "-ss", f"{input_start:.3f}", "-i", video_path]
+    for start, end, output_path, stream_copy in window:
+        # Output times are relative to the input seek.
+        command += ["-ss", f"{start - input_start:.3f}", "-t", f"{end - start:.3f}"]
+        command += COPY_ARGS if stream_copy else ENCODE_ARGS
+        command.append(output_path)
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    return None if result.returncode == 0 else result.stderr.strip()
+
+
+def extract_segments(video_path, segments, copy=False, keyframe_tolerance=0.02, max_outputs=32):
+    """Cuts all ``(start, end, output_path)`` segments of a video, reading it sequentially once.
+
+    The segments are sorted by start time and cut by one ``ffmpeg`` process per window of ``max_outputs``
+    consecutive segments, each writing to all outputs of its window. Such a process seeks to the start of its
+    window once, before opening the input, decodes on from there and hands every frame to the outputs whose
+    interval contains it. The video is therefore decoded once from start to end rather than up to the start
+    of every segment, and every output only holds an encoder while its window is cut.
+
+    If a process fails, the segments of its window are cut one by one, and the output of every segment that
+    still fails is removed.
+
+    With ``copy=True``, a segment that starts within ``keyframe_tolerance`` seconds of a keyframe is stream
+    copied from that keyframe instead of being re-encoded.
+
+    :param video_path: str, path of the source video.
+    :param segments: list, ``(start, end, output_path)`` with times in seconds. Segments may overlap.
+    :param copy: bool, whether to stream copy keyframe-aligned segments.
+    :param keyframe_tolerance: float, maximal distance in seconds between a copied segment and its keyframe.
+    :param max_outputs: int, maximal number of outputs of one ``ffmpeg`` process.
+    rtype: list, ``(output_path, error)`` of every segment that could not be cut.
+    """
+    keyframes = get_keyframe_times(video_path) if copy else []
+    planned = []
+    for start, end, output_path in sorted(segments):
+        keyframe = _snap_to_keyframe(start, keyframes, keyframe_tolerance) if copy else None
+        planned.append((start if keyframe is None else keyframe, end, output_path, keyframe is not None))
+
+    failed = []
+    for window_start in range(0, len(planned), max_outputs):
+        window = planned[window_start : window_start + max_outputs]
+        if _cut(video_path, window) is None:
+            continue
+        # The call does not tell which outputs failed, so every segment of the window is cut on its own again.
+        for segment in window:
+            error = _cut(video_path, [segment])
+            if error is not None:
+                if os.path.exists(segment[2]):
+                    os.remove(segment[2])
+                failed.append((segment[2], error))
+    return failed
@@ -1,7 +1,9 @@
+import math
 import os
 
 import torchaudio
 import torchvision
+from torchaudio.io import StreamWriter
 
 
 def split_file(filename, max_frames=600, fps=25.0):
@@ -77,6 +79,55 @@ def save_vid_aud_txt(
     f.close()
 
 
+def save_av_txt(dst_vid_filename, dst_txt_filename, vid, aud, content, video_fps=25, audio_sample_rate=16000):
+    # -- save video with audio
+    save2av(dst_vid_filename, vid, aud, video_fps, audio_sample_rate)
+    # -- save text
+    os.makedirs(os.path.dirname(dst_txt_filename), exist_ok=True)
+    with open(dst_txt_filename, "w") as f:
+        f.write(f"{content}")
+
+
+def save2av(filename, vid, aud, frames_per_second, sample_rate, frames_per_chunk=25):
+    """Encodes frames and a waveform into one MP4 in a single pass, with the codecs of ``save2vid`` and ffmpeg.
+
+    The H.264 video and AAC audio streams are written in interleaved chunks of ``frames_per_chunk`` frames
+    to a temporary file, which replaces ``filename`` once it is complete.
+
+    :param filename: str, path of the MP4 file.
+    :param vid: torch.Tensor, (T, H, W, C) uint8 frames.
+    :param aud: torch.Tensor, (C, N) float waveform.
+    :param frames_per_second: int, frame rate of the video.
+    :param sample_rate: int, sample rate of the audio.
+    :param frames_per_chunk: int, number of frames encoded per chunk.
+    """
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    vid = vid.permute(0, 3, 1, 2).contiguous()
+    aud = aud.t().float().contiguous()
+    tmp_filename = f"{filename[:-4]}.tmp.mp4"
+    writer = StreamWriter(tmp_filename, format="mp4")
+    writer.add_video_stream(
+        frames_per_second,
+        width=vid.size(3),
+        height=vid.size(2),
+        format="rgb24" if vid.size(1) == 3 else "gray",
+        encoder="libx264",
+        encoder_format="yuv420p",
+    )
+    writer.add_audio_stream(sample_rate, num_channels=aud.size(1), format="flt", encoder="aac")
+    samples_per_chunk = frames_per_chunk * sample_rate // frames_per_second
+    num_chunks = max(math.ceil(len(vid) / frames_per_chunk), math.ceil(len(aud) / samples_per_chunk))
+    with writer.open():
+        for chunk_idx in range(num_chunks):
+            video_chunk = vid[chunk_idx * frames_per_chunk : (chunk_idx + 1) * frames_per_chunk]
+            audio_chunk = aud[chunk_idx * samples_per_chunk : (chunk_idx + 1) * samples_per_chunk]
+            if len(video_chunk) > 0:
+                writer.write_video_chunk(0, video_chunk)
+            if len(audio_chunk) > 0:
+                writer.write_audio_chunk(1, audio_chunk)
+    os.replace(tmp_filename, filename)
+
+
 def save2vid(filename, vid, frames_per_second):
     os.makedirs(os.path.dirname(filename), exist_ok=True)
     torchvision.io.write_video(filename, vid, frames_per_second)
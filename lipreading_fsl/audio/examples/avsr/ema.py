@@ -0,0 +1,118 @@
+import torch
+from pytorch_lightning.callbacks import Callback
+
+
+def _ema_tensors(pl_module):
+    """Returns the names and tensors of the floating point parameters and buffers of ``pl_module``."""
+    named = list(pl_module.named_parameters()) + list(pl_module.named_buffers())
+    return [(name, tensor) for name, tensor in named if tensor.is_floating_point()]
+
+
+def ema_state_dict(checkpoint):
+    """Returns the ``state_dict`` of a checkpoint with the weights of its ``EMA`` callback, if it has one.
+
+    :param checkpoint: dict, checkpoint saved by a ``Trainer`` with an ``EMA`` callback or without one.
+    rtype: dict
+    """
+    state_dict = dict(checkpoint["state_dict"])
+    for key, state in checkpoint.get("callbacks", {}).items():
+        if key.startswith("EMA"):
+            state_dict.update({k: v for k, v in state["shadow"].items() if k in state_dict})
+    return state_dict
+
+
+class EMA(Callback):
+    """Keeps an exponential moving average of the weights of a module during training.
+
+    Every ``every_n_steps`` optimizer steps, the shadow weights are moved towards the current ones with
+    one fused multi-tensor ``lerp``. The decay is ramped up as ``min(decay, (1 + n) / (10 + n))`` over the
+    first ``n`` updates, so that the average is not dominated by the initial weights. The shadow weights are
+    swapped in for validation and testing, and saved in the checkpoint, from which ``ema_state_dict`` reads
+    them.
+
+    Args:
+        decay (float, optional): decay per update. (Default: 0.9999)
+        every_n_steps (int, optional): number of optimizer steps between updates. (Default: 1)
+    """
+
+    def __init__(self, decay=0.9999, every_n_steps=1):
+        if not 0.0 <= decay <= 1.0:
+            raise ValueError(f"decay must be in [0, 1], but got {decay}.")
+        self.decay = decay
+        self.every_n_steps = every_n_steps
+        self.num_updates = 0
+        self.shadow = None
+        self._names = None
+        self._loaded_shadow = None
+        self._backup = None
+        # With gradient accumulation, several batches end on the same optimizer step.
+        self._last_step = -1
+
+    def _ensure_shadow(self, pl_module):
+        if self.shadow is not None:
+            return
+        named = _ema_tensors(pl_module)
+        self._names = [name for name, _ in named]
+        if self._loaded_shadow is not None:
+            self.shadow = [self._loaded_shadow[name].to(tensor) for name, tensor in named]
+            self._loaded_shadow = None
+        else:
+            self.shadow = [tensor.detach().clone() for _, tensor in named]
+
+    def on_fit_start(self, trainer, pl_module):
+        self._ensure_shadow(pl_module)
+
+    @torch.no_grad()
+    def on_train_batch_end(self, trainer, pl_module, outputs, batch, batch_idx):
+        step = trainer.global_step
+        if step % self.every_n_steps != 0 or step == self._last_step:
+            return
+        self._ensure_shadow(pl_module)
+        decay = min(self.decay, (1 + self.num_updates) / (10 + self.num_updates))
+        torch._foreach_lerp_(self.shadow, [tensor.detach() for _, tensor in _ema_tensors(pl_module)], 1.0 - decay)
+        self.num_updates += 1
+        self._last_step = step
+
+    @torch.no_grad()
+    def _swap_in(self, pl_module):
+        self._ensure_shadow(pl_module)
+        tensors = [tensor for _, tensor in _ema_tensors(pl_module)]
+        self._backup = [tensor.detach().clone() for tensor in tensors]
+        torch._foreach_copy_(tensors, self.shadow)
+
+    @torch.no_grad()
+    def _swap_out(self, pl_module):
+        if self._backup is None:
+            return
+        torch._foreach_copy_([tensor for _, tensor in _ema_tensors(pl_module)], self._backup)
+        self._backup = None
+
+    def on_validation_start(self, trainer, pl_module):
+        self._swap_in(pl_module)
+
+    def on_validation_end(self, trainer, pl_module):
+        self._swap_out(pl_module)
+
+    def on_test_start(self, trainer, pl_module):
+        self._swap_in(pl_module)
+
+    def on_test_end(self, trainer, pl_module):
+        self._swap_out(pl_module)
+
+    def averaged_state_dict(self, pl_module):
+        """Returns the ``state_dict`` of ``pl_module`` with the averaged weights."""
+        state_dict = pl_module.state_dict()
+        state_dict.update({k: v for k, v in self.state_dict()["shadow"].items() if k in state_dict})
+        return state_dict
+
+    def state_dict(self):
+        shadow = self._loaded_shadow
+        if self.shadow is not None:
+            shadow = {name: tensor.detach().cpu() for name, tensor in zip(self._names, self.shadow)}
+        return {"decay": self.decay, "num_updates": self.num_updates, "shadow": shadow}
+
+    def load_state_dict(self, state_dict):
+        self.num_updates = state_dict["num_updates"]
+        # The module may not be on its device yet, so the shadow weights are moved on first use.
+        self._loaded_shadow = state_dict["shadow"]
+        self.shadow = None
@@ -5,6 +5,8 @@ from email.policy import default
 import sentencepiece as spm
 import torch
 import torchaudio
+from data_module import CUDAPrefetcher, move_to_device
+from ema import ema_state_dict
 from transforms import get_data_module
 import os
 os.environ["CUDA_VISIBLE_DEVICES"] = "1"
@@ -29,28 +31,40 @@ def get_lightning_module(args):
         from lightning import ConformerRNNTModule
 
         model = ConformerRNNTModule(args, sp_model)
-    ckpt = torch.load(args.checkpoint_path, map_location=lambda storage, loc: storage)["state_dict"]
-    model.load_state_dict(ckpt)
+    ckpt = torch.load(args.checkpoint_path, map_location=lambda storage, loc: storage)
+    # Checkpoints of a run with --ema-decay are evaluated with their averaged weights.
+    model.load_state_dict(ckpt["state_dict"] if args.no_ema else ema_state_dict(ckpt))
     model.eval()
+    if torch.cuda.is_available():
+        model.cuda()
     return model
 
 
-def run_eval(model, data_module):
+def run_eval(model, data_module, batch_size=16, decoder="beam", beam_width=20):
     total_edit_distance = 0
     total_edit_distance_filtered = 0
     total_length = 0
-    dataloader = data_module.test_dataloader()
+    num_processed = 0
+    # Only the batch is copied to the device; the raw samples are needed on the host for their transcripts.
+    dataloader = CUDAPrefetcher(
+        data_module.test_dataloader(batch_size=batch_size),
+        model.device,
+        transfer_fn=lambda item, device: (move_to_device(item[0], device, non_blocking=True), item[1]),
+    )
     with torch.no_grad():
-        for idx, (batch, sample) in enumerate(dataloader):
-            actual = sample[0][-1]
-            predicted = model(batch)
-            print("Actual:", actual, "Predicted:", predicted)
-            total_edit_distance += compute_word_level_distance(actual, predicted)
-            total_edit_distance_filtered += compute_word_level_distance_filtered(actual, predicted)
-            total_length += len(actual.split())
-            if idx % 100 == 0:
-                logger.warning(f"Processed elem {idx}; WER: {total_edit_distance / total_length}")
-                logger.warning(f"Filtered Processed elem {idx}; WER: {total_edit_distance_filtered / total_length}")
+        for batch, samples in dataloader:
+            for sample, predicted in zip(samples, model.decode(batch, beam_width, decoder)):
+                actual = sample[-1]
+                print("Actual:", actual, "Predicted:", predicted)
+                total_edit_distance += compute_word_level_distance(actual, predicted)
+                total_edit_distance_filtered += compute_word_level_distance_filtered(actual, predicted)
+                total_length += len(actual.split())
+                if num_processed % 100 == 0:
+                    logger.warning(f"Processed elem {num_processed}; WER: {total_edit_distance / total_length}")
+                    logger.warning(
+                        f"Filtered Processed elem {num_processed}; WER: {total_edit_distance_filtered / total_length}"
+                    )
+                num_processed += 1
 
 
     logger.warning(f"Final WER: {total_edit_distance / total_length}")
@@ -102,6 +116,33 @@ def parse_args():
         help="Learning rate (Default: 8e-4)",
         required=False
     )
+    parser.add_argument(
+        "--batch-size",
+        default=16,
+        type=int,
+        help="Number of utterances decoded together. (Default: 16)",
+        required=False
+    )
+    parser.add_argument(
+        "--decoder",
+        default="beam",
+        type=str,
+        choices=["beam", "modified_beam", "greedy"],
+        help="Search used to decode the test set. (Default: beam)",
+        required=False
+    )
+    parser.add_argument(
+        "--beam-width",
+        default=20,
+        type=int,
+        help="Beam width of the beam searches. (Default: 20)",
+        required=False
+    )
+    parser.add_argument(
+        "--no-ema",
+        action="store_true",
+        help="Whether to evaluate the trained weights of a checkpoint instead of their moving average.",
+    )
     parser.add_argument("--debug", action="store_true", help="whether to use debug level for logging")
     return parser.parse_args()
 
@@ -117,7 +158,7 @@ def cli_main():
     init_logger(args.debug)
     model = get_lightning_module(args)
     data_module = get_data_module(args, str(args.sp_model_path))
-    run_eval(model, data_module)
+    run_eval(model, data_module, args.batch_size, args.decoder, args.beam_width)
 
 
 if __name__ == "__main__":
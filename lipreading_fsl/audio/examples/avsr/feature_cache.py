@@ -0,0 +1,182 @@
+import hashlib
+import os
+import time
+
+import numpy as np
+import torch
+import torch.distributed as dist
+from lightning import Batch
+from lrs3 import PackedLRS3
+from transforms import _extract_labels, AdaptiveTimeMask, LengthAwareCollate
+
+FEATURE_DTYPE = np.float16
+
+
+def frontend_hash(module):
+    """Returns a hash of the weights and buffers of the front-ends of ``module``.
+
+    Features cached with one set of front-end weights are only reused with the same weights, whichever
+    checkpoint they were loaded from.
+    """
+    sha1 = hashlib.sha1()
+    for name, tensor in sorted(module.frontend_state_dict().items()):
+        sha1.update(name.encode())
+        sha1.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+    return sha1.hexdigest()[:16]
+
+
+class FeatureStore:
+    """Front-end features of every sample of a dataset, concatenated along time into one memory-mapped array.
+
+    Features are stored as float16 in ``<prefix>.bin`` and indexed by the int64 offsets in
+    ``<prefix>.index.npz``, which is written last, so an index only exists for a complete store.
+    """
+
+    def __init__(self, prefix, offsets, dim):
+        self.prefix = prefix
+        self.offsets = offsets
+        self.dim = dim
+        self.lengths = (offsets[1:] - offsets[:-1]).astype(np.int32)
+        # The array is mapped lazily so that every DataLoader worker opens its own mapping.
+        self._features = None
+
+    @classmethod
+    def load(cls, prefix):
+        with np.load(f"{prefix}.index.npz") as f:
+            return cls(prefix, f["offsets"], int(f["dim"]))
+
+    @classmethod
+    def build(cls, prefix, extract_fn, dataloader):
+        """Writes the features of all batches of ``dataloader``, in order, and returns the store.
+
+        :param prefix: str, path prefix of the store files.
+        :param extract_fn: callable, maps a batch to its (B, T, D) features and (B,) lengths.
+        :param dataloader: iterable, batches of consecutive samples of the dataset, in order.
+        rtype: FeatureStore
+        """
+        offsets = [0]
+        dim = None
+        tmp_suffix = f".{os.getpid()}.tmp"
+        with open(f"{prefix}.bin{tmp_suffix}", "wb") as f:
+            for batch in dataloader:
+                features, lengths = extract_fn(batch)
+                dim = features.size(-1)
+                features = features.to(torch.float16).cpu().numpy()
+                for sample_features, length in zip(features, lengths.tolist()):
+                    f.write(np.ascontiguousarray(sample_features[:length], dtype=FEATURE_DTYPE).tobytes())
+                    offsets.append(offsets[-1] + length)
+        offsets = np.array(offsets, dtype=np.int64)
+        os.replace(f"{prefix}.bin{tmp_suffix}", f"{prefix}.bin")
+        with open(f"{prefix}.index.npz{tmp_suffix}", "wb") as f:
+            np.savez(f, offsets=offsets, dim=np.int64(dim or 0))
+        os.replace(f"{prefix}.index.npz{tmp_suffix}", f"{prefix}.index.npz")
+        return cls(prefix, offsets, dim or 0)
+
+    def __getitem__(self, n):
+        """
+        rtype: torch, T x D float16
+        """
+        if self._features is None:
+            self._features = np.memmap(f"{self.prefix}.bin", dtype=FEATURE_DTYPE, mode="r").reshape(-1, self.dim)
+        return torch.from_numpy(np.array(self._features[self.offsets[n] : self.offsets[n + 1]]))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_features"] = None
+        return state
+
+
+class FeatureDataset(torch.utils.data.Dataset):
+    """Returns the cached front-end features and the target of every sample of ``dataset``.
+
+    Samples are ``(features, target)``, so the frames of a sample are never decoded.
+    """
+
+    def __init__(self, dataset, store):
+        if len(dataset) != len(store):
+            raise ValueError(f"The feature store has {len(store)} samples, but the dataset has {len(dataset)}.")
+        self.targets = dataset.targets if isinstance(dataset, PackedLRS3) else dataset.tokens
+        if self.targets is None:
+            raise ValueError("Cached features need the token cache of the dataset, i.e. an sp_model_path.")
+        self.store = store
+        self.lengths = store.lengths
+
+    def __getitem__(self, n):
+        return self.store[n], self.targets[n]
+
+    def __len__(self):
+        return len(self.store)
+
+
+class FeatureTransform:
+    """Collates ``FeatureDataset`` samples into a ``Batch`` of float32 features, optionally time-masked."""
+
+    def __init__(self, sp_model, time_mask=None):
+        self.sp_model = sp_model
+        self.collate = LengthAwareCollate(time_mask=time_mask)
+
+    def __call__(self, samples):
+        targets, target_lengths = _extract_labels(self.sp_model, samples)
+        features, lengths = self.collate([sample[0].float() for sample in samples])
+        return Batch(features, lengths, targets, target_lengths)
+
+
+def attach_feature_cache(module, data_module, cache_dir, batch_size=16, poll_interval=10.0):
+    """Makes ``data_module`` serve cached front-end features of ``module`` for training and validation.
+
+    The features of the train and val subsets are read from ``cache_dir`` if a store for the current
+    front-end weights exists, and extracted with ``module.extract_frontend_features`` from the center-cropped
+    validation pipeline otherwise. The random crops and flips of training are therefore not applied; the
+    time masking is applied to the features instead of the frames.
+
+    Under DDP, missing stores are only extracted by global rank 0, on the GPU of its local rank, while the
+    other ranks wait for them to be complete and load them.
+
+    :param module: ConformerRNNTModule or AVConformerRNNTModule, with frozen front-ends.
+    :param data_module: LRS3DataModule.
+    :param cache_dir: str, directory of the feature stores.
+    :param batch_size: int, number of samples per front-end call while extracting.
+    :param poll_interval: float, seconds between two checks for the stores on ranks other than 0.
+    """
+    key = frontend_hash(module)
+    rank = 0
+    if dist.is_available() and dist.is_initialized():
+        rank = dist.get_rank()
+        # All ranks use the stores of the front-end weights of rank 0, which is the one extracting them.
+        keys = [key]
+        dist.broadcast_object_list(keys, src=0)
+        key = keys[0]
+    if torch.cuda.is_available():
+        device = torch.device("cuda", int(os.environ.get("LOCAL_RANK", 0)))
+    else:
+        device = torch.device("cpu")
+    os.makedirs(cache_dir, exist_ok=True)
+    for subset in ["train", "val"]:
+        dataset = data_module.get_dataset(subset)
+        prefix = os.path.join(cache_dir, f"{subset}.features-{key}")
+        if rank != 0:
+            # The index is written last, so the store is complete once it exists.
+            while not os.path.exists(f"{prefix}.index.npz"):
+                time.sleep(poll_interval)
+        if os.path.exists(f"{prefix}.index.npz"):
+            store = FeatureStore.load(prefix)
+        else:
+            dataloader = torch.utils.data.DataLoader(
+                dataset,
+                batch_size=batch_size,
+                shuffle=False,
+                collate_fn=data_module.val_transform,
+                num_workers=data_module.num_workers,
+            )
+            module.to(device).eval()
+            with torch.no_grad():
+                store = FeatureStore.build(
+                    prefix, lambda batch: module.extract_frontend_features(batch.to(device)), dataloader
+                )
+        data_module.datasets[subset] = FeatureDataset(dataset, store)
+
+    data_module.train_transform = FeatureTransform(data_module.train_transform.sp_model, AdaptiveTimeMask(10, 25))
+    data_module.val_transform = FeatureTransform(data_module.val_transform.sp_model)
@@ -13,12 +13,29 @@ from models.emformer_rnnt import emformer_rnnt
 from models.resnet import video_resnet
 from models.resnet1d import audio_resnet
 from pytorch_lightning import LightningModule
+from rnnt_loss import chunked_rnnt_loss
 from schedulers import WarmupCosineScheduler
-from torchaudio.models import Hypothesis, RNNTBeamSearch
+from torchaudio.models import Hypothesis, RNNTBatchBeamSearch, RNNTGreedySearch, RNNTModifiedBeamSearch
 
 _expected_spm_vocab_size = 1023
 
-Batch = namedtuple("Batch", ["inputs", "input_lengths", "targets", "target_lengths"])
+_decoders = {
+    "beam": RNNTBatchBeamSearch,
+    "modified_beam": RNNTModifiedBeamSearch,
+    "greedy": RNNTGreedySearch,
+}
+
+
+class Batch(namedtuple("Batch", ["inputs", "input_lengths", "targets", "target_lengths"])):
+    """Padded mini-batch. Implements ``pin_memory`` so that ``DataLoader(pin_memory=True)`` pins every field."""
+
+    __slots__ = ()
+
+    def pin_memory(self):
+        return type(self)(*(elem.pin_memory() for elem in self))
+
+    def to(self, device, non_blocking=False):
+        return type(self)(*(elem.to(device, non_blocking=non_blocking) for elem in self))
 
 
 def post_process_hypos(
@@ -58,10 +75,16 @@ class ConformerRNNTModule(LightningModule):
         self.blank_idx = spm_vocab_size
 
         if args.modality == "video":
-            self.frontend = video_resnet()
+            self.frontend = video_resnet(channels_last=getattr(args, "channels_last", False))
         if args.modality == "audio":
             self.frontend = audio_resnet()
 
+        self.video_augment = None
+        if args.modality == "video" and getattr(args, "gpu_augment", False):
+            from transforms import BatchedVideoAugment
+
+            self.video_augment = BatchedVideoAugment()
+
         if args.mode == "online":
             self.model = emformer_rnnt()
         if args.mode == "offline":
@@ -75,15 +98,67 @@ class ConformerRNNTModule(LightningModule):
             }
             self.frontend.load_state_dict(tmp_ckpt)
 
+        # A frozen front-end is kept in eval mode and out of the optimizer; with a feature cache the batches
+        # then carry its precomputed outputs instead of frames.
+        self.freeze_frontend = getattr(args, "freeze_frontend", False)
+        self.cached_features = bool(getattr(args, "feature_cache_dir", None))
+        if self.cached_features and not self.freeze_frontend:
+            raise ValueError("Cached front-end features require a frozen front-end (--freeze-frontend).")
+        if self.freeze_frontend:
+            self.frontend.requires_grad_(False)
+
         self.loss = torchaudio.transforms.RNNTLoss(reduction="sum")
+        # If set, the joiner and the loss are evaluated on chunks of this many samples to bound their memory.
+        self.rnnt_chunk_size = getattr(args, "rnnt_chunk_size", None)
 
         self.optimizer = torch.optim.AdamW(
-            itertools.chain(*([self.frontend.parameters(), self.model.parameters()])),
+            [p for p in itertools.chain(self.frontend.parameters(), self.model.parameters()) if p.requires_grad],
             lr=8e-4,
             weight_decay=0.06,
             betas=(0.9, 0.98),
         )
 
+    def train(self, mode=True):
+        super().train(mode)
+        if self.freeze_frontend:
+            self.frontend.eval()
+        return self
+
+    def frontend_state_dict(self):
+        return {f"frontend.{k}": v for k, v in self.frontend.state_dict().items()}
+
+    def extract_frontend_features(self, batch):
+        """Returns the (B, T, 512) front-end features of a batch of frames and their (B,) lengths."""
+        return self.frontend(batch.inputs), batch.input_lengths
+
+    def on_after_batch_transfer(self, batch, dataloader_idx):
+        if self.video_augment is not None and self.trainer.training and not self.cached_features:
+            batch = batch._replace(inputs=self.video_augment(batch.inputs, batch.input_lengths))
+        return batch
+
+    def _rnnt_loss(self, features, input_lengths, prepended_targets, prepended_target_lengths, targets, target_lengths):
+        if self.rnnt_chunk_size:
+            source_encodings, source_lengths = self.model.transcribe(features, input_lengths)
+            target_encodings, target_encoding_lengths, _ = self.model.predict(
+                prepended_targets, prepended_target_lengths, None
+            )
+            return chunked_rnnt_loss(
+                self.model.join,
+                self.loss,
+                source_encodings,
+                source_lengths,
+                target_encodings,
+                target_encoding_lengths,
+                targets,
+                target_lengths,
+                self.rnnt_chunk_size,
+            )
+
+        output, src_lengths, _, _ = self.model(features, input_lengths, prepended_targets, prepended_target_lengths)
+        # Under fp16/bf16 autocast the joiner output is half precision; the loss is computed in fp32.
+        with torch.autocast(device_type=output.device.type, enabled=False):
+            return self.loss(output.float(), targets, src_lengths, target_lengths)
+
     def _step(self, batch, _, step_type):
         if batch is None:
             return None
@@ -92,11 +167,18 @@ class ConformerRNNTModule(LightningModule):
         prepended_targets[:, 1:] = batch.targets
         prepended_targets[:, 0] = self.blank_idx
         prepended_target_lengths = batch.target_lengths + 1
-        features = self.frontend(batch.inputs)
-        output, src_lengths, _, _ = self.model(
-            features, batch.input_lengths, prepended_targets, prepended_target_lengths
+        if self.cached_features:
+            features, input_lengths = batch.inputs, batch.input_lengths
+        else:
+            features, input_lengths = self.extract_frontend_features(batch)
+        loss = self._rnnt_loss(
+            features,
+            input_lengths,
+            prepended_targets,
+            prepended_target_lengths,
+            batch.targets,
+            batch.target_lengths,
         )
-        loss = self.loss(output, batch.targets, src_lengths, batch.target_lengths)
         self.log(f"Losses/{step_type}_loss", loss, on_step=True, on_epoch=True)
 
         return loss
@@ -106,7 +188,7 @@ class ConformerRNNTModule(LightningModule):
             self.optimizer,
             10,
             self.args.epochs,
-            len(self.trainer.datamodule.train_dataloader()) / self.trainer.num_devices / self.trainer.num_nodes,
+            len(self.trainer.datamodule.train_dataloader()),
         )
         self.lr_scheduler_interval = "step"
         return (
@@ -114,11 +196,20 @@ class ConformerRNNTModule(LightningModule):
             [{"scheduler": self.warmup_lr_scheduler, "interval": self.lr_scheduler_interval}],
         )
 
-    def forward(self, batch):
-        decoder = RNNTBeamSearch(self.model, self.blank_idx)
+    def decode(self, batch, beam_width=20, decoder="beam"):
+        """Returns the best transcript of every utterance of ``batch``, searched for all of them together.
+
+        ``decoder`` is one of ``"beam"``, ``"modified_beam"`` and ``"greedy"``; the greedy search ignores
+        ``beam_width``.
+        """
+        search = _decoders[decoder](self.model, self.blank_idx)
         x = self.frontend(batch.inputs.to(self.device))
-        hypotheses = decoder(x, batch.input_lengths.to(self.device), beam_width=20)
-        return post_process_hypos(hypotheses, self.sp_model)[0][0]
+        lengths = batch.input_lengths.to(self.device)
+        nbest_lists = search(x, lengths) if decoder == "greedy" else search(x, lengths, beam_width)
+        return [post_process_hypos(hypotheses, self.sp_model)[0][0] for hypotheses in nbest_lists]
+
+    def forward(self, batch):
+        return self.decode(batch)[0]
 
     def training_step(self, batch, batch_idx):
         loss = self._step(batch, batch_idx, "train")
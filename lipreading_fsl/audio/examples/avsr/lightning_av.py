@@ -14,13 +14,32 @@ from models.fusion import fusion_module
 from models.resnet import video_resnet
 from models.resnet1d import audio_resnet
 from pytorch_lightning import LightningModule
+from rnnt_loss import chunked_rnnt_loss
 from schedulers import WarmupCosineScheduler
-from torchaudio.models import Hypothesis, RNNTBeamSearch
+from torchaudio.models import Hypothesis, RNNTBatchBeamSearch, RNNTGreedySearch, RNNTModifiedBeamSearch
 
 
 _expected_spm_vocab_size = 1023
 
-AVBatch = namedtuple("AVBatch", ["audios", "videos", "audio_lengths", "video_lengths", "targets", "target_lengths"])
+_decoders = {
+    "beam": RNNTBatchBeamSearch,
+    "modified_beam": RNNTModifiedBeamSearch,
+    "greedy": RNNTGreedySearch,
+}
+
+
+class AVBatch(
+    namedtuple("AVBatch", ["audios", "videos", "audio_lengths", "video_lengths", "targets", "target_lengths"])
+):
+    """Padded mini-batch. Implements ``pin_memory`` so that ``DataLoader(pin_memory=True)`` pins every field."""
+
+    __slots__ = ()
+
+    def pin_memory(self):
+        return type(self)(*(elem.pin_memory() for elem in self))
+
+    def to(self, device, non_blocking=False):
+        return type(self)(*(elem.to(device, non_blocking=non_blocking) for elem in self))
 
 
 def post_process_hypos(
@@ -60,9 +79,15 @@ class AVConformerRNNTModule(LightningModule):
         self.blank_idx = spm_vocab_size
 
         self.audio_frontend = audio_resnet()
-        self.video_frontend = video_resnet()
+        self.video_frontend = video_resnet(channels_last=getattr(args, "channels_last", False))
         self.fusion = fusion_module()
 
+        self.video_augment = None
+        if getattr(args, "gpu_augment", False):
+            from transforms import BatchedVideoAugment
+
+            self.video_augment = BatchedVideoAugment()
+
         frontend_params = [self.video_frontend.parameters(), self.audio_frontend.parameters()]
         fusion_params = [self.fusion.parameters()]
 
@@ -71,15 +96,77 @@ class AVConformerRNNTModule(LightningModule):
         if args.mode == "offline":
             self.model = conformer_rnnt()
 
+        # Frozen front-ends are kept in eval mode and out of the optimizer; with a feature cache the batches
+        # then carry their precomputed, concatenated outputs instead of frames and waveforms.
+        self.freeze_frontend = getattr(args, "freeze_frontend", False)
+        self.cached_features = bool(getattr(args, "feature_cache_dir", None))
+        if self.cached_features and not self.freeze_frontend:
+            raise ValueError("Cached front-end features require frozen front-ends (--freeze-frontend).")
+        if self.freeze_frontend:
+            self.video_frontend.requires_grad_(False)
+            self.audio_frontend.requires_grad_(False)
+
         self.loss = torchaudio.transforms.RNNTLoss(reduction="sum")
+        # If set, the joiner and the loss are evaluated on chunks of this many samples to bound their memory.
+        self.rnnt_chunk_size = getattr(args, "rnnt_chunk_size", None)
 
         self.optimizer = torch.optim.AdamW(
-            itertools.chain(*([self.model.parameters()] + frontend_params + fusion_params)),
+            [
+                p
+                for p in itertools.chain(*([self.model.parameters()] + frontend_params + fusion_params))
+                if p.requires_grad
+            ],
             lr=self.args.lr,
             weight_decay=0.06,
             betas=(0.9, 0.98),
         )
 
+    def train(self, mode=True):
+        super().train(mode)
+        if self.freeze_frontend:
+            self.video_frontend.eval()
+            self.audio_frontend.eval()
+        return self
+
+    def frontend_state_dict(self):
+        state_dict = {f"video_frontend.{k}": v for k, v in self.video_frontend.state_dict().items()}
+        state_dict.update({f"audio_frontend.{k}": v for k, v in self.audio_frontend.state_dict().items()})
+        return state_dict
+
+    def extract_frontend_features(self, batch):
+        """Returns the (B, T, 1024) concatenated video and audio front-end features of a batch and their lengths."""
+        video_features = self.video_frontend(batch.videos)
+        audio_features = self.audio_frontend(batch.audios)
+        return torch.cat([video_features, audio_features], dim=-1), batch.video_lengths
+
+    def on_after_batch_transfer(self, batch, dataloader_idx):
+        if self.video_augment is not None and self.trainer.training and not self.cached_features:
+            batch = batch._replace(videos=self.video_augment(batch.videos, batch.video_lengths))
+        return batch
+
+    def _rnnt_loss(self, features, input_lengths, prepended_targets, prepended_target_lengths, targets, target_lengths):
+        if self.rnnt_chunk_size:
+            source_encodings, source_lengths = self.model.transcribe(features, input_lengths)
+            target_encodings, target_encoding_lengths, _ = self.model.predict(
+                prepended_targets, prepended_target_lengths, None
+            )
+            return chunked_rnnt_loss(
+                self.model.join,
+                self.loss,
+                source_encodings,
+                source_lengths,
+                target_encodings,
+                target_encoding_lengths,
+                targets,
+                target_lengths,
+                self.rnnt_chunk_size,
+            )
+
+        output, src_lengths, _, _ = self.model(features, input_lengths, prepended_targets, prepended_target_lengths)
+        # Under fp16/bf16 autocast the joiner output is half precision; the loss is computed in fp32.
+        with torch.autocast(device_type=output.device.type, enabled=False):
+            return self.loss(output.float(), targets, src_lengths, target_lengths)
+
     def _step(self, batch, _, step_type):
         if batch is None:
             return None
@@ -88,15 +175,18 @@ class AVConformerRNNTModule(LightningModule):
         prepended_targets[:, 1:] = batch.targets
         prepended_targets[:, 0] = self.blank_idx
         prepended_target_lengths = batch.target_lengths + 1
-        video_features = self.video_frontend(batch.videos)
-        audio_features = self.audio_frontend(batch.audios)
-        output, src_lengths, _, _ = self.model(
-            self.fusion(torch.cat([video_features, audio_features], dim=-1)),
-            batch.video_lengths,
+        if self.cached_features:
+            features, input_lengths = batch.inputs, batch.input_lengths
+        else:
+            features, input_lengths = self.extract_frontend_features(batch)
+        loss = self._rnnt_loss(
+            self.fusion(features),
+            input_lengths,
             prepended_targets,
             prepended_target_lengths,
+            batch.targets,
+            batch.target_lengths,
         )
-        loss = self.loss(output, batch.targets, src_lengths, batch.target_lengths)
         self.log(f"Losses/{step_type}_loss", loss, on_step=True, on_epoch=True)
 
         return loss
@@ -106,7 +196,7 @@ class AVConformerRNNTModule(LightningModule):
             self.optimizer,
             10,
             self.args.epochs,
-            len(self.trainer.datamodule.train_dataloader()) / self.trainer.num_devices / self.trainer.num_nodes,
+            len(self.trainer.datamodule.train_dataloader()),
         )
         self.lr_scheduler_interval = "step"
         return (
@@ -114,20 +204,26 @@ class AVConformerRNNTModule(LightningModule):
             [{"scheduler": self.warmup_lr_scheduler, "interval": self.lr_scheduler_interval}],
         )
 
-    def forward(self, batch):
-        decoder = RNNTBeamSearch(self.model, self.blank_idx)
+    def decode(self, batch, beam_width=20, decoder="beam"):
+        """Returns the best transcript of every utterance of ``batch``, searched for all of them together.
+
+        ``decoder`` is one of ``"beam"``, ``"modified_beam"`` and ``"greedy"``; the greedy search ignores
+        ``beam_width``.
+        """
+        search = _decoders[decoder](self.model, self.blank_idx)
         video_features = self.video_frontend(batch.videos.to(self.device))
         audio_features = self.audio_frontend(batch.audios.to(self.device))
-        hypotheses = decoder(
-            self.fusion(torch.cat([video_features, audio_features], dim=-1)),
-            batch.video_lengths.to(self.device),
-            beam_width=20,
-        )
-        return post_process_hypos(hypotheses, self.sp_model)[0][0]
+        x = self.fusion(torch.cat([video_features, audio_features], dim=-1))
+        lengths = batch.video_lengths.to(self.device)
+        nbest_lists = search(x, lengths) if decoder == "greedy" else search(x, lengths, beam_width)
+        return [post_process_hypos(hypotheses, self.sp_model)[0][0] for hypotheses in nbest_lists]
+
+    def forward(self, batch):
+        return self.decode(batch)[0]
 
     def training_step(self, batch, batch_idx):
         loss = self._step(batch, batch_idx, "train")
-        batch_size = batch.videos.size(0)
+        batch_size = batch.targets.size(0)
         batch_sizes = self.all_gather(batch_size)
         loss *= batch_sizes.size(0) / batch_sizes.sum()  # world size / batch size
         self.log("monitoring_step", torch.tensor(self.global_step, dtype=torch.float32))
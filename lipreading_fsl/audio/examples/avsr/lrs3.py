@@ -1,21 +1,159 @@
+import functools
+import hashlib
+import itertools
+import json
 import os
 
+import numpy as np
+import sentencepiece as spm
+import torch
 import torchaudio
 import torchvision
 from torch.utils.data import Dataset
 
+PACKED_VIDEO_DTYPE = np.uint8
+PACKED_AUDIO_DTYPE = np.float32
 
-def _load_list(args, *filenames):
-    output = []
-    length = []
-    for filename in filenames:
-        filepath = os.path.join(args.root_dir, "labels", filename)
-        for line in open(filepath).read().splitlines():
+
+class Manifest:
+    """File list of a label CSV stored as NumPy arrays.
+
+    Paths relative to ``root_dir`` are packed into one uint8 buffer indexed by int64 offsets and the
+    lengths are kept as an int32 array. DataLoader workers forked from the main process therefore share
+    a handful of buffers instead of touching the refcounts of two Python objects per sample, which
+    would copy the pages on write.
+    """
+
+    def __init__(self, root_dir, paths, offsets, lengths):
+        self.root_dir = root_dir
+        self.paths = paths
+        self.offsets = offsets
+        self.lengths = lengths
+
+    @classmethod
+    def from_csv(cls, root_dir, filename):
+        rel_paths = []
+        lengths = []
+        for line in open(os.path.join(root_dir, "labels", filename)).read().splitlines():
             dataset, rel_path, input_length = line.split(",")[0], line.split(",")[1], line.split(",")[2]
-            path = os.path.normpath(os.path.join(args.root_dir, dataset, rel_path[:-4] + ".mp4"))
-            length.append(int(input_length))
-            output.append(path)
-    return output, length
+            rel_paths.append(os.path.normpath(os.path.join(dataset, rel_path[:-4] + ".mp4")).encode())
+            lengths.append(int(input_length))
+        offsets = np.zeros(len(rel_paths) + 1, dtype=np.int64)
+        np.cumsum([len(p) for p in rel_paths], out=offsets[1:])
+        paths = np.frombuffer(b"".join(rel_paths), dtype=np.uint8)
+        return cls(root_dir, paths, offsets, np.asarray(lengths, dtype=np.int32))
+
+    @classmethod
+    def load(cls, root_dir, path):
+        with np.load(path) as f:
+            return cls(root_dir, f["paths"], f["offsets"], f["lengths"])
+
+    def save(self, path, mtime):
+        # Written to a temporary file first, so that concurrent DDP ranks never read a partial manifest.
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, paths=self.paths, offsets=self.offsets, lengths=self.lengths, mtime=np.float64(mtime))
+        os.replace(tmp_path, path)
+
+    def __getitem__(self, n):
+        rel_path = self.paths[self.offsets[n] : self.offsets[n + 1]].tobytes().decode()
+        return os.path.join(self.root_dir, rel_path)
+
+    def __len__(self):
+        return len(self.lengths)
+
+
+@functools.lru_cache(maxsize=None)
+def _load_manifest(root_dir, filename, mtime):
+    # The binary manifest next to the label file is only reused if it was built from the same revision
+    # of the CSV; ``mtime`` is also part of the in-memory cache key for the same reason.
+    manifest_path = os.path.join(root_dir, "labels", filename + ".manifest.npz")
+    if os.path.exists(manifest_path):
+        with np.load(manifest_path) as f:
+            cached_mtime = float(f["mtime"])
+        if cached_mtime == mtime:
+            return Manifest.load(root_dir, manifest_path)
+    manifest = Manifest.from_csv(root_dir, filename)
+    try:
+        manifest.save(manifest_path, mtime)
+    except OSError:
+        pass
+    return manifest
+
+
+def _load_list(args, filename):
+    mtime = os.path.getmtime(os.path.join(args.root_dir, "labels", filename))
+    manifest = _load_manifest(os.path.normpath(args.root_dir), filename, mtime)
+    return manifest, manifest.lengths
+
+
+class TokenCache:
+    """SentencePiece token IDs of every transcript of a dataset.
+
+    The IDs of all transcripts are concatenated into one int16 array (int32 for vocabularies that do
+    not fit) indexed by int64 offsets, so a target is a slice instead of a text file read and an
+    ``encode`` call per sample and epoch.
+    """
+
+    def __init__(self, tokens, offsets):
+        self.tokens = tokens
+        self.offsets = offsets
+
+    @classmethod
+    def from_transcripts(cls, transcripts, sp_model):
+        token_ids = sp_model.encode([transcript.lower() for transcript in transcripts])
+        dtype = np.int16 if sp_model.get_piece_size() <= np.iinfo(np.int16).max else np.int32
+        offsets = np.zeros(len(token_ids) + 1, dtype=np.int64)
+        np.cumsum([len(ids) for ids in token_ids], out=offsets[1:])
+        tokens = np.fromiter(itertools.chain.from_iterable(token_ids), dtype=dtype, count=int(offsets[-1]))
+        return cls(tokens, offsets)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            return cls(f["tokens"], f["offsets"])
+
+    def save(self, path, mtime):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, tokens=self.tokens, offsets=self.offsets, mtime=np.float64(mtime))
+        os.replace(tmp_path, path)
+
+    def __getitem__(self, n):
+        """
+        rtype: torch, T int32
+        """
+        return torch.from_numpy(self.tokens[self.offsets[n] : self.offsets[n + 1]].astype(np.int32))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+
+@functools.lru_cache(maxsize=None)
+def _hash_file(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()[:16]
+
+
+def _load_tokens(cache_prefix, sp_model_path, mtime, get_transcripts):
+    """Loads the token cache of ``sp_model_path``, building it from ``get_transcripts()`` if it is missing.
+
+    The cache file is keyed by the hash of the SentencePiece model and only reused if it was built from
+    the transcripts as of ``mtime``.
+    """
+    cache_path = f"{cache_prefix}.tokens-{_hash_file(sp_model_path)}.npz"
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as f:
+            cached_mtime = float(f["mtime"])
+        if cached_mtime == mtime:
+            return TokenCache.load(cache_path)
+    sp_model = spm.SentencePieceProcessor(model_file=sp_model_path)
+    tokens = TokenCache.from_transcripts(get_transcripts(), sp_model)
+    try:
+        tokens.save(cache_path, mtime)
+    except OSError:
+        pass
+    return tokens
 
 
 def load_video(path):
@@ -35,25 +173,66 @@ def load_audio(path):
     return waveform.transpose(1, 0)
 
 
+def load_audiovisual(path):
+    """
+    Decodes the audio and the video stream of ``path`` in a single pass over the container.
+    Frames are converted to grayscale and audio is resampled to 16 kHz mono by the FFmpeg filter graph.
+
+    rtype: (torch, T x 1), (torch, T x 1 x H x W)
+    """
+    reader = torchaudio.io.StreamReader(path)
+    reader.add_audio_stream(
+        frames_per_chunk=-1,
+        buffer_chunk_size=-1,
+        filter_desc="aresample=16000,aformat=sample_fmts=fltp:channel_layouts=mono",
+    )
+    reader.add_video_stream(frames_per_chunk=-1, buffer_chunk_size=-1, filter_desc="format=gray")
+    reader.process_all_packets()
+    audio, video = reader.pop_chunks()
+    if audio is None:
+        raise ValueError(f"No audio frames could be decoded from {path}.")
+    if video is None:
+        raise ValueError(f"No video frames could be decoded from {path}.")
+    # The chunks are ChunkTensor wrappers; operations on them return plain tensors.
+    return audio.clone(), video.clone()
+
+
+def get_transcript_path(path):
+    return path.replace("video_seg", "text_seg")[:-4] + ".txt"
+
+
 def load_transcript(path):
-    transcript_path = path.replace("video_seg", "text_seg")[:-4] + ".txt"
-    return open(transcript_path).read().splitlines()[0]
+    return open(get_transcript_path(path)).read().splitlines()[0]
 
 
-def load_item(path, modality):
+def load_media(path, modality):
     if modality == "video":
-        return (load_video(path), load_transcript(path))
+        return (load_video(path),)
     if modality == "audio":
-        return (load_audio(path), load_transcript(path))
+        return (load_audio(path),)
     if modality == "audiovisual":
-        return (load_audio(path), load_video(path), load_transcript(path))
+        return load_audiovisual(path)
+
+
+def load_item(path, modality):
+    return (*load_media(path, modality), load_transcript(path))
 
 
 class LRS3(Dataset):
+    """
+    Args:
+        args (Namespace): needs ``root_dir`` and ``modality``.
+        subset (str, optional): one of ``"train"``, ``"val"`` and ``"test"``. (Default: ``"train"``)
+        sp_model_path (str or None, optional): if given, samples end with the int32 token IDs of the
+            transcript instead of its text. They are read from a cache next to the file list that is built
+            on first use and rebuilt once the file list or any transcript file is modified. (Default: ``None``)
+    """
+
     def __init__(
         self,
         args,
         subset: str = "train",
+        sp_model_path=None,
     ) -> None:
 
         if subset is not None and subset not in ["train", "val", "test"]:
@@ -62,15 +241,121 @@ class LRS3(Dataset):
         self.args = args
 
         if subset == "train":
-            self.files, self.lengths = _load_list(self.args, "lrs3_train_transcript_lengths_seg16s.csv")
+            filename = "lrs3_train_transcript_lengths_seg16s.csv"
         if subset == "val":
-            self.files, self.lengths = _load_list(self.args, "lrs3_test_transcript_lengths_seg16s.csv")
+            filename = "lrs3_test_transcript_lengths_seg16s.csv"
         if subset == "test":
-            self.files, self.lengths = _load_list(self.args, "lrs3_test_transcript_lengths_seg16s.csv")
+            filename = "lrs3_test_transcript_lengths_seg16s.csv"
+        self.files, self.lengths = _load_list(self.args, filename)
+
+        self.tokens = None
+        if sp_model_path is not None:
+            label_path = os.path.join(args.root_dir, "labels", filename)
+            # The targets are read from the transcript files, so the cache is keyed by the latest modification
+            # of the file list and of every transcript, at the cost of a stat, not an open, per file.
+            mtime = os.path.getmtime(label_path)
+            for n in range(len(self.files)):
+                mtime = max(mtime, os.path.getmtime(get_transcript_path(self.files[n])))
+            self.tokens = _load_tokens(
+                label_path,
+                sp_model_path,
+                mtime,
+                lambda: [load_transcript(self.files[n]) for n in range(len(self.files))],
+            )
 
     def __getitem__(self, n):
         path = self.files[n]
+        if self.tokens is not None:
+            return (*load_media(path, self.args.modality), self.tokens[n])
         return load_item(path, self.args.modality)
 
     def __len__(self) -> int:
         return len(self.files)
+
+
+class PackedLRS3(Dataset):
+    """LRS3-compatible dataset reading the shards written by ``pack_lrs3.py``.
+
+    Frames (T x 1 x H x W, uint8) and waveforms (T x 1, float32) are memory-mapped,
+    so a sample is returned as a zero-copy view of the shard instead of a decoded MP4.
+    If ``sp_model_path`` is given, samples end with the token IDs of the transcript, as in ``LRS3``.
+    """
+
+    def __init__(
+        self,
+        args,
+        subset: str = "train",
+        sp_model_path=None,
+    ) -> None:
+
+        if subset is not None and subset not in ["train", "val", "test"]:
+            raise ValueError("When `subset` is not None, it must be one of ['train', 'val', 'test'].")
+
+        self.args = args
+        self.packed_dir = os.path.join(args.packed_dir, "train" if subset == "train" else "test")
+
+        self.index = np.load(os.path.join(self.packed_dir, "index.npy"))
+        self.lengths = self.index[:, 2].astype(np.int32)
+        transcripts_path = os.path.join(self.packed_dir, "transcripts.txt")
+        # The transcripts are replaced before the index, so they may list samples that are not indexed yet.
+        self.transcripts = open(transcripts_path).read().splitlines()[: len(self.index)]
+        assert len(self.transcripts) == len(self.index), (
+            f"{len(self.index)} samples are indexed, but only {len(self.transcripts)} transcripts are stored."
+        )
+        self.targets = self.transcripts
+        if sp_model_path is not None:
+            self.targets = _load_tokens(
+                os.path.join(self.packed_dir, "transcripts"),
+                sp_model_path,
+                os.path.getmtime(transcripts_path),
+                lambda: self.transcripts,
+            )
+        with open(os.path.join(self.packed_dir, "meta.json")) as f:
+            meta = json.load(f)
+        self.num_shards = meta["num_shards"]
+        self.frame_shape = tuple(meta["frame_shape"])
+
+        # Shards are mapped lazily so that every DataLoader worker opens its own mapping
+        # instead of pickling the arrays.
+        self._video_shards = None
+        self._audio_shards = None
+
+    def _open_shards(self):
+        # ``mode="c"`` yields writable, copy-on-write views; pages are only read from disk when touched.
+        self._video_shards = [
+            np.memmap(os.path.join(self.packed_dir, f"shard-{k:05d}.video"), dtype=PACKED_VIDEO_DTYPE, mode="c")
+            .reshape(-1, 1, *self.frame_shape)
+            for k in range(self.num_shards)
+        ]
+        self._audio_shards = [
+            np.memmap(os.path.join(self.packed_dir, f"shard-{k:05d}.audio"), dtype=PACKED_AUDIO_DTYPE, mode="c")
+            .reshape(-1, 1)
+            for k in range(self.num_shards)
+        ]
+
+    def load_video(self, n):
+        """
+        rtype: torch, T x 1 x H x W
+        """
+        shard, offset, length = self.index[n, :3]
+        return torch.from_numpy(self._video_shards[shard][offset : offset + length])
+
+    def load_audio(self, n):
+        """
+        rtype: torch, T x 1
+        """
+        shard, offset, length = self.index[n, 0], self.index[n, 3], self.index[n, 4]
+        return torch.from_numpy(self._audio_shards[shard][offset : offset + length])
+
+    def __getitem__(self, n):
+        if self._video_shards is None:
+            self._open_shards()
+        if self.args.modality == "video":
+            return (self.load_video(n), self.targets[n])
+        if self.args.modality == "audio":
+            return (self.load_audio(n), self.targets[n])
+        if self.args.modality == "audiovisual":
+            return (self.load_audio(n), self.load_video(n), self.targets[n])
+
+    def __len__(self) -> int:
+        return len(self.index)
@@ -1,3 +1,4 @@
+import torch
 import torch.nn as nn
 
 
@@ -176,14 +177,17 @@ def threeD_to_2D_tensor(x):
 class Conv3dResNet(nn.Module):
     """Conv3dResNet module"""
 
-    def __init__(self, backbone_type="resnet", relu_type="swish"):
+    def __init__(self, backbone_type="resnet", relu_type="swish", channels_last=False):
         """__init__.
         :param backbone_type: str, the type of a visual front-end.
         :param relu_type: str, activation function used in an audio front-end.
+        :param channels_last: bool, if True, the convolutions run in channels-last memory format,
+            which lets cuDNN use the tensor-core kernels under fp16/bf16 autocast.
         """
         super(Conv3dResNet, self).__init__()
 
         self.backbone_type = backbone_type
+        self.channels_last = channels_last
 
         self.frontend_nout = 64
         self.trunk = ResNet(
@@ -217,6 +221,9 @@ class Conv3dResNet(nn.Module):
                 padding=(0, 1, 1),
             ),
         )
+        if channels_last:
+            self.frontend3D.to(memory_format=torch.channels_last_3d)
+            self.trunk.to(memory_format=torch.channels_last)
 
     def forward(self, xs_pad):
         """forward.
@@ -225,13 +232,17 @@ class Conv3dResNet(nn.Module):
         # -- include Channel dimension
         xs_pad = xs_pad.transpose(2, 1)
         B, C, T, H, W = xs_pad.size()
+        if self.channels_last:
+            xs_pad = xs_pad.contiguous(memory_format=torch.channels_last_3d)
         xs_pad = self.frontend3D(xs_pad)
         Tnew = xs_pad.shape[2]  # outpu should be B x C2 x Tnew x H x W
         xs_pad = threeD_to_2D_tensor(xs_pad)
+        if self.channels_last:
+            xs_pad = xs_pad.contiguous(memory_format=torch.channels_last)
         xs_pad = self.trunk(xs_pad)
         xs_pad = xs_pad.view(B, Tnew, xs_pad.size(1))
         return xs_pad
 
 
-def video_resnet():
-    return Conv3dResNet()
+def video_resnet(channels_last=False):
+    return Conv3dResNet(channels_last=channels_last)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""Packs a preprocessed LRS3/GLips subset into sharded, memory-mappable files.
+
+Every clip listed in the label CSV of `[root_dir]` is decoded once, the mouth
+crops are converted to grayscale uint8 frames and the 16 kHz waveform is kept as
+float32. Frames and waveforms are appended to large shard files under
+`[packed_dir]/[subset]`, together with an offset index and the transcripts, so that
+`PackedLRS3` can serve a sample as a zero-copy slice instead of decoding the MP4.
+
+Example:
+python pack_lrs3.py --root-dir [root_dir] --packed-dir [packed_dir] --subset train
+"""
+
+import json
+import logging
+import os
+from argparse import ArgumentParser, RawTextHelpFormatter
+
+import numpy as np
+import torch
+import torchvision
+from lrs3 import LRS3, PACKED_AUDIO_DTYPE, PACKED_VIDEO_DTYPE
+
+logger = logging.getLogger(__name__)
+
+
+class ShardWriter:
+    """Appends frames and waveforms to numbered shard files and records their offsets.
+
+    Args:
+        output_dir (str): directory the shards, the index and the transcripts are written to.
+        shard_size (int): number of bytes after which a new shard is started.
+        resume (bool, optional): whether to keep the samples indexed in ``output_dir`` and append to a new
+            shard after them. Data written after the last ``flush`` is then discarded. (Default: ``False``)
+
+    A shard is only created by the first sample written to it, so that the index never lists an empty shard.
+    """
+
+    def __init__(self, output_dir, shard_size, resume=False):
+        self.output_dir = output_dir
+        self.shard_size = shard_size
+        self.shard = -1
+        self.index = []
+        self.transcripts = []
+        self.frame_shape = None
+        self.video_file = None
+        self.audio_file = None
+        if resume and os.path.exists(os.path.join(output_dir, "meta.json")):
+            with open(os.path.join(output_dir, "meta.json")) as f:
+                meta = json.load(f)
+            self.shard = meta["num_shards"] - 1
+            self.frame_shape = None if meta["frame_shape"] is None else tuple(meta["frame_shape"])
+            self.index = np.load(os.path.join(output_dir, "index.npy")).tolist()
+            with open(os.path.join(output_dir, "transcripts.txt")) as f:
+                # The transcripts are replaced before the index, so they may list samples that were never indexed.
+                self.transcripts = f.read().splitlines()[: len(self.index)]
+            assert len(self.transcripts) == len(self.index), (
+                f"{len(self.index)} samples are indexed, but only {len(self.transcripts)} transcripts are stored."
+            )
+
+    def _next_shard(self):
+        if self.video_file is not None:
+            self.video_file.close()
+            self.audio_file.close()
+        self.shard += 1
+        self.video_file = open(os.path.join(self.output_dir, f"shard-{self.shard:05d}.video"), "wb")
+        self.audio_file = open(os.path.join(self.output_dir, f"shard-{self.shard:05d}.audio"), "wb")
+        self.video_offset = 0
+        self.audio_offset = 0
+        self.num_bytes = 0
+
+    def write(self, audio, video, transcript):
+        """Appends one sample.
+
+        :param audio: torch.Tensor, T x 1 float waveform sampled at 16 kHz.
+        :param video: torch.Tensor, T x C x H x W uint8 frames.
+        :param transcript: str, transcript of the clip.
+        """
+        if video.size(1) == 3:
+            video = torchvision.transforms.functional.rgb_to_grayscale(video)
+        if self.frame_shape is None:
+            self.frame_shape = tuple(video.shape[2:])
+        assert tuple(video.shape[2:]) == self.frame_shape, f"Expected {self.frame_shape} frames, got {video.shape}."
+
+        video = video.numpy().astype(PACKED_VIDEO_DTYPE, copy=False)
+        audio = audio.numpy().astype(PACKED_AUDIO_DTYPE, copy=False).reshape(-1)
+        if self.video_file is None or (
+            self.num_bytes > 0 and self.num_bytes + video.nbytes + audio.nbytes > self.shard_size
+        ):
+            self._next_shard()
+
+        self.video_file.write(video.tobytes())
+        self.audio_file.write(audio.tobytes())
+        self.index.append([self.shard, self.video_offset, video.shape[0], self.audio_offset, audio.shape[0]])
+        self.transcripts.append(" ".join(transcript.splitlines()))
+        self.video_offset += video.shape[0]
+        self.audio_offset += audio.shape[0]
+        self.num_bytes += video.nbytes + audio.nbytes
+
+    def flush(self):
+        """Writes the index of all samples appended so far, so that they are readable by ``PackedLRS3``."""
+        if self.video_file is not None:
+            self.video_file.flush()
+            self.audio_file.flush()
+        # Every file is replaced atomically, the index last, so that it never refers to a shard or a transcript
+        # that is not recorded yet.
+        tmp = f".{os.getpid()}.tmp"
+        with open(os.path.join(self.output_dir, f"index.npy{tmp}"), "wb") as f:
+            np.save(f, np.asarray(self.index, dtype=np.int64).reshape(-1, 5))
+        with open(os.path.join(self.output_dir, f"transcripts.txt{tmp}"), "w") as f:
+            # Every transcript ends with a newline, so that an empty last one is not lost by ``splitlines``.
+            f.write("".join(f"{transcript}\n" for transcript in self.transcripts))
+        with open(os.path.join(self.output_dir, f"meta.json{tmp}"), "w") as f:
+            json.dump({"num_shards": self.shard + 1, "frame_shape": self.frame_shape, "sample_rate": 16000}, f)
+        for name in ["meta.json", "transcripts.txt", "index.npy"]:
+            os.replace(os.path.join(self.output_dir, f"{name}{tmp}"), os.path.join(self.output_dir, name))
+
+    def close(self):
+        self.flush()
+        if self.video_file is not None:
+            self.video_file.close()
+            self.audio_file.close()
+
+
+def pack(args):
+    dataset = LRS3(args, subset=args.subset)
+    dataloader = torch.utils.data.DataLoader(dataset, batch_size=None, num_workers=args.num_workers)
+
+    output_dir = os.path.join(args.packed_dir, args.subset)
+    os.makedirs(output_dir, exist_ok=True)
+    writer = ShardWriter(output_dir, int(args.shard_size * 1024**3))
+    for idx, (audio, video, transcript) in enumerate(dataloader):
+        writer.write(audio, video, transcript)
+        if idx % 1000 == 0:
+            logger.info(f"Packed {idx} / {len(dataset)} samples into {writer.shard + 1} shard(s).")
+    writer.close()
+    logger.info(f"Packed {len(dataset)} samples into {writer.shard + 1} shard(s) in {output_dir}.")
+
+
+def parse_args():
+    parser = ArgumentParser(description=__doc__, formatter_class=RawTextHelpFormatter)
+    parser.add_argument(
+        "--root-dir",
+        type=str,
+        help="Root directory to the preprocessed LRS3 audio-visual datasets.",
+        required=True,
+    )
+    parser.add_argument(
+        "--packed-dir",
+        type=str,
+        help="Directory to write the packed shards to.",
+        required=True,
+    )
+    parser.add_argument(
+        "--subset",
+        type=str,
+        help="Subset to pack.",
+        choices=["train", "test"],
+        required=True,
+    )
+    parser.add_argument(
+        "--shard-size",
+        default=4.0,
+        type=float,
+        help="Maximal size of a shard in GiB. (Default: 4.0)",
+    )
+    parser.add_argument(
+        "--num-workers",
+        default=10,
+        type=int,
+        help="Number of workers decoding the source files. (Default: 10)",
+    )
+    args = parser.parse_args()
+    args.modality = "audiovisual"
+    return args
+
+
+def cli_main():
+    logging.basicConfig(format="%(asctime)s %(message)s", level=logging.INFO, datefmt="%Y-%m-%d %H:%M:%S")
+    pack(parse_args())
+
+
+if __name__ == "__main__":
+    cli_main()
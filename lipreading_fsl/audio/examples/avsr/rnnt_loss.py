@@ -0,0 +1,66 @@
+import torch
+from torch.utils.checkpoint import checkpoint
+
+
+def _join_and_loss(
+    join,
+    loss_fn,
+    source_encodings,
+    source_lengths,
+    target_encodings,
+    target_encoding_lengths,
+    targets,
+    target_lengths,
+):
+    output, source_lengths, _ = join(source_encodings, source_lengths, target_encodings, target_encoding_lengths)
+    # Under fp16/bf16 autocast the joiner output is half precision; the loss is computed in fp32.
+    with torch.autocast(device_type=output.device.type, enabled=False):
+        return loss_fn(output.float(), targets, source_lengths, target_lengths)
+
+
+def chunked_rnnt_loss(
+    join,
+    loss_fn,
+    source_encodings,
+    source_lengths,
+    target_encodings,
+    target_encoding_lengths,
+    targets,
+    target_lengths,
+    chunk_size,
+):
+    """Evaluates the joiner and the RNN-T loss on chunks of ``chunk_size`` samples instead of the whole batch.
+
+    Every chunk is cropped to its own longest source and target, and its joiner output is recomputed in the
+    backward pass instead of being kept, so only one (chunk_size, T, U + 1, num_symbols) tensor is alive at a
+    time. The result equals ``loss_fn`` applied to the joiner output of the whole batch.
+
+    :param join: callable, ``RNNT.join``.
+    :param loss_fn: callable, RNN-T loss with ``reduction="sum"``.
+    :param source_encodings: torch.Tensor, (B, T, D) output of ``RNNT.transcribe``.
+    :param source_lengths: torch.Tensor, (B,) valid lengths of ``source_encodings``.
+    :param target_encodings: torch.Tensor, (B, U + 1, D) output of ``RNNT.predict`` on the blank-prepended targets.
+    :param target_encoding_lengths: torch.Tensor, (B,) valid lengths of ``target_encodings``.
+    :param targets: torch.Tensor, (B, U) int32 targets.
+    :param target_lengths: torch.Tensor, (B,) int32 valid lengths of ``targets``.
+    :param chunk_size: int, number of samples per chunk.
+    rtype: torch, summed loss of the batch.
+    """
+    loss = source_encodings.new_zeros((), dtype=torch.float32)
+    for start in range(0, source_encodings.size(0), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        max_source_length = int(source_lengths[chunk].max())
+        max_target_length = int(target_lengths[chunk].max())
+        loss = loss + checkpoint(
+            _join_and_loss,
+            join,
+            loss_fn,
+            source_encodings[chunk, :max_source_length],
+            source_lengths[chunk],
+            target_encodings[chunk, : max_target_length + 1],
+            target_encoding_lengths[chunk],
+            targets[chunk, :max_target_length].contiguous(),
+            target_lengths[chunk],
+            use_reentrant=False,
+        )
+    return loss
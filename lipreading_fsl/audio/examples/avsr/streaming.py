@@ -0,0 +1,208 @@
+import math
+from collections import defaultdict
+
+import torch
+from lightning_av import post_process_hypos
+from torchaudio.models import RNNTBatchBeamSearch
+
+_AUDIO_SAMPLES_PER_FRAME = 640
+
+
+def batch_states(states):
+    """Concatenates the Emformer states of several streams along their batch dimension.
+
+    :param states: list, ``transcribe_streaming`` states of batch size 1, or ``None`` for new streams.
+    rtype: list or None, batched state, ``None`` if every stream is new.
+    """
+    if all(state is None for state in states):
+        return None
+    return [
+        [torch.cat([state[layer][i] for state in states], dim=1) for i in range(len(states[0][layer]))]
+        for layer in range(len(states[0]))
+    ]
+
+
+def split_state(state, idx):
+    """Returns the Emformer state of the ``idx``-th stream of a batched state."""
+    return [[s[:, idx : idx + 1] for s in layer] for layer in state]
+
+
+class StreamingSession:
+    """Input buffer, left context and decoder state of one audio-visual stream."""
+
+    def __init__(self):
+        self.video_chunks = []
+        self.audio_chunks = []
+        self.num_frames = 0
+        self.context_video = None
+        self.context_audio = None
+        self.state = None
+        self.hypotheses = None
+        self.closing = False
+
+    def push(self, video, audio):
+        self.video_chunks.append(video)
+        self.audio_chunks.append(audio)
+        self.num_frames += video.size(0)
+
+    def take(self, num_frames, num_consumed):
+        """Returns the first ``num_frames`` buffered frames and drops the first ``num_consumed`` of them."""
+        video = torch.cat(self.video_chunks)
+        audio = torch.cat(self.audio_chunks)
+        num_frames = min(num_frames, video.size(0))
+        num_consumed = min(num_consumed, video.size(0))
+        self.video_chunks = [video[num_consumed:]]
+        self.audio_chunks = [audio[num_consumed * _AUDIO_SAMPLES_PER_FRAME :]]
+        self.num_frames -= num_consumed
+        return video[:num_frames], audio[: num_frames * _AUDIO_SAMPLES_PER_FRAME]
+
+
+class StreamingAVSREngine:
+    """Decodes many audio-visual streams incrementally with the Emformer RNN-T model of ``--mode online``.
+
+    Every stream is a session that receives synchronized chunks of preprocessed video frames and audio
+    samples of any length. Once a session has buffered a full Emformer segment (and its right context),
+    ``step`` runs the front-ends, ``RNNT.transcribe_streaming`` and the beam search on that segment,
+    carrying the Emformer state and the hypotheses of the session over to its next segment. The segments
+    of all ready sessions are processed together, in batches of sessions whose Emformer states have the
+    same history length.
+
+    Each segment is preceded by the last ``context_length`` frames of the preceding one (zeros for the first
+    segment), so that the convolutional front-ends see the same neighbourhood as for the whole clip; their
+    features are dropped before the transcription network.
+
+    Args:
+        module (AVConformerRNNTModule): module trained with ``--mode online``, in eval mode.
+        beam_width (int, optional): beam size of the search. (Default: 10)
+        context_length (int, optional): number of frames of left context for the front-ends. (Default: 4)
+        max_batch_size (int, optional): maximum number of sessions decoded together. (Default: 32)
+    """
+
+    def __init__(self, module, beam_width=10, context_length=4, max_batch_size=32):
+        self.module = module
+        self.beam_width = beam_width
+        self.context_length = context_length
+        self.max_batch_size = max_batch_size
+        self.decoder = RNNTBatchBeamSearch(module.model, module.blank_idx)
+        self.sessions = {}
+
+        transcriber = module.model.transcriber
+        self.emformer = transcriber.transformer
+        stride = transcriber.time_reduction.stride
+        self.segment_length = self.emformer.segment_length * stride
+        self.right_context_length = self.emformer.right_context_length * stride
+
+    def open_session(self, session_id):
+        if session_id in self.sessions:
+            raise ValueError(f"Session {session_id} is already open.")
+        self.sessions[session_id] = StreamingSession()
+
+    def push(self, session_id, video, audio):
+        """Appends a chunk to the input of a session.
+
+        :param session_id: hashable, id of an open session.
+        :param video: torch.Tensor, (T, 1, 88, 88) preprocessed video frames.
+        :param audio: torch.Tensor, (T * 640, 1) preprocessed audio samples of the same frames.
+        """
+        if audio.size(0) != video.size(0) * _AUDIO_SAMPLES_PER_FRAME:
+            raise ValueError(
+                f"Expected {video.size(0) * _AUDIO_SAMPLES_PER_FRAME} audio samples for {video.size(0)} "
+                f"video frames, but got {audio.size(0)}."
+            )
+        session = self.sessions[session_id]
+        if session.closing:
+            raise ValueError(f"Session {session_id} is closing.")
+        session.push(video, audio)
+
+    def close_session(self, session_id):
+        """Decodes the remaining input of a session, removes it and returns its final transcript."""
+        session = self.sessions[session_id]
+        session.closing = True
+        while session.num_frames > 0:
+            self._decode([session])
+        del self.sessions[session_id]
+        return self._transcript(session)
+
+    def step(self):
+        """Decodes one segment of every session with enough buffered input.
+
+        rtype: dict, partial transcript of every session that was decoded, by session id.
+        """
+        return {session_id: self._transcript(self.sessions[session_id]) for session_id in self._decode_step()}
+
+    def is_ready(self, session_id):
+        """Whether the next ``step`` decodes a segment of the session, i.e. it has buffered enough input."""
+        session = self.sessions[session_id]
+        return session.num_frames >= self.segment_length + self.right_context_length or (
+            session.closing and session.num_frames > 0
+        )
+
+    def _state_key(self, state):
+        # Emformer slices the cached left context and memory of a whole batch by the history length of its
+        # first element, which is the same for all streams once it exceeds both.
+        if state is None:
+            return None
+        past_length = int(state[0][3][0, 0])
+        return (
+            min(self.emformer.left_context_length, past_length),
+            min(self.emformer.max_memory_size, math.ceil(past_length / self.emformer.segment_length)),
+        )
+
+    def _decode_step(self):
+        groups = defaultdict(list)
+        for session_id, session in self.sessions.items():
+            if self.is_ready(session_id):
+                groups[self._state_key(session.state)].append(session_id)
+        for session_ids in groups.values():
+            for start in range(0, len(session_ids), self.max_batch_size):
+                batch_ids = session_ids[start : start + self.max_batch_size]
+                self._decode([self.sessions[session_id] for session_id in batch_ids])
+        return [session_id for session_ids in groups.values() for session_id in session_ids]
+
+    def _get_inputs(self, session):
+        num_input_frames = self.segment_length + self.right_context_length
+        video, audio = session.take(num_input_frames, self.segment_length)
+        num_frames = video.size(0)
+        if session.context_video is None:
+            session.context_video = video.new_zeros((self.context_length,) + video.shape[1:])
+            session.context_audio = audio.new_zeros(
+                (self.context_length * _AUDIO_SAMPLES_PER_FRAME,) + audio.shape[1:]
+            )
+        context_video, context_audio = session.context_video, session.context_audio
+        consumed = min(num_frames, self.segment_length)
+        if self.context_length > 0:
+            session.context_video = torch.cat([context_video, video[:consumed]])[-self.context_length :]
+            session.context_audio = torch.cat([context_audio, audio[: consumed * _AUDIO_SAMPLES_PER_FRAME]])[
+                -self.context_length * _AUDIO_SAMPLES_PER_FRAME :
+            ]
+        pad = num_input_frames - num_frames
+        video = torch.nn.functional.pad(torch.cat([context_video, video]), (0, 0, 0, 0, 0, 0, 0, pad))
+        audio = torch.nn.functional.pad(torch.cat([context_audio, audio]), (0, 0, 0, pad * _AUDIO_SAMPLES_PER_FRAME))
+        return video, audio, num_frames
+
+    def _decode(self, sessions):
+        inputs = [self._get_inputs(session) for session in sessions]
+        device = next(self.module.model.parameters()).device
+        videos = torch.stack([video for video, _, _ in inputs]).to(device)
+        audios = torch.stack([audio for _, audio, _ in inputs]).to(device)
+        lengths = torch.tensor([num_frames for _, _, num_frames in inputs], device=device)
+        with torch.no_grad():
+            video_features = self.module.video_frontend(videos)
+            audio_features = self.module.audio_frontend(audios)
+            features = self.module.fusion(torch.cat([video_features, audio_features], dim=-1))
+            features = features[:, self.context_length :]
+            # Sessions are batched by the history length of their state, so new sessions, which have neither a
+            # state nor hypotheses yet, are never decoded together with running ones.
+            state = batch_states([session.state for session in sessions])
+            hypotheses = None if state is None else [session.hypotheses for session in sessions]
+            hypotheses, state = self.decoder.infer(
+                features, lengths, self.beam_width, state=state, hypothesis=hypotheses
+            )
+        for i, session in enumerate(sessions):
+            session.state = split_state(state, i)
+            session.hypotheses = hypotheses[i]
+
+    def _transcript(self, session):
+        if session.hypotheses is None:
+            return ""
+        return post_process_hypos(session.hypotheses, self.module.sp_model)[0][0]
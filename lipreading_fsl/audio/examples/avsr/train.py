@@ -3,7 +3,9 @@ import os
 from argparse import ArgumentParser
 
 import sentencepiece as spm
+import torch
 from average_checkpoints import ensemble
+from ema import EMA
 from pytorch_lightning import seed_everything, Trainer
 from pytorch_lightning.callbacks import LearningRateMonitor, ModelCheckpoint
 from pytorch_lightning.strategies import DDPStrategy
@@ -19,13 +21,16 @@ def get_trainer(args):
         mode="max",
         save_last=True,
         filename="{epoch}",
-        save_top_k=10,
+        # The last ten epochs are averaged after training, unless the EMA weights are kept instead.
+        save_top_k=1 if args.ema_decay else 10,
     )
     lr_monitor = LearningRateMonitor(logging_interval="step")
     callbacks = [
         checkpoint,
         lr_monitor,
     ]
+    if args.ema_decay:
+        callbacks.append(EMA(args.ema_decay, args.ema_every_n_steps))
     return Trainer(
         sync_batchnorm=True,
         default_root_dir=args.exp_dir,
@@ -35,8 +40,10 @@ def get_trainer(args):
         accelerator="gpu",
         strategy=DDPStrategy(find_unused_parameters=False),
         callbacks=callbacks,
+        use_distributed_sampler=False,
         reload_dataloaders_every_n_epochs=1,
-        gradient_clip_val=10.0
+        gradient_clip_val=10.0,
+        precision=args.precision,
     )
 
 
@@ -74,6 +81,12 @@ def parse_args():
         help="Root directory to LRS3 audio-visual datasets.",
         required=True,
     )
+    parser.add_argument(
+        "--packed-dir",
+        type=str,
+        help="Directory of the shards written by pack_lrs3.py. If given, samples are read from it "
+        "instead of decoding the MP4 files under --root-dir.",
+    )
     parser.add_argument(
         "--sp-model-path",
         type=str,
@@ -120,6 +133,78 @@ def parse_args():
         type=str,
         help="Path to the checkpoint to resume from",
     )
+    parser.add_argument(
+        "--gpu-augment",
+        action="store_true",
+        help="Whether to run the video augmentation on the GPU. DataLoader workers then return padded uint8 "
+        "frames, which are cropped, flipped and time-masked per sample inside the Lightning module.",
+    )
+    parser.add_argument(
+        "--precision",
+        default="32-true",
+        type=str,
+        choices=["32-true", "16-mixed", "bf16-mixed"],
+        help="Training precision. The mixed modes run the model under autocast and keep the RNN-T loss in fp32. "
+        "(Default: '32-true')",
+    )
+    parser.add_argument(
+        "--rnnt-chunk-size",
+        type=int,
+        help="If given, the joiner and the RNN-T loss are evaluated on chunks of this many samples, recomputing "
+        "the joiner output in the backward pass, instead of materializing it for the whole batch at once.",
+    )
+    parser.add_argument(
+        "--channels-last",
+        action="store_true",
+        help="Whether to run the video front-end in channels-last memory format.",
+    )
+    parser.add_argument(
+        "--freeze-frontend",
+        action="store_true",
+        help="Whether to keep the front-ends fixed, in eval mode and out of the optimizer.",
+    )
+    parser.add_argument(
+        "--feature-cache-dir",
+        type=str,
+        help="If given, the outputs of the frozen front-ends are computed once for the train and val sets, "
+        "stored in memory-mapped files in this directory and read instead of the frames. The stores are keyed "
+        "by a hash of the front-end weights. Requires --freeze-frontend.",
+    )
+    parser.add_argument(
+        "--ema-decay",
+        type=float,
+        help="If given, an exponential moving average of the weights with this decay per update is kept, "
+        "used for validation and testing, saved in the checkpoints and written to model_ema.pth after training "
+        "instead of averaging the last ten checkpoints.",
+    )
+    parser.add_argument(
+        "--ema-every-n-steps",
+        default=1,
+        type=int,
+        help="Number of optimizer steps between updates of the moving average. (Default: 1)",
+    )
+    parser.add_argument(
+        "--num-workers",
+        default=10,
+        type=int,
+        help="Number of DataLoader workers. (Default: 10)",
+    )
+    parser.add_argument(
+        "--prefetch-factor",
+        default=2,
+        type=int,
+        help="Number of batches loaded in advance by each worker. (Default: 2)",
+    )
+    parser.add_argument(
+        "--no-pin-memory",
+        action="store_true",
+        help="Whether to disable pinning the batches in page-locked host memory.",
+    )
+    parser.add_argument(
+        "--no-persistent-workers",
+        action="store_true",
+        help="Whether to fork new DataLoader workers every epoch instead of keeping them alive.",
+    )
     parser.add_argument(
         "--debug",
         action="store_true",
@@ -149,7 +234,13 @@ def cli_main():
     trainer = get_trainer(args)
     trainer.fit(model, data_module)
 
-    ensemble(args)
+    if args.ema_decay:
+        ema = next(callback for callback in trainer.callbacks if isinstance(callback, EMA))
+        if trainer.is_global_zero:
+            model_path = os.path.join(args.exp_dir, args.exp_name, "model_ema.pth")
+            torch.save({"state_dict": ema.averaged_state_dict(model)}, model_path)
+    else:
+        ensemble(args)
 
 
 if __name__ == "__main__":
@@ -1,4 +1,3 @@
-import random
 from typing import List
 
 import sentencepiece as spm
@@ -19,38 +18,159 @@ class FunctionalModule(torch.nn.Module):
 
 
 class AdaptiveTimeMask(torch.nn.Module):
+    """Zeroes one random window shorter than ``window`` frames per ``stride`` valid frames of every sample.
+
+    The windows are drawn independently for every sample and only inside its valid frames.
+    The input is masked in place.
+    """
+
     def __init__(self, window, stride):
         super().__init__()
         self.window = window
         self.stride = stride
 
-    def forward(self, x):
-        cloned = x.clone()
-        length = cloned.size(1)
-        n_mask = int((length + self.stride - 0.1) // self.stride)
-        ts = torch.randint(0, self.window, size=(n_mask, 2))
-        for t, t_end in ts:
-            if length - t <= 0:
-                continue
-            t_start = random.randrange(0, length - t)
-            if t_start == t_start + t:
-                continue
-            t_end += t_start
-            cloned[:, t_start:t_end] = 0
-        return cloned
+    def forward(self, x, lengths=None):
+        """
+        :param x: torch.Tensor, (B, T, ...) padded batch, e.g. (B, T, C, H, W) frames or (B, T, 1) waveforms.
+        :param lengths: torch.Tensor or None, (B,) number of valid frames of every sample.
+            If ``None``, every sample is assumed to span the padded length.
+        """
+        B, T = x.size(0), x.size(1)
+        if lengths is None:
+            lengths = torch.full((B,), T, device=x.device)
+        lengths = lengths.to(device=x.device, dtype=torch.long).unsqueeze(1)
+        n_mask = torch.div(lengths + self.stride - 1, self.stride, rounding_mode="floor")
+        max_n_mask = int(n_mask.max()) if B > 0 else 0
+        if max_n_mask == 0:
+            return x
+
+        widths = torch.randint(0, self.window, (B, max_n_mask), device=x.device)
+        valid = (torch.arange(max_n_mask, device=x.device) < n_mask) & (widths < lengths)
+        starts = (torch.rand(B, max_n_mask, device=x.device) * (lengths - widths).clamp(min=1)).long()
+        # Every window adds 1 from its start and subtracts it at its end, so a frame is masked where the
+        # cumulative sum is positive; this takes O(B * T) memory instead of one (B, T) mask per window.
+        counts = valid.long()
+        delta = torch.zeros(B, T + 1, dtype=torch.long, device=x.device)
+        delta.scatter_add_(1, starts, counts)
+        delta.scatter_add_(1, (starts + widths).clamp(max=T), -counts)
+        mask = delta[:, :T].cumsum(dim=1) > 0
+        return x.masked_fill_(mask.view(B, T, *([1] * (x.dim() - 2))), 0)
+
+
+class BatchedVideoAugment(torch.nn.Module):
+    """Train-time video augmentation for a padded uint8 batch, run on the device of the model.
+
+    Equivalent to the CPU ``train_video_pipeline`` of ``TrainTransform``, except that the crop offset,
+    the horizontal flip and the time masks are drawn independently for every sample.
+
+    Args:
+        crop_size (int, optional): size of the square random crop. (Default: 88)
+        flip_prob (float, optional): probability of flipping a sample horizontally. (Default: 0.5)
+        mask_window (int, optional): maximal width of a time mask. (Default: 10)
+        mask_stride (int, optional): number of frames per time mask. (Default: 25)
+        mean (float, optional): mean used for normalization. (Default: 0.421)
+        std (float, optional): standard deviation used for normalization. (Default: 0.165)
+    """
+
+    def __init__(self, crop_size=88, flip_prob=0.5, mask_window=10, mask_stride=25, mean=0.421, std=0.165):
+        super().__init__()
+        self.crop_size = crop_size
+        self.flip_prob = flip_prob
+        self.time_mask = AdaptiveTimeMask(mask_window, mask_stride)
+        self.mean = mean
+        self.std = std
+        self.register_buffer(
+            "grayscale_weights", torch.tensor([0.2989, 0.587, 0.114]).view(1, 1, 3, 1, 1), persistent=False
+        )
+
+    def forward(self, videos, lengths):
+        """
+        :param videos: torch.Tensor, (B, T, C, H, W) uint8 frames.
+        :param lengths: torch.Tensor, (B,) number of valid frames of every sample.
+        rtype: torch, (B, T, 1, crop_size, crop_size) normalized float frames.
+        """
+        B, T, C, H, W = videos.size()
+        device = videos.device
+        steps = torch.arange(self.crop_size, device=device)
+        rows = torch.randint(0, H - self.crop_size + 1, (B, 1), device=device) + steps
+        cols = torch.randint(0, W - self.crop_size + 1, (B, 1), device=device) + steps
+        flip = torch.rand(B, 1, device=device) < self.flip_prob
+        cols = torch.where(flip, cols.flip(1), cols)
+
+        # Crop on uint8 so that only the kept pixels are converted to float.
+        batch_idx = torch.arange(B, device=device).view(B, 1, 1)
+        x = videos.permute(0, 3, 4, 1, 2)[batch_idx, rows.unsqueeze(2), cols.unsqueeze(1)]
+        x = x.permute(0, 3, 4, 1, 2).float() / 255.0
+        if C == 3:
+            x = (x * self.grayscale_weights).sum(dim=2, keepdim=True)
+
+        x = self.time_mask(x, lengths)
+        return (x - self.mean) / self.std
 
 
 def _extract_labels(sp_model, samples: List):
-    targets = [sp_model.encode(sample[-1].lower()) for sample in samples]
+    # Samples end with either the token IDs from the dataset's token cache or the raw transcript.
+    targets = [
+        sample[-1] if isinstance(sample[-1], torch.Tensor) else torch.tensor(sp_model.encode(sample[-1].lower()))
+        for sample in samples
+    ]
     lengths = torch.tensor([len(elem) for elem in targets]).to(dtype=torch.int32)
     targets = torch.nn.utils.rnn.pad_sequence(
-        [torch.tensor(elem) for elem in targets],
+        targets,
         batch_first=True,
         padding_value=1.0,
     ).to(dtype=torch.int32)
     return targets, lengths
 
 
+class LengthAwareCollate:
+    """Transforms every clip on its own and then writes the clips into one preallocated, zero-padded buffer.
+
+    Cropping and grayscale conversion therefore run on the valid frames only instead of on a batch padded
+    to the longest clip, and the lengths are taken before padding.
+
+    Args:
+        clip_transform (callable or None, optional): applied to every (T, ...) clip before padding,
+            e.g. crop, flip and grayscale conversion. (Default: ``None``)
+        time_mask (AdaptiveTimeMask or None, optional): applied in place to the padded batch,
+            within the valid frames of every clip. (Default: ``None``)
+        normalize (Tuple[float, float] or None, optional): ``(mean, std)``. If given, the buffer is float32,
+            frames are scaled from [0, 255] to [0, 1] and normalized in place. Otherwise the clips keep their
+            dtype. (Default: ``None``)
+        pin_memory (bool, optional): whether to allocate the buffer in pinned memory. This initializes CUDA,
+            so only enable it where the collate function runs in the main process. (Default: ``False``)
+    """
+
+    def __init__(self, clip_transform=None, time_mask=None, normalize=None, pin_memory=False):
+        self.clip_transform = clip_transform
+        self.time_mask = time_mask
+        self.normalize = normalize
+        self.pin_memory = pin_memory
+
+    def __call__(self, clips):
+        """
+        :param clips: List[torch.Tensor], clips of shape (T_i, ...).
+        rtype: (torch, B x T_max x ...), (torch, B) int32 lengths.
+        """
+        if self.clip_transform is not None:
+            clips = [self.clip_transform(clip) for clip in clips]
+        lengths = torch.tensor([clip.size(0) for clip in clips], dtype=torch.int32)
+        dtype = torch.float32 if self.normalize is not None else clips[0].dtype
+        batch = torch.zeros(
+            (len(clips), int(lengths.max()), *clips[0].shape[1:]), dtype=dtype, pin_memory=self.pin_memory
+        )
+        for i, clip in enumerate(clips):
+            batch[i, : clip.size(0)] = clip
+        if self.normalize is not None:
+            batch.div_(255.0)
+        if self.time_mask is not None:
+            self.time_mask(batch, lengths)
+        if self.normalize is not None:
+            mean, std = self.normalize
+            batch.sub_(mean).div_(std)
+        return batch, lengths
+
+
 def _extract_features(video_pipeline, audio_pipeline, samples, args):
     raw_videos = []
     raw_audios = []
@@ -65,13 +185,10 @@ def _extract_features(video_pipeline, audio_pipeline, samples, args):
             raw_videos.append(sample[1][:length])
 
     if args.modality == "video" or args.modality == "audiovisual":
-        videos = torch.nn.utils.rnn.pad_sequence(raw_videos, batch_first=True)
-        videos = video_pipeline(videos)
-        video_lengths = torch.tensor([elem.shape[0] for elem in videos], dtype=torch.int32)
+        videos, video_lengths = video_pipeline(raw_videos)
     if args.modality == "audio" or args.modality == "audiovisual":
-        audios = torch.nn.utils.rnn.pad_sequence(raw_audios, batch_first=True)
-        audios = audio_pipeline(audios)
-        audio_lengths = torch.tensor([elem.shape[0] // 640 for elem in audios], dtype=torch.int32)
+        audios, audio_lengths = audio_pipeline(raw_audios)
+        audio_lengths = audio_lengths // 640
     if args.modality == "video":
         return videos, video_lengths
     if args.modality == "audio":
@@ -84,19 +201,21 @@ class TrainTransform:
     def __init__(self, sp_model_path: str, args):
         self.args = args
         self.sp_model = spm.SentencePieceProcessor(model_file=sp_model_path)
-        self.train_video_pipeline = torch.nn.Sequential(
-            FunctionalModule(lambda x: x / 255.0),
-            torchvision.transforms.RandomCrop(88),
-            torchvision.transforms.RandomHorizontalFlip(0.5),
-            FunctionalModule(lambda x: x.transpose(0, 1)),
-            torchvision.transforms.Grayscale(),
-            FunctionalModule(lambda x: x.transpose(0, 1)),
-            AdaptiveTimeMask(10, 25),
-            torchvision.transforms.Normalize(0.421, 0.165),
-        )
-        self.train_audio_pipeline = torch.nn.Sequential(
-            AdaptiveTimeMask(10, 25),
-        )
+        if getattr(args, "gpu_augment", False):
+            # Padded uint8 frames are returned as they are; ``BatchedVideoAugment`` runs on the GPU instead.
+            self.train_video_pipeline = LengthAwareCollate()
+        else:
+            self.train_video_pipeline = LengthAwareCollate(
+                clip_transform=torch.nn.Sequential(
+                    torchvision.transforms.RandomCrop(88),
+                    torchvision.transforms.RandomHorizontalFlip(0.5),
+                    FunctionalModule(lambda x: x.float()),
+                    torchvision.transforms.Grayscale(),
+                ),
+                time_mask=AdaptiveTimeMask(10, 25),
+                normalize=(0.421, 0.165),
+            )
+        self.train_audio_pipeline = LengthAwareCollate(time_mask=AdaptiveTimeMask(10, 25))
 
     def __call__(self, samples: List):
         targets, target_lengths = _extract_labels(self.sp_model, samples)
@@ -121,17 +240,15 @@ class ValTransform:
     def __init__(self, sp_model_path: str, args):
         self.args = args
         self.sp_model = spm.SentencePieceProcessor(model_file=sp_model_path)
-        self.valid_video_pipeline = torch.nn.Sequential(
-            FunctionalModule(lambda x: x / 255.0),
-            torchvision.transforms.CenterCrop(88),
-            FunctionalModule(lambda x: x.transpose(0, 1)),
-            torchvision.transforms.Grayscale(),
-            FunctionalModule(lambda x: x.transpose(0, 1)),
-            torchvision.transforms.Normalize(0.421, 0.165),
-        )
-        self.valid_audio_pipeline = torch.nn.Sequential(
-            FunctionalModule(lambda x: x),
+        self.valid_video_pipeline = LengthAwareCollate(
+            clip_transform=torch.nn.Sequential(
+                torchvision.transforms.CenterCrop(88),
+                FunctionalModule(lambda x: x.float()),
+                torchvision.transforms.Grayscale(),
+            ),
+            normalize=(0.421, 0.165),
         )
+        self.valid_audio_pipeline = LengthAwareCollate()
 
     def __call__(self, samples: List):
         targets, target_lengths = _extract_labels(self.sp_model, samples)
@@ -159,6 +276,9 @@ class TestTransform:
     def __call__(self, sample):
         return self.val_transforms([sample]), [sample]
 
+    def collate(self, samples):
+        return self.val_transforms(samples), samples
+
 
 def get_data_module(args, sp_model_path, max_frames=100):
     train_transform = TrainTransform(sp_model_path=sp_model_path, args=args)
@@ -170,4 +290,8 @@ def get_data_module(args, sp_model_path, max_frames=100):
         val_transform=val_transform,
         test_transform=test_transform,
         max_frames=max_frames,
+        num_workers=getattr(args, "num_workers", 10),
+        pin_memory=not getattr(args, "no_pin_memory", False),
+        persistent_workers=not getattr(args, "no_persistent_workers", False),
+        prefetch_factor=getattr(args, "prefetch_factor", 2),
     )
@@ -4,7 +4,14 @@ from .conv_tasnet import conv_tasnet_base, ConvTasNet
 from .deepspeech import DeepSpeech
 from .emformer import Emformer
 from .rnnt import emformer_rnnt_base, emformer_rnnt_model, RNNT
-from .rnnt_decoder import Hypothesis, RNNTBeamSearch
+from .rnnt_decoder import (
+    Hypothesis,
+    RNNTBatchBeamSearch,
+    RNNTBeamSearch,
+    RNNTGreedySearch,
+    RNNTModifiedBeamSearch,
+    RNNTTensorBeamSearch,
+)
 from .squim import (
     squim_objective_base,
     squim_objective_model,
@@ -70,6 +77,10 @@ __all__ = [
     "Hypothesis",
     "RNNT",
     "RNNTBeamSearch",
+    "RNNTBatchBeamSearch",
+    "RNNTTensorBeamSearch",
+    "RNNTGreedySearch",
+    "RNNTModifiedBeamSearch",
     "emformer_rnnt_base",
     "emformer_rnnt_model",
     "HDemucs",
@@ -4,7 +4,14 @@ import torch
 from torchaudio.models import RNNT
 
 
-__all__ = ["Hypothesis", "RNNTBeamSearch"]
+__all__ = [
+    "Hypothesis",
+    "RNNTBatchBeamSearch",
+    "RNNTBeamSearch",
+    "RNNTGreedySearch",
+    "RNNTModifiedBeamSearch",
+    "RNNTTensorBeamSearch",
+]
 
 
 Hypothesis = Tuple[List[int], torch.Tensor, List[List[torch.Tensor]], float]
@@ -65,11 +72,65 @@ def _compute_updated_scores(
     return nonblank_nbest_scores, nonblank_nbest_hypo_idx, nonblank_nbest_token
 
 
-def _remove_hypo(hypo: Hypothesis, hypo_list: List[Hypothesis]) -> None:
+def _remove_hypo(hypo: Hypothesis, hypo_list: List[Hypothesis]) -> int:
     for i, elem in enumerate(hypo_list):
         if _get_hypo_key(hypo) == _get_hypo_key(elem):
             del hypo_list[i]
-            break
+            return i
+    return -1
+
+
+# Token sequences are identified by two polynomial rolling hashes with bases 1000003 and 999983 modulo the
+# Mersenne prime 2^31 - 1, packed into one int64 key; all intermediate products fit into int64. The constants
+# are written out as literals, since TorchScript cannot read module globals.
+
+
+def _extend_key(key: int, token: int) -> int:
+    h0 = (key // 2147483648 * 1000003 + token + 1) % 2147483647
+    h1 = (key % 2147483648 * 999983 + token + 1) % 2147483647
+    return h0 * 2147483648 + h1
+
+
+def _get_tokens_key(tokens: List[int]) -> int:
+    key = 0
+    for token in tokens:
+        key = _extend_key(key, token)
+    return key
+
+
+def _hash_keys(hashes: torch.Tensor) -> torch.Tensor:
+    return hashes[:, 0] * 2147483648 + hashes[:, 1]
+
+
+class _PredictorCache:
+    r"""Least-recently-used cache of prediction network outputs and states keyed by token sequence hash."""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.entries: Dict[int, Tuple[torch.Tensor, List[List[torch.Tensor]]]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: int) -> Optional[Tuple[torch.Tensor, List[List[torch.Tensor]]]]:
+        if key in self.entries:
+            # Re-inserting the entry moves it to the end of the insertion order, i.e. marks it most recent.
+            entry = self.entries.pop(key)
+            self.entries[key] = entry
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def put(self, key: int, predictor_out: torch.Tensor, state: List[List[torch.Tensor]]) -> None:
+        if self.max_size <= 0:
+            return
+        self.entries[key] = (predictor_out, state)
+        if len(self.entries) > self.max_size:
+            oldest = key
+            for entry_key in self.entries.keys():
+                oldest = entry_key
+                break
+            del self.entries[oldest]
 
 
 class RNNTBeamSearch(torch.nn.Module):
@@ -87,6 +148,12 @@ class RNNTBeamSearch(torch.nn.Module):
             for a given hypothesis to rank hypotheses by. If ``None``, defaults to callable that returns
             hypothesis score normalized by token sequence length. (Default: None)
         step_max_tokens (int, optional): maximum number of tokens to emit per input time step. (Default: 100)
+        predictor_cache_size (int, optional): maximum number of prediction network outputs and states of
+            expanded hypotheses to keep during a search, so that extending a token sequence that was
+            already extended at a preceding time step does not run the prediction network again.
+            The least recently used entries are dropped first; ``0`` disables the cache. The numbers of
+            cache hits and misses of the latest search are stored in ``predictor_cache_hits`` and
+            ``predictor_cache_misses``. (Default: 1024)
     """
 
     def __init__(
@@ -96,6 +163,7 @@ class RNNTBeamSearch(torch.nn.Module):
         temperature: float = 1.0,
         hypo_sort_key: Optional[Callable[[Hypothesis], float]] = None,
         step_max_tokens: int = 100,
+        predictor_cache_size: int = 1024,
     ) -> None:
         super().__init__()
         self.model = model
@@ -108,6 +176,9 @@ class RNNTBeamSearch(torch.nn.Module):
             self.hypo_sort_key = hypo_sort_key
 
         self.step_max_tokens = step_max_tokens
+        self.predictor_cache_size = predictor_cache_size
+        self.predictor_cache_hits = 0
+        self.predictor_cache_misses = 0
 
     def _init_b_hypos(self, device: torch.device) -> List[Hypothesis]:
         token = self.blank
@@ -143,13 +214,15 @@ class RNNTBeamSearch(torch.nn.Module):
         a_hypos: List[Hypothesis],
         next_token_probs: torch.Tensor,
         key_to_b_hypo: Dict[str, Hypothesis],
-    ) -> List[Hypothesis]:
+        b_keys: List[int],
+        a_keys: List[int],
+    ) -> Tuple[List[Hypothesis], List[int]]:
         for i in range(len(a_hypos)):
             h_a = a_hypos[i]
             append_blank_score = _get_hypo_score(h_a) + next_token_probs[i, -1]
             if _get_hypo_key(h_a) in key_to_b_hypo:
                 h_b = key_to_b_hypo[_get_hypo_key(h_a)]
-                _remove_hypo(h_b, b_hypos)
+                del b_keys[_remove_hypo(h_b, b_hypos)]
                 score = float(torch.tensor(_get_hypo_score(h_b)).logaddexp(append_blank_score))
             else:
                 score = float(append_blank_score)
@@ -160,19 +233,19 @@ class RNNTBeamSearch(torch.nn.Module):
                 score,
             )
             b_hypos.append(h_b)
+            b_keys.append(a_keys[i])
             key_to_b_hypo[_get_hypo_key(h_b)] = h_b
         _, sorted_idx = torch.tensor([_get_hypo_score(hypo) for hypo in b_hypos]).sort()
-        return [b_hypos[idx] for idx in sorted_idx]
+        return [b_hypos[idx] for idx in sorted_idx], [b_keys[idx] for idx in sorted_idx]
 
-    def _gen_a_hypos(
+    def _select_a_hypos(
         self,
         a_hypos: List[Hypothesis],
         b_hypos: List[Hypothesis],
         next_token_probs: torch.Tensor,
-        t: int,
         beam_width: int,
-        device: torch.device,
-    ) -> List[Hypothesis]:
+        a_keys: List[int],
+    ) -> Tuple[List[Hypothesis], List[int], List[float], List[int]]:
         (
             nonblank_nbest_scores,
             nonblank_nbest_hypo_idx,
@@ -187,40 +260,75 @@ class RNNTBeamSearch(torch.nn.Module):
         base_hypos: List[Hypothesis] = []
         new_tokens: List[int] = []
         new_scores: List[float] = []
+        new_keys: List[int] = []
         for i in range(beam_width):
             score = float(nonblank_nbest_scores[i])
             if score > b_nbest_score:
                 a_hypo_idx = int(nonblank_nbest_hypo_idx[i])
+                token = int(nonblank_nbest_token[i])
                 base_hypos.append(a_hypos[a_hypo_idx])
-                new_tokens.append(int(nonblank_nbest_token[i]))
+                new_tokens.append(token)
                 new_scores.append(score)
+                new_keys.append(_extend_key(a_keys[a_hypo_idx], token))
+        return base_hypos, new_tokens, new_scores, new_keys
 
+    def _gen_a_hypos(
+        self,
+        a_hypos: List[Hypothesis],
+        b_hypos: List[Hypothesis],
+        next_token_probs: torch.Tensor,
+        t: int,
+        beam_width: int,
+        device: torch.device,
+        a_keys: List[int],
+        cache: Optional[_PredictorCache] = None,
+    ) -> Tuple[List[Hypothesis], List[int]]:
+        base_hypos, new_tokens, new_scores, new_keys = self._select_a_hypos(
+            a_hypos, b_hypos, next_token_probs, beam_width, a_keys
+        )
         if base_hypos:
-            new_hypos = self._gen_new_hypos(base_hypos, new_tokens, new_scores, t, device)
+            new_hypos = self._gen_new_hypos(base_hypos, new_tokens, new_keys, new_scores, t, device, cache)
         else:
             new_hypos: List[Hypothesis] = []
 
-        return new_hypos
+        return new_hypos, new_keys
 
     def _gen_new_hypos(
         self,
         base_hypos: List[Hypothesis],
         tokens: List[int],
+        keys: List[int],
         scores: List[float],
         t: int,
         device: torch.device,
+        cache: Optional[_PredictorCache] = None,
     ) -> List[Hypothesis]:
-        tgt_tokens = torch.tensor([[token] for token in tokens], device=device)
-        states = _batch_state(base_hypos)
-        pred_out, _, pred_states = self.model.predict(
-            tgt_tokens,
-            torch.tensor([1] * len(base_hypos), device=device),
-            states,
-        )
+        outputs: List[Optional[Tuple[torch.Tensor, List[List[torch.Tensor]]]]] = []
+        miss_idx: List[int] = []
+        for i in range(len(base_hypos)):
+            output = cache.get(keys[i]) if cache is not None else None
+            outputs.append(output)
+            if output is None:
+                miss_idx.append(i)
+
+        if miss_idx:
+            tgt_tokens = torch.tensor([[tokens[i]] for i in miss_idx], device=device)
+            states = _batch_state([base_hypos[i] for i in miss_idx])
+            pred_out, _, pred_states = self.model.predict(
+                tgt_tokens,
+                torch.tensor([1] * len(miss_idx), device=device),
+                states,
+            )
+            for j, i in enumerate(miss_idx):
+                output = (pred_out[j].detach(), _slice_state(pred_states, j, device))
+                outputs[i] = output
+                if cache is not None:
+                    cache.put(keys[i], output[0], output[1])
+
         new_hypos: List[Hypothesis] = []
-        for i, h_a in enumerate(base_hypos):
-            new_tokens = _get_hypo_tokens(h_a) + [tokens[i]]
-            new_hypos.append((new_tokens, pred_out[i].detach(), _slice_state(pred_states, i, device), scores[i]))
+        for i, output in enumerate(outputs):
+            assert output is not None
+            new_hypos.append((_get_hypo_tokens(base_hypos[i]) + [tokens[i]], output[0], output[1], scores[i]))
         return new_hypos
 
     def _search(
@@ -233,35 +341,46 @@ class RNNTBeamSearch(torch.nn.Module):
         device = enc_out.device
 
         a_hypos: List[Hypothesis] = []
+        a_keys: List[int] = []
         b_hypos = self._init_b_hypos(device) if hypo is None else hypo
+        # The cache is keyed by rolling hashes of the token sequences, which are extended token by token.
+        b_keys = [_get_tokens_key(_get_hypo_tokens(h)) for h in b_hypos]
+        cache = _PredictorCache(self.predictor_cache_size)
         for t in range(n_time_steps):
             a_hypos = b_hypos
+            a_keys = b_keys
             b_hypos = torch.jit.annotate(List[Hypothesis], [])
+            b_keys = torch.jit.annotate(List[int], [])
             key_to_b_hypo: Dict[str, Hypothesis] = {}
             symbols_current_t = 0
 
             while a_hypos:
                 next_token_probs = self._gen_next_token_probs(enc_out[:, t : t + 1], a_hypos, device)
                 next_token_probs = next_token_probs.cpu()
-                b_hypos = self._gen_b_hypos(b_hypos, a_hypos, next_token_probs, key_to_b_hypo)
+                b_hypos, b_keys = self._gen_b_hypos(b_hypos, a_hypos, next_token_probs, key_to_b_hypo, b_keys, a_keys)
 
                 if symbols_current_t == self.step_max_tokens:
                     break
 
-                a_hypos = self._gen_a_hypos(
+                a_hypos, a_keys = self._gen_a_hypos(
                     a_hypos,
                     b_hypos,
                     next_token_probs,
                     t,
                     beam_width,
                     device,
+                    a_keys,
+                    cache,
                 )
                 if a_hypos:
                     symbols_current_t += 1
 
             _, sorted_idx = torch.tensor([self.hypo_sort_key(hyp) for hyp in b_hypos]).topk(beam_width)
             b_hypos = [b_hypos[idx] for idx in sorted_idx]
+            b_keys = [b_keys[idx] for idx in sorted_idx]
 
+        self.predictor_cache_hits = cache.hits
+        self.predictor_cache_misses = cache.misses
         return b_hypos
 
     def forward(self, input: torch.Tensor, length: torch.Tensor, beam_width: int) -> List[Hypothesis]:
@@ -337,3 +456,726 @@ class RNNTBeamSearch(torch.nn.Module):
 
         enc_out, _, state = self.model.transcribe_streaming(input, length, state)
         return self._search(enc_out, hypothesis, beam_width), state
+
+
+class RNNTBatchBeamSearch(RNNTBeamSearch):
+    r"""Beam search decoder for RNN-T model that decodes a batch of utterances together.
+
+    The search is the same as the one of :class:`RNNTBeamSearch`, run for every utterance of the batch
+    in lockstep over time. At every step the joint network is applied to the hypotheses of all utterances
+    in one call and the prediction network is applied to all expanded hypotheses in one call, instead
+    of once per utterance.
+
+    Args:
+        model (RNNT): RNN-T model to use.
+        blank (int): index of blank token in vocabulary.
+        temperature (float, optional): temperature to apply to joint network output.
+            Larger values yield more uniform samples. (Default: 1.0)
+        hypo_sort_key (Callable[[Hypothesis], float] or None, optional): callable that computes a score
+            for a given hypothesis to rank hypotheses by. If ``None``, defaults to callable that returns
+            hypothesis score normalized by token sequence length. (Default: None)
+        step_max_tokens (int, optional): maximum number of tokens to emit per input time step. (Default: 100)
+        predictor_cache_size (int, optional): maximum number of prediction network outputs and states of
+            expanded hypotheses to keep during a search, shared by all utterances of the batch; ``0``
+            disables the cache. (Default: 1024)
+    """
+
+    def _gen_batch_next_token_probs(
+        self, enc_out: torch.Tensor, hypos: List[Hypothesis], device: torch.device
+    ) -> torch.Tensor:
+        ones = torch.tensor([1] * len(hypos), device=device)
+        predictor_out = torch.stack([_get_hypo_predictor_out(h) for h in hypos], dim=0)
+        joined_out, _, _ = self.model.join(enc_out, ones, predictor_out, ones)  # [num_hypos, 1, 1, num_tokens]
+        joined_out = torch.nn.functional.log_softmax(joined_out / self.temperature, dim=3)
+        return joined_out[:, 0, 0]
+
+    def _batch_search(
+        self,
+        enc_out: torch.Tensor,
+        enc_lengths: torch.Tensor,
+        hypos: Optional[List[List[Hypothesis]]],
+        beam_width: int,
+    ) -> List[List[Hypothesis]]:
+        batch_size = enc_out.shape[0]
+        device = enc_out.device
+        lengths: List[int] = enc_lengths.to(torch.int64).tolist()
+
+        b_hypos_list: List[List[Hypothesis]] = []
+        b_keys_list: List[List[int]] = []
+        for i in range(batch_size):
+            b_hypos_list.append(self._init_b_hypos(device) if hypos is None else hypos[i])
+            b_keys_list.append([_get_tokens_key(_get_hypo_tokens(h)) for h in b_hypos_list[i]])
+        # The prediction network only depends on the token sequence, so the cache is shared by all utterances.
+        cache = _PredictorCache(self.predictor_cache_size)
+
+        for t in range(max(lengths) if batch_size > 0 else 0):
+            active: List[int] = []
+            a_hypos_list: List[List[Hypothesis]] = [b_hypos_list[i] for i in range(batch_size)]
+            a_keys_list: List[List[int]] = [b_keys_list[i] for i in range(batch_size)]
+            key_to_b_hypo_list: List[Dict[str, Hypothesis]] = []
+            for i in range(batch_size):
+                if t < lengths[i]:
+                    active.append(i)
+                    b_hypos_list[i] = torch.jit.annotate(List[Hypothesis], [])
+                    b_keys_list[i] = torch.jit.annotate(List[int], [])
+                key_to_b_hypo_list.append(torch.jit.annotate(Dict[str, Hypothesis], {}))
+            symbols_current_t = 0
+
+            while len(active) > 0:
+                # One joint network call for the hypotheses of all active utterances.
+                hypos_t: List[Hypothesis] = []
+                enc_idx: List[int] = []
+                for i in active:
+                    hypos_t.extend(a_hypos_list[i])
+                    enc_idx.extend([i] * len(a_hypos_list[i]))
+                enc_out_t = enc_out[torch.tensor(enc_idx, device=device), t : t + 1]
+                next_token_probs = self._gen_batch_next_token_probs(enc_out_t, hypos_t, device).cpu()
+
+                base_hypos: List[Hypothesis] = []
+                new_tokens: List[int] = []
+                new_scores: List[float] = []
+                new_keys: List[int] = []
+                num_new: List[int] = []
+                offset = 0
+                for i in active:
+                    num_a = len(a_hypos_list[i])
+                    probs_i = next_token_probs[offset : offset + num_a]
+                    offset += num_a
+                    b_hypos_i, b_keys_i = self._gen_b_hypos(
+                        b_hypos_list[i], a_hypos_list[i], probs_i, key_to_b_hypo_list[i], b_keys_list[i], a_keys_list[i]
+                    )
+                    b_hypos_list[i] = b_hypos_i
+                    b_keys_list[i] = b_keys_i
+                    if symbols_current_t == self.step_max_tokens:
+                        num_new.append(0)
+                        continue
+                    base_i, tokens_i, scores_i, keys_i = self._select_a_hypos(
+                        a_hypos_list[i], b_hypos_list[i], probs_i, beam_width, a_keys_list[i]
+                    )
+                    base_hypos.extend(base_i)
+                    new_tokens.extend(tokens_i)
+                    new_scores.extend(scores_i)
+                    new_keys.extend(keys_i)
+                    num_new.append(len(base_i))
+
+                if symbols_current_t == self.step_max_tokens:
+                    break
+
+                # One prediction network call for the expanded hypotheses of all active utterances.
+                if base_hypos:
+                    new_hypos = self._gen_new_hypos(base_hypos, new_tokens, new_keys, new_scores, t, device, cache)
+                else:
+                    new_hypos = torch.jit.annotate(List[Hypothesis], [])
+                next_active: List[int] = []
+                offset = 0
+                for j, i in enumerate(active):
+                    a_hypos_list[i] = new_hypos[offset : offset + num_new[j]]
+                    a_keys_list[i] = new_keys[offset : offset + num_new[j]]
+                    offset += num_new[j]
+                    if num_new[j] > 0:
+                        next_active.append(i)
+                active = next_active
+                if active:
+                    symbols_current_t += 1
+
+            for i in range(batch_size):
+                if t < lengths[i]:
+                    b_hypos = b_hypos_list[i]
+                    b_keys = b_keys_list[i]
+                    _, sorted_idx = torch.tensor([self.hypo_sort_key(hyp) for hyp in b_hypos]).topk(
+                        min(beam_width, len(b_hypos))
+                    )
+                    b_hypos_list[i] = [b_hypos[idx] for idx in sorted_idx]
+                    b_keys_list[i] = [b_keys[idx] for idx in sorted_idx]
+
+        self.predictor_cache_hits = cache.hits
+        self.predictor_cache_misses = cache.misses
+        return b_hypos_list
+
+    def forward(self, input: torch.Tensor, length: torch.Tensor, beam_width: int) -> List[List[Hypothesis]]:
+        r"""Performs beam search for every sequence of the given batch.
+
+        B: batch size;
+        T: maximum number of frames in batch;
+        D: feature dimension of each frame.
+
+        Args:
+            input (torch.Tensor): sequences of input frames, right-padded, with shape (B, T, D).
+            length (torch.Tensor): number of valid frames of every sequence, with shape (B,).
+            beam_width (int): beam size to use during search.
+
+        Returns:
+            List[List[Hypothesis]]: top-``beam_width`` hypotheses found by beam search for every sequence.
+        """
+        if input.dim() != 3:
+            raise ValueError("input must be of shape (B, T, D)")
+        if length.dim() != 1 or length.shape[0] != input.shape[0]:
+            raise ValueError("length must be of shape (B,)")
+
+        enc_out, enc_lengths = self.model.transcribe(input, length)
+        return self._batch_search(enc_out, enc_lengths, None, beam_width)
+
+    @torch.jit.export
+    def infer(
+        self,
+        input: torch.Tensor,
+        length: torch.Tensor,
+        beam_width: int,
+        state: Optional[List[List[torch.Tensor]]] = None,
+        hypothesis: Optional[List[List[Hypothesis]]] = None,
+    ) -> Tuple[List[List[Hypothesis]], List[List[torch.Tensor]]]:
+        r"""Performs beam search for every sequence of the given batch in streaming mode.
+
+        B: batch size;
+        T: maximum number of frames in batch;
+        D: feature dimension of each frame.
+
+        Args:
+            input (torch.Tensor): sequences of input frames, right-padded, with shape (B, T, D).
+            length (torch.Tensor): number of valid frames of every sequence, with shape (B,).
+            beam_width (int): beam size to use during search.
+            state (List[List[torch.Tensor]] or None, optional): list of lists of tensors
+                representing transcription network internal state generated in preceding
+                invocation. (Default: ``None``)
+            hypothesis (List[List[Hypothesis]] or None): hypotheses of every sequence from preceding
+                invocation to seed search with. (Default: ``None``)
+
+        Returns:
+            (List[List[Hypothesis]], List[List[torch.Tensor]]):
+                List[List[Hypothesis]]
+                    top-``beam_width`` hypotheses found by beam search for every sequence.
+                List[List[torch.Tensor]]
+                    list of lists of tensors representing transcription network
+                    internal state generated in current invocation.
+        """
+        if input.dim() != 3:
+            raise ValueError("input must be of shape (B, T, D)")
+        if length.dim() != 1 or length.shape[0] != input.shape[0]:
+            raise ValueError("length must be of shape (B,)")
+
+        enc_out, enc_lengths, state = self.model.transcribe_streaming(input, length, state)
+        return self._batch_search(enc_out, enc_lengths, hypothesis, beam_width), state
+
+
+class _Beams:
+    r"""Hypotheses of a beam search stored as tensors indexed by beam slot.
+
+    Slots whose ``valid`` flag is ``False`` are placeholders; they keep the shapes fixed so that selecting
+    hypotheses never requires reading the number of survivors back to the host.
+    """
+
+    def __init__(
+        self,
+        tokens: torch.Tensor,
+        lengths: torch.Tensor,
+        hashes: torch.Tensor,
+        predictor_out: torch.Tensor,
+        state: List[List[torch.Tensor]],
+        scores: torch.Tensor,
+        valid: torch.Tensor,
+    ) -> None:
+        self.tokens = tokens  # (N, capacity) token IDs, valid up to ``lengths``
+        self.lengths = lengths  # (N,)
+        self.hashes = hashes  # (N, 2) rolling hashes of the tokens
+        self.predictor_out = predictor_out  # (N, 1, D)
+        self.state = state  # prediction network state, batch dimension first
+        self.scores = scores  # (N,)
+        self.valid = valid  # (N,)
+
+    def keys(self) -> torch.Tensor:
+        return _hash_keys(self.hashes)
+
+    def __len__(self) -> int:
+        return self.scores.shape[0]
+
+    def select(self, idx: torch.Tensor) -> "_Beams":
+        return _Beams(
+            self.tokens.index_select(0, idx),
+            self.lengths.index_select(0, idx),
+            self.hashes.index_select(0, idx),
+            self.predictor_out.index_select(0, idx),
+            [[s.index_select(0, idx) for s in layer] for layer in self.state],
+            self.scores.index_select(0, idx),
+            self.valid.index_select(0, idx),
+        )
+
+    def cat(self, other: "_Beams") -> "_Beams":
+        capacity = max(self.tokens.shape[1], other.tokens.shape[1])
+        return _Beams(
+            torch.cat([_pad_tokens(self.tokens, capacity), _pad_tokens(other.tokens, capacity)]),
+            torch.cat([self.lengths, other.lengths]),
+            torch.cat([self.hashes, other.hashes]),
+            torch.cat([self.predictor_out, other.predictor_out]),
+            [
+                [torch.cat([s, o]) for s, o in zip(layer, other_layer)]
+                for layer, other_layer in zip(self.state, other.state)
+            ],
+            torch.cat([self.scores, other.scores]),
+            torch.cat([self.valid, other.valid]),
+        )
+
+
+def _pad_tokens(tokens: torch.Tensor, capacity: int) -> torch.Tensor:
+    if tokens.shape[1] >= capacity:
+        return tokens
+    return torch.nn.functional.pad(tokens, (0, capacity - tokens.shape[1]))
+
+
+def _extend_hashes(hashes: torch.Tensor, tokens: torch.Tensor) -> torch.Tensor:
+    bases = torch.tensor([1000003, 999983], device=hashes.device, dtype=torch.int64)
+    return (hashes * bases + (tokens.unsqueeze(1) + 1)) % 2147483647
+
+
+class RNNTTensorBeamSearch(RNNTBeamSearch):
+    r"""Beam search decoder for RNN-T model with the hypotheses kept in tensors.
+
+    The search is the same as the one of :class:`RNNTBeamSearch`, but tokens, scores, prediction network
+    outputs and states of all hypotheses are stored in tensors indexed by beam slot, and hypotheses with
+    the same token sequence are merged by comparing rolling hashes of their tokens. Every search step thus
+    runs on the device of the model; the only values read back are whether any hypothesis was expanded,
+    once per expansion, and the length of the longest hypothesis, once per input time step.
+
+    Args:
+        model (RNNT): RNN-T model to use.
+        blank (int): index of blank token in vocabulary.
+        temperature (float, optional): temperature to apply to joint network output.
+            Larger values yield more uniform samples. (Default: 1.0)
+        step_max_tokens (int, optional): maximum number of tokens to emit per input time step. (Default: 100)
+
+    Note:
+        Hypotheses are ranked by their score normalized by token sequence length, as by the default
+        ``hypo_sort_key`` of :class:`RNNTBeamSearch`.
+    """
+
+    def __init__(
+        self,
+        model: RNNT,
+        blank: int,
+        temperature: float = 1.0,
+        step_max_tokens: int = 100,
+    ) -> None:
+        super().__init__(model, blank, temperature=temperature, step_max_tokens=step_max_tokens)
+
+    def _init_beams(self, device: torch.device) -> _Beams:
+        hypo = self._init_b_hypos(device)[0]
+        return self._hypos_to_beams([hypo], device)
+
+    def _hypos_to_beams(self, hypos: List[Hypothesis], device: torch.device) -> _Beams:
+        token_lists = [_get_hypo_tokens(h) for h in hypos]
+        hashes: List[List[int]] = []
+        for token_list in token_lists:
+            key = _get_tokens_key(token_list)
+            hashes.append([key // 2147483648, key % 2147483648])
+        capacity = max([len(token_list) for token_list in token_lists])
+        tokens = torch.zeros(len(hypos), capacity, dtype=torch.int64, device=device)
+        for i, token_list in enumerate(token_lists):
+            tokens[i, : len(token_list)] = torch.tensor(token_list, device=device)
+        predictor_out = torch.stack([_get_hypo_predictor_out(h) for h in hypos])
+        return _Beams(
+            tokens,
+            torch.tensor([len(token_list) for token_list in token_lists], device=device),
+            torch.tensor(hashes, dtype=torch.int64, device=device),
+            predictor_out,
+            _batch_state(hypos),
+            torch.tensor([_get_hypo_score(h) for h in hypos], device=device, dtype=predictor_out.dtype),
+            torch.ones(len(hypos), dtype=torch.bool, device=device),
+        )
+
+    def _beams_to_hypos(self, beams: _Beams) -> List[Hypothesis]:
+        valid: List[bool] = beams.valid.tolist()
+        lengths: List[int] = beams.lengths.tolist()
+        tokens: List[List[int]] = beams.tokens.tolist()
+        scores: List[float] = beams.scores.to(torch.float64).tolist()
+        hypos: List[Hypothesis] = []
+        for i in range(len(beams)):
+            if valid[i]:
+                state = [[s[i : i + 1] for s in layer] for layer in beams.state]
+                hypos.append((tokens[i][: lengths[i]], beams.predictor_out[i], state, scores[i]))
+        return hypos
+
+    def _merge_blank_extensions(self, b_beams: Optional[_Beams], a_beams: _Beams, blank_scores: torch.Tensor) -> _Beams:
+        r"""Adds the blank extensions of ``a_beams`` to ``b_beams``, summing the probabilities of equal prefixes."""
+        candidates = _Beams(
+            a_beams.tokens,
+            a_beams.lengths,
+            a_beams.hashes,
+            a_beams.predictor_out,
+            a_beams.state,
+            a_beams.scores + blank_scores,
+            a_beams.valid,
+        )
+        if b_beams is None:
+            return candidates
+
+        # Hypotheses within each set are distinct, so every prefix matches at most one hypothesis of the other set.
+        matches = (candidates.keys().unsqueeze(1) == b_beams.keys().unsqueeze(0)) & (
+            candidates.valid.unsqueeze(1) & b_beams.valid.unsqueeze(0)
+        )
+        neg_inf = torch.tensor(-float("inf"), device=blank_scores.device, dtype=candidates.scores.dtype)
+        matched_scores = torch.where(matches, candidates.scores.unsqueeze(1), neg_inf).amax(dim=0)
+        b_beams.scores = torch.where(matches.any(dim=0), b_beams.scores.logaddexp(matched_scores), b_beams.scores)
+        candidates.valid = candidates.valid & ~matches.any(dim=1)
+        return b_beams.cat(candidates)
+
+    def _expand(
+        self,
+        a_beams: _Beams,
+        tokens: torch.Tensor,
+        hypo_idx: torch.Tensor,
+        scores: torch.Tensor,
+        valid: torch.Tensor,
+        max_length: int,
+    ) -> _Beams:
+        r"""Appends ``tokens`` to the hypotheses ``hypo_idx`` of ``a_beams`` and runs the prediction network on them.
+
+        ``max_length`` bounds the number of tokens of the hypotheses of ``a_beams``.
+        """
+        base = a_beams.select(hypo_idx)
+        device = tokens.device
+        token_buffer = base.tokens
+        if token_buffer.shape[1] <= max_length:
+            # The buffer is doubled rather than widened by one column, so that it is rarely reallocated.
+            token_buffer = _pad_tokens(token_buffer, max(2 * token_buffer.shape[1], max_length + 1))
+        token_buffer = token_buffer.scatter(1, base.lengths.unsqueeze(1), tokens.unsqueeze(1))
+        predictor_out, _, state = self.model.predict(
+            tokens.unsqueeze(1), torch.ones_like(base.lengths, device=device), base.state
+        )
+        return _Beams(
+            token_buffer,
+            base.lengths + 1,
+            _extend_hashes(base.hashes, tokens),
+            predictor_out.detach(),
+            state,
+            scores,
+            valid,
+        )
+
+    def _search(
+        self,
+        enc_out: torch.Tensor,
+        hypo: Optional[List[Hypothesis]],
+        beam_width: int,
+    ) -> List[Hypothesis]:
+        n_time_steps = enc_out.shape[1]
+        device = enc_out.device
+
+        b_beams = self._init_beams(device) if hypo is None else self._hypos_to_beams(hypo, device)
+        max_length = int(b_beams.lengths.max())
+        for t in range(n_time_steps):
+            a_beams = b_beams
+            blank_beams: Optional[_Beams] = None
+            symbols_current_t = 0
+
+            while True:
+                ones = torch.ones(len(a_beams), dtype=torch.int64, device=device)
+                joined_out, _, _ = self.model.join(enc_out[:, t : t + 1], ones[:1], a_beams.predictor_out, ones)
+                next_token_probs = torch.nn.functional.log_softmax(joined_out / self.temperature, dim=3)[:, 0, 0]
+                b_beams = self._merge_blank_extensions(blank_beams, a_beams, next_token_probs[:, -1])
+                blank_beams = b_beams
+
+                if symbols_current_t == self.step_max_tokens:
+                    break
+
+                # Only expansions scoring above the beam_width-th best blank extension are kept.
+                if len(b_beams) < beam_width:
+                    b_nbest_score = torch.tensor(-float("inf"), device=device, dtype=b_beams.scores.dtype)
+                else:
+                    b_scores = b_beams.scores.masked_fill(~b_beams.valid, -float("inf"))
+                    b_nbest_score = b_scores.topk(beam_width)[0][-1]
+                nonblank_scores = a_beams.scores.masked_fill(~a_beams.valid, -float("inf")).unsqueeze(1)
+                nonblank_scores = nonblank_scores + next_token_probs[:, :-1]
+                nbest_scores, nbest_idx = nonblank_scores.reshape(-1).topk(beam_width)
+                keep = nbest_scores > b_nbest_score
+                if not bool(keep.any()):
+                    break
+
+                hypo_idx = nbest_idx.div(nonblank_scores.shape[1], rounding_mode="trunc")
+                tokens = nbest_idx % nonblank_scores.shape[1]
+                a_beams = self._expand(a_beams, tokens, hypo_idx, nbest_scores, keep, max_length)
+                max_length += 1
+                symbols_current_t += 1
+
+            sort_keys = b_beams.scores / (b_beams.lengths + 1).to(b_beams.scores.dtype)
+            sort_keys = sort_keys.masked_fill(~b_beams.valid, -float("inf"))
+            _, sorted_idx = sort_keys.topk(min(beam_width, len(b_beams)))
+            b_beams = b_beams.select(sorted_idx)
+            # The token buffer is trimmed to the longest surviving hypothesis, so that its width does not grow
+            # with the number of expansions that were pruned.
+            max_length = int(b_beams.lengths.max())
+            if b_beams.tokens.shape[1] > 2 * max_length:
+                b_beams.tokens = b_beams.tokens[:, :max_length]
+
+        return self._beams_to_hypos(b_beams)
+
+
+def _hypos_from_tensors(
+    tokens: torch.Tensor,
+    lengths: torch.Tensor,
+    predictor_out: torch.Tensor,
+    state: List[List[torch.Tensor]],
+    scores: torch.Tensor,
+    rows: List[int],
+) -> List[Hypothesis]:
+    # TorchScript requires int64 and float64 tensors for lists of int and float.
+    token_lists: List[List[int]] = tokens.to(torch.int64).tolist()
+    length_list: List[int] = lengths.to(torch.int64).tolist()
+    score_list: List[float] = scores.to(torch.float64).tolist()
+    return [
+        (
+            token_lists[i][: length_list[i]],
+            predictor_out[i],
+            [[s[i : i + 1] for s in layer] for layer in state],
+            score_list[i],
+        )
+        for i in rows
+    ]
+
+
+class RNNTGreedySearch(torch.nn.Module):
+    r"""Greedy decoder for RNN-T model that decodes a batch of utterances together.
+
+    At every input time step the most likely symbol is emitted for all utterances at once until each of
+    them emits blank or ``step_max_tokens`` symbols, so every step runs one joint network and at most one
+    prediction network call for the whole batch.
+
+    Args:
+        model (RNNT): RNN-T model to use.
+        blank (int): index of blank token in vocabulary.
+        step_max_tokens (int, optional): maximum number of tokens to emit per input time step. (Default: 10)
+    """
+
+    def __init__(self, model: RNNT, blank: int, step_max_tokens: int = 10) -> None:
+        super().__init__()
+        self.model = model
+        self.blank = blank
+        self.step_max_tokens = step_max_tokens
+
+    def _search(self, enc_out: torch.Tensor, enc_lengths: torch.Tensor) -> List[List[Hypothesis]]:
+        batch_size, n_time_steps = enc_out.shape[0], enc_out.shape[1]
+        device = enc_out.device
+        rows = torch.arange(batch_size, device=device)
+        ones = torch.ones(batch_size, dtype=torch.int64, device=device)
+
+        blank_tokens = torch.full((batch_size, 1), self.blank, dtype=torch.int64, device=device)
+        predictor_out, _, state = self.model.predict(blank_tokens, ones, None)
+        tokens = blank_tokens
+        lengths = ones.clone()
+        scores = torch.zeros(batch_size, dtype=enc_out.dtype, device=device)
+        num_rounds = 0
+        for t in range(n_time_steps):
+            active = t < enc_lengths
+            for _symbol in range(self.step_max_tokens):
+                joined_out, _, _ = self.model.join(enc_out[:, t : t + 1], ones, predictor_out, ones)
+                best_scores, best_tokens = torch.nn.functional.log_softmax(joined_out[:, 0, 0], dim=-1).max(dim=-1)
+                scores = scores + torch.where(active, best_scores, torch.zeros_like(best_scores))
+                emit = active & (best_tokens != self.blank)
+                if not bool(emit.any()):
+                    break
+
+                num_rounds += 1
+                if tokens.shape[1] < num_rounds + 1:
+                    tokens = _pad_tokens(tokens, 2 * tokens.shape[1] + 1)
+                tokens[rows, lengths] = torch.where(emit, best_tokens, tokens[rows, lengths])
+                lengths = lengths + emit.to(lengths.dtype)
+
+                new_predictor_out, _, new_state = self.model.predict(best_tokens.unsqueeze(1), ones, state)
+                predictor_out = torch.where(emit.view(-1, 1, 1), new_predictor_out.detach(), predictor_out)
+                state = [
+                    [torch.where(emit.view(-1, 1), new_s, s) for new_s, s in zip(new_layer, layer)]
+                    for new_layer, layer in zip(new_state, state)
+                ]
+                # Utterances that emitted blank move on to the next time step.
+                active = emit
+
+        return [
+            _hypos_from_tensors(tokens, lengths, predictor_out, state, scores, [i]) for i in range(batch_size)
+        ]
+
+    def forward(self, input: torch.Tensor, length: torch.Tensor) -> List[List[Hypothesis]]:
+        r"""Performs greedy search for every sequence of the given batch.
+
+        B: batch size;
+        T: maximum number of frames in batch;
+        D: feature dimension of each frame.
+
+        Args:
+            input (torch.Tensor): sequences of input frames, right-padded, with shape (B, T, D).
+            length (torch.Tensor): number of valid frames of every sequence, with shape (B,).
+
+        Returns:
+            List[List[Hypothesis]]: the single hypothesis found by greedy search for every sequence.
+        """
+        if input.dim() != 3:
+            raise ValueError("input must be of shape (B, T, D)")
+        if length.dim() != 1 or length.shape[0] != input.shape[0]:
+            raise ValueError("length must be of shape (B,)")
+
+        enc_out, enc_lengths = self.model.transcribe(input, length)
+        return self._search(enc_out, enc_lengths)
+
+
+class RNNTModifiedBeamSearch(torch.nn.Module):
+    r"""Time-synchronous beam search decoder for RNN-T model that decodes a batch of utterances together.
+
+    Every utterance keeps ``beam_width`` hypotheses. At every input time step, each hypothesis that has not
+    emitted blank yet may emit one more symbol, up to ``step_max_tokens`` symbols, and the best
+    ``beam_width`` hypotheses are kept after every such round. Hypotheses with the same token sequence are
+    merged. Unlike :class:`RNNTBeamSearch`, the number of joint and prediction network calls per time step
+    is bounded by ``step_max_tokens`` and all utterances and hypotheses are processed in one call.
+    With ``step_max_tokens=1`` this is the "modified beam search" of k2/icefall.
+
+    Args:
+        model (RNNT): RNN-T model to use.
+        blank (int): index of blank token in vocabulary.
+        temperature (float, optional): temperature to apply to joint network output.
+            Larger values yield more uniform samples. (Default: 1.0)
+        step_max_tokens (int, optional): maximum number of tokens to emit per input time step. (Default: 1)
+
+    Note:
+        Hypotheses are ranked by their score normalized by token sequence length, as by the default
+        ``hypo_sort_key`` of :class:`RNNTBeamSearch`.
+    """
+
+    def __init__(self, model: RNNT, blank: int, temperature: float = 1.0, step_max_tokens: int = 1) -> None:
+        super().__init__()
+        self.model = model
+        self.blank = blank
+        self.temperature = temperature
+        self.step_max_tokens = step_max_tokens
+
+    def _merge_duplicates(
+        self, hashes: torch.Tensor, scores: torch.Tensor, done: torch.Tensor
+    ) -> torch.Tensor:
+        batch_size, beam_width = scores.shape
+        keys = _hash_keys(hashes).view(batch_size, beam_width)
+        finite = scores.isfinite()
+        same = (
+            (keys.unsqueeze(2) == keys.unsqueeze(1))
+            & (done.unsqueeze(2) == done.unsqueeze(1))
+            & finite.unsqueeze(2)
+            & finite.unsqueeze(1)
+        )
+        earlier = torch.ones(beam_width, beam_width, dtype=torch.bool, device=scores.device).tril(-1)
+        duplicate = (same & earlier).any(dim=2)
+        neg_inf = torch.tensor(-float("inf"), dtype=scores.dtype, device=scores.device)
+        merged = torch.where(same, scores.unsqueeze(1), neg_inf).logsumexp(dim=2)
+        return torch.where(duplicate | ~finite, neg_inf, merged)
+
+    def _search(self, enc_out: torch.Tensor, enc_lengths: torch.Tensor, beam_width: int) -> List[List[Hypothesis]]:
+        batch_size, n_time_steps = enc_out.shape[0], enc_out.shape[1]
+        num_hypos = batch_size * beam_width
+        device = enc_out.device
+        ones = torch.ones(num_hypos, dtype=torch.int64, device=device)
+        offsets = (torch.arange(batch_size, device=device) * beam_width).unsqueeze(1)
+        neg_inf = torch.tensor(-float("inf"), dtype=enc_out.dtype, device=device)
+
+        blank_tokens = torch.full((num_hypos, 1), self.blank, dtype=torch.int64, device=device)
+        predictor_out, _, state = self.model.predict(blank_tokens, ones, None)
+        tokens = blank_tokens
+        lengths = ones.clone()
+        hashes = _extend_hashes(torch.zeros(num_hypos, 2, dtype=torch.int64, device=device), blank_tokens[:, 0])
+        scores = torch.full((batch_size, beam_width), -float("inf"), dtype=enc_out.dtype, device=device)
+        scores[:, 0] = 0.0
+        num_rounds = 0
+        for t in range(n_time_steps):
+            # Hypotheses of finished utterances count as done and are carried over unchanged.
+            done = (t >= enc_lengths).unsqueeze(1).expand(batch_size, beam_width)
+            enc_out_t = enc_out[:, t : t + 1].repeat_interleave(beam_width, dim=0)
+            for _symbol in range(self.step_max_tokens):
+                joined_out, _, _ = self.model.join(enc_out_t, ones, predictor_out, ones)
+                log_probs = torch.nn.functional.log_softmax(joined_out[:, 0, 0] / self.temperature, dim=-1)
+                num_symbols = log_probs.shape[-1]
+                log_probs = log_probs.view(batch_size, beam_width, num_symbols)
+
+                pending_scores = scores.masked_fill(done, -float("inf"))
+                blank_scores = pending_scores + log_probs[:, :, self.blank]
+                nonblank_scores = pending_scores.unsqueeze(2) + log_probs
+                nonblank_scores[:, :, self.blank] = -float("inf")
+                candidates = torch.cat(
+                    [scores.masked_fill(~done, -float("inf")), blank_scores, nonblank_scores.flatten(1)], dim=1
+                )
+                scores, idx = candidates.topk(beam_width, dim=1)
+
+                # Candidates [0, W) keep a done hypothesis, [W, 2W) end a pending one with blank and the rest
+                # extend pending hypothesis (idx - 2W) // V with symbol (idx - 2W) % V.
+                nonblank_idx = (idx - 2 * beam_width).clamp(min=0)
+                source = torch.where(
+                    idx < beam_width,
+                    idx,
+                    torch.where(
+                        idx < 2 * beam_width,
+                        idx - beam_width,
+                        nonblank_idx.div(num_symbols, rounding_mode="trunc"),
+                    ),
+                )
+                done = idx < 2 * beam_width
+                emit = (~done & scores.isfinite()).flatten()
+                emit_tokens = torch.where(emit, (nonblank_idx % num_symbols).flatten(), blank_tokens[:, 0])
+
+                rows = (offsets + source).flatten()
+                tokens = tokens.index_select(0, rows)
+                lengths = lengths.index_select(0, rows)
+                hashes = hashes.index_select(0, rows)
+                predictor_out = predictor_out.index_select(0, rows)
+                state = [[s.index_select(0, rows) for s in layer] for layer in state]
+
+                num_rounds += 1
+                if tokens.shape[1] < num_rounds + 1:
+                    tokens = _pad_tokens(tokens, 2 * tokens.shape[1] + 1)
+                positions = torch.arange(tokens.shape[1], device=device).unsqueeze(0)
+                tokens = torch.where(
+                    emit.unsqueeze(1) & (positions == lengths.unsqueeze(1)), emit_tokens.unsqueeze(1), tokens
+                )
+                lengths = lengths + emit.to(lengths.dtype)
+                hashes = torch.where(emit.unsqueeze(1), _extend_hashes(hashes, emit_tokens), hashes)
+
+                new_predictor_out, _, new_state = self.model.predict(emit_tokens.unsqueeze(1), ones, state)
+                predictor_out = torch.where(emit.view(-1, 1, 1), new_predictor_out.detach(), predictor_out)
+                state = [
+                    [torch.where(emit.view(-1, 1), new_s, s) for new_s, s in zip(new_layer, layer)]
+                    for new_layer, layer in zip(new_state, state)
+                ]
+                scores = self._merge_duplicates(hashes, scores, done)
+                if not bool((~done & scores.isfinite()).any()):
+                    break
+            # Hypotheses still pending after ``step_max_tokens`` symbols move on as well, which can make them
+            # equal to hypotheses that ended the time step with blank.
+            scores = self._merge_duplicates(hashes, scores, torch.ones_like(done))
+
+        sort_keys = scores.flatten() / (lengths + 1).to(scores.dtype)
+        sort_keys = torch.where(scores.flatten().isfinite(), sort_keys, neg_inf).view(batch_size, beam_width)
+        order = sort_keys.argsort(dim=1, descending=True)
+        order_list: List[List[int]] = order.tolist()
+        finite_list: List[List[bool]] = scores.isfinite().tolist()
+        hypos: List[List[Hypothesis]] = []
+        for i in range(batch_size):
+            rows: List[int] = []
+            for j in order_list[i]:
+                if finite_list[i][j]:
+                    rows.append(i * beam_width + j)
+            hypos.append(_hypos_from_tensors(tokens, lengths, predictor_out, state, scores.flatten(), rows))
+        return hypos
+
+    def forward(self, input: torch.Tensor, length: torch.Tensor, beam_width: int) -> List[List[Hypothesis]]:
+        r"""Performs time-synchronous beam search for every sequence of the given batch.
+
+        B: batch size;
+        T: maximum number of frames in batch;
+        D: feature dimension of each frame.
+
+        Args:
+            input (torch.Tensor): sequences of input frames, right-padded, with shape (B, T, D).
+            length (torch.Tensor): number of valid frames of every sequence, with shape (B,).
+            beam_width (int): beam size to use during search.
+
+        Returns:
+            List[List[Hypothesis]]: up to ``beam_width`` hypotheses found by beam search for every sequence,
+                best first.
+        """
+        if input.dim() != 3:
+            raise ValueError("input must be of shape (B, T, D)")
+        if length.dim() != 1 or length.shape[0] != input.shape[0]:
+            raise ValueError("length must be of shape (B,)")
+
+        enc_out, enc_lengths = self.model.transcribe(input, length)
+        return self._search(enc_out, enc_lengths, beam_width)
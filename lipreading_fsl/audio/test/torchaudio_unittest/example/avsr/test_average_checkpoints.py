@@ -0,0 +1,45 @@
+import torch
+from average_checkpoints import average_checkpoints, ema_weights, find_checkpoints
+from torchaudio_unittest.common_utils import TempDirMixin, TorchaudioTestCase
+
+
+class TestAverageCheckpoints(TempDirMixin, TorchaudioTestCase):
+    def _save(self, name, step, weight):
+        path = self.get_temp_path(name)
+        torch.save(
+            {
+                "global_step": step,
+                "state_dict": {"weight": torch.full((2, 3), weight), "count": torch.tensor(step)},
+                "callbacks": {
+                    "ModelCheckpoint{'monitor': 'val_loss'}": {"monitor": "val_loss", "current_score": weight},
+                },
+            },
+            path,
+        )
+        return path
+
+    def test_average(self):
+        """Floating point tensors are averaged and integer tensors are rounded down."""
+        paths = [self._save(f"epoch={i}.ckpt", i + 1, float(i)) for i in range(3)]
+        avg = average_checkpoints(paths)
+        self.assertEqual(avg["weight"], torch.full((2, 3), 1.0))
+        self.assertEqual(avg["count"], torch.tensor(2))
+
+        weights = ema_weights(3, 0.5)
+        self.assertEqual(torch.tensor(weights), torch.tensor([1.0, 2.0, 4.0]) / 7)
+        avg = average_checkpoints(paths, weights)
+        self.assertEqual(avg["weight"], torch.full((2, 3), 10.0 / 7))
+        self.assertEqual(avg["weight"].dtype, torch.float32)
+
+    def test_find_checkpoints(self):
+        """Checkpoints are selected by global step or by their monitored score, and returned oldest first."""
+        self._save("epoch=0.ckpt", 10, 3.0)
+        self._save("epoch=1.ckpt", 20, 1.0)
+        self._save("epoch=1-v1.ckpt", 30, 2.0)
+        self._save("last.ckpt", 30, 2.0)
+        latest = find_checkpoints(self.get_temp_path(), num_checkpoints=2)
+        self.assertEqual(latest, [self.get_temp_path("epoch=1.ckpt"), self.get_temp_path("epoch=1-v1.ckpt")])
+        best = find_checkpoints(self.get_temp_path(), num_checkpoints=2, metric="val_loss", mode="min")
+        self.assertEqual(best, [self.get_temp_path("epoch=1.ckpt"), self.get_temp_path("epoch=1-v1.ckpt")])
+        best = find_checkpoints(self.get_temp_path(), num_checkpoints=2, metric="val_loss", mode="max")
+        self.assertEqual(best, [self.get_temp_path("epoch=0.ckpt"), self.get_temp_path("epoch=1-v1.ckpt")])
@@ -0,0 +1,76 @@
+import torch
+from parameterized import parameterized
+from torchaudio._internal.module_utils import is_module_available
+from torchaudio_unittest.common_utils import skipIfNoModule, TorchaudioTestCase
+
+if is_module_available("pytorch_lightning", "torchvision"):
+    from data_module import CUDAPrefetcher, DistributedBucketBatchSampler, move_to_device
+
+
+def _get_lengths(num_samples=200, seed=0):
+    g = torch.Generator()
+    g.manual_seed(seed)
+    return torch.randint(10, 400, (num_samples,), generator=g).tolist()
+
+
+@skipIfNoModule("pytorch_lightning")
+@skipIfNoModule("torchvision")
+class TestDistributedBucketBatchSampler(TorchaudioTestCase):
+    @parameterized.expand([(1,), (2,), (4,)])
+    def test_ranks_cover_dataset(self, num_replicas):
+        """Every sample is yielded by at least one rank and the ranks yield the same number of batches."""
+        lengths = _get_lengths()
+        samplers = [
+            DistributedBucketBatchSampler(lengths, 800, 10, num_replicas=num_replicas, rank=rank)
+            for rank in range(num_replicas)
+        ]
+        batches = [list(sampler) for sampler in samplers]
+        self.assertEqual(len({len(b) for b in batches}), 1)
+        self.assertEqual(len(batches[0]), len(samplers[0]))
+        seen = {idx for rank_batches in batches for batch in rank_batches for idx in batch}
+        self.assertEqual(seen, set(range(len(lengths))))
+        for rank_batches in batches:
+            for batch in rank_batches:
+                self.assertLessEqual(sum(lengths[idx] for idx in batch), 800)
+
+    def test_set_epoch_reshuffles(self):
+        """Batches are deterministic for a given epoch and differ across epochs."""
+        lengths = _get_lengths()
+        sampler = DistributedBucketBatchSampler(lengths, 800, 10, num_replicas=1, rank=0)
+        epoch0 = list(sampler)
+        self.assertEqual(epoch0, list(sampler))
+        sampler.set_epoch(1)
+        self.assertNotEqual(epoch0, list(sampler))
+
+    def test_resume(self):
+        """A sampler restored from a mid-epoch state yields exactly the batches not consumed yet."""
+        lengths = _get_lengths()
+        sampler = DistributedBucketBatchSampler(lengths, 800, 10, num_replicas=2, rank=1)
+        sampler.set_epoch(3)
+        batches = list(sampler)
+        sampler.consumed = 5
+
+        resumed = DistributedBucketBatchSampler(lengths, 800, 10, num_replicas=2, rank=1)
+        resumed.load_state_dict(sampler.state_dict())
+        resumed.set_epoch(3)
+        self.assertEqual(list(resumed), batches[5:])
+        self.assertEqual(list(resumed), batches)
+
+
+@skipIfNoModule("pytorch_lightning")
+@skipIfNoModule("torchvision")
+class TestCUDAPrefetcher(TorchaudioTestCase):
+    def test_cpu_passthrough(self):
+        """On a CPU device the prefetcher yields the batches of the loader with the same structure."""
+        batches = [(torch.rand(2, 3), [("transcript", torch.rand(4))]) for _ in range(3)]
+        prefetched = list(CUDAPrefetcher(batches, "cpu"))
+        self.assertEqual(len(prefetched), 3)
+        for (tensor, samples), expected in zip(prefetched, batches):
+            self.assertEqual(tensor, expected[0])
+            self.assertEqual(samples[0][0], "transcript")
+            self.assertEqual(samples[0][1], expected[1][0][1])
+
+    def test_move_to_device_keeps_non_tensors(self):
+        batch = move_to_device((torch.zeros(1), ["a", 1]), "cpu")
+        self.assertIsInstance(batch, tuple)
+        self.assertEqual(batch[1], ["a", 1])
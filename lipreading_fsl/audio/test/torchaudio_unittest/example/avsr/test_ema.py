@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+
+import torch
+from torchaudio._internal.module_utils import is_module_available
+from torchaudio_unittest.common_utils import skipIfNoModule, TorchaudioTestCase
+
+if is_module_available("pytorch_lightning"):
+    from ema import EMA, ema_state_dict
+
+
+def _get_module():
+    torch.manual_seed(0)
+    return torch.nn.Sequential(torch.nn.Linear(3, 4), torch.nn.BatchNorm1d(4))
+
+
+@skipIfNoModule("pytorch_lightning")
+class TestEMA(TorchaudioTestCase):
+    def test_update(self):
+        """Every ``every_n_steps`` optimizer steps, the shadow weights move towards the current ones once."""
+        module = _get_module()
+        ema = EMA(decay=0.5, every_n_steps=2)
+        ema.on_fit_start(None, module)
+        initial = module[0].weight.detach().clone()
+        with torch.no_grad():
+            module[0].weight.add_(1.0)
+        for step in [1, 2, 2, 3]:
+            ema.on_train_batch_end(SimpleNamespace(global_step=step), module, None, None, 0)
+        self.assertEqual(ema.num_updates, 1)
+        # The first update uses the ramped-up decay 1 / 10.
+        self.assertEqual(ema.shadow[0], initial + 0.9)
+
+    def test_swap_and_checkpoint(self):
+        """The shadow weights are swapped in for validation, restored after it, and read from checkpoints."""
+        module = _get_module()
+        ema = EMA(decay=0.5)
+        ema.on_fit_start(None, module)
+        with torch.no_grad():
+            module[0].weight.add_(1.0)
+        trained = module[0].weight.detach().clone()
+
+        ema.on_validation_start(None, module)
+        self.assertEqual(module[0].weight, trained - 1.0)
+        ema.on_validation_end(None, module)
+        self.assertEqual(module[0].weight, trained)
+
+        checkpoint = {"state_dict": module.state_dict(), "callbacks": {"EMA": ema.state_dict()}}
+        state_dict = ema_state_dict(checkpoint)
+        self.assertEqual(state_dict["0.weight"], trained - 1.0)
+        self.assertEqual(state_dict["1.num_batches_tracked"], module[1].num_batches_tracked)
+
+        restored = EMA(decay=0.5)
+        restored.load_state_dict(checkpoint["callbacks"]["EMA"])
+        restored.on_validation_start(None, module)
+        self.assertEqual(module[0].weight, trained - 1.0)
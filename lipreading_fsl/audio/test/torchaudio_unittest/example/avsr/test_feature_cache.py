@@ -0,0 +1,53 @@
+import os
+
+import torch
+from torchaudio._internal.module_utils import is_module_available
+from torchaudio_unittest.common_utils import skipIfNoModule, TempDirMixin, TorchaudioTestCase
+
+if is_module_available("pytorch_lightning", "sentencepiece", "torchvision"):
+    from feature_cache import FeatureStore, FeatureTransform
+
+
+class _CharProcessor:
+    """Stands in for ``SentencePieceProcessor``, mapping every character to its code point."""
+
+    def get_piece_size(self):
+        return 1023
+
+
+@skipIfNoModule("pytorch_lightning")
+@skipIfNoModule("sentencepiece")
+@skipIfNoModule("torchvision")
+class TestFeatureStore(TempDirMixin, TorchaudioTestCase):
+    def test_build_and_load(self):
+        """The features of every sample are written unpadded and read back from the memory-mapped store."""
+        torch.manual_seed(0)
+        batches = [
+            (torch.randn(2, 5, 8), torch.tensor([5, 3])),
+            (torch.randn(1, 4, 8), torch.tensor([4])),
+        ]
+        prefix = self.get_temp_path("train.features")
+        store = FeatureStore.build(prefix, lambda batch: batch, batches)
+        self.assertTrue(os.path.exists(f"{prefix}.index.npz"))
+        self.assertFalse(os.path.exists(f"{prefix}.bin.{os.getpid()}.tmp"))
+
+        loaded = FeatureStore.load(prefix)
+        self.assertEqual(len(loaded), 3)
+        self.assertEqual(loaded.lengths.tolist(), [5, 3, 4])
+        for store_ in [store, loaded]:
+            self.assertEqual(store_[0], batches[0][0][0].half())
+            self.assertEqual(store_[1], batches[0][0][1, :3].half())
+            self.assertEqual(store_[2], batches[1][0][0].half())
+
+    def test_transform(self):
+        """Cached features are collated into a padded float32 batch with their targets."""
+        samples = [
+            (torch.randn(5, 8).half(), torch.tensor([1, 2], dtype=torch.int32)),
+            (torch.randn(3, 8).half(), torch.tensor([3], dtype=torch.int32)),
+        ]
+        batch = FeatureTransform(_CharProcessor())(samples)
+        self.assertEqual(batch.inputs.dtype, torch.float32)
+        self.assertEqual(batch.inputs.shape, (2, 5, 8))
+        self.assertEqual(batch.input_lengths.tolist(), [5, 3])
+        self.assertEqual(batch.target_lengths.tolist(), [2, 1])
+        self.assertEqual(batch.inputs[1, :3], samples[1][0].float())
@@ -0,0 +1,51 @@
+import numpy as np
+import torch
+from torchaudio._internal.module_utils import is_module_available
+from torchaudio_unittest.common_utils import skipIfNoModule, TempDirMixin, TorchaudioTestCase
+
+if is_module_available("sentencepiece", "torchvision"):
+    from lrs3 import _hash_file, _load_tokens, TokenCache
+
+
+class _CharProcessor:
+    """Stands in for ``SentencePieceProcessor``, mapping every character to its code point."""
+
+    def encode(self, transcripts):
+        return [[ord(c) for c in transcript] for transcript in transcripts]
+
+    def get_piece_size(self):
+        return 1023
+
+
+@skipIfNoModule("sentencepiece")
+@skipIfNoModule("torchvision")
+class TestTokenCache(TempDirMixin, TorchaudioTestCase):
+    def test_from_transcripts(self):
+        """Targets are the lower-cased token IDs of every transcript, stored as int16."""
+        tokens = TokenCache.from_transcripts(["AB", "", "cde"], _CharProcessor())
+        self.assertEqual(tokens.tokens.dtype, np.int16)
+        self.assertEqual(len(tokens), 3)
+        self.assertEqual(tokens[0], torch.tensor([97, 98], dtype=torch.int32))
+        self.assertEqual(tokens[1].numel(), 0)
+        self.assertEqual(tokens[2], torch.tensor([99, 100, 101], dtype=torch.int32))
+
+    def test_load_tokens_reuses_cache(self):
+        """A cache built from the same model and transcript revision is loaded without reading the transcripts."""
+        sp_model_path = self.get_temp_path("spm.model")
+        with open(sp_model_path, "wb") as f:
+            f.write(b"model")
+        tokens = TokenCache.from_transcripts(["ab", "c"], _CharProcessor())
+        prefix = self.get_temp_path("transcripts")
+        calls = []
+
+        def get_transcripts():
+            calls.append(1)
+            return ["ab", "c"]
+
+        # Save a cache directly, so that building it would require a real SentencePiece model.
+        cache_path = f"{prefix}.tokens-{_hash_file(sp_model_path)}.npz"
+        tokens.save(cache_path, 1.0)
+        loaded = _load_tokens(prefix, sp_model_path, 1.0, get_transcripts)
+        self.assertEqual(calls, [])
+        self.assertEqual(loaded[0], tokens[0])
+        self.assertEqual(loaded[1], tokens[1])
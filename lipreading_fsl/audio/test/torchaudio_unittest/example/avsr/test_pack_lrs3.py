@@ -0,0 +1,89 @@
+import os
+from types import SimpleNamespace
+
+import torch
+from torchaudio._internal.module_utils import is_module_available
+from torchaudio_unittest.common_utils import skipIfNoModule, TempDirMixin, TorchaudioTestCase
+
+if is_module_available("sentencepiece", "torchvision"):
+    from lrs3 import PackedLRS3
+    from pack_lrs3 import ShardWriter
+
+
+def _get_sample(seed, num_frames):
+    torch.manual_seed(seed)
+    video = torch.randint(0, 256, (num_frames, 1, 8, 8), dtype=torch.uint8)
+    audio = torch.randn(num_frames * 640, 1)
+    return audio, video, f"sample {seed}"
+
+
+@skipIfNoModule("sentencepiece")
+@skipIfNoModule("torchvision")
+class TestShardWriter(TempDirMixin, TorchaudioTestCase):
+    def test_resume(self):
+        """A resumed writer keeps the flushed samples, drops the unflushed ones and appends to a new shard."""
+        output_dir = self.get_temp_path("train")
+        os.makedirs(output_dir)
+        samples = [_get_sample(seed, num_frames) for seed, num_frames in enumerate([3, 5, 2, 4])]
+
+        writer = ShardWriter(output_dir, shard_size=1 << 30)
+        writer.write(*samples[0])
+        writer.write(*samples[1])
+        writer.flush()
+        # The writer is not closed, as if the process was killed after writing the third sample.
+        writer.write(*samples[2])
+
+        writer = ShardWriter(output_dir, shard_size=1 << 30, resume=True)
+        writer.write(*samples[3])
+        writer.close()
+
+        dataset = PackedLRS3(SimpleNamespace(packed_dir=self.get_temp_path(), modality="audiovisual"))
+        self.assertEqual(len(dataset), 3)
+        self.assertEqual(dataset.index[:, 0].tolist(), [0, 0, 1])
+        for n, (audio, video, transcript) in enumerate([samples[0], samples[1], samples[3]]):
+            packed_audio, packed_video, packed_transcript = dataset[n]
+            self.assertEqual(packed_audio, audio)
+            self.assertEqual(packed_video, video)
+            self.assertEqual(packed_transcript, transcript)
+
+    def test_resume_without_samples(self):
+        """A resumed writer that writes nothing leaves the packed set readable and lists no empty shard."""
+        output_dir = self.get_temp_path("train")
+        os.makedirs(output_dir)
+        samples = [_get_sample(seed, num_frames) for seed, num_frames in enumerate([3, 5])]
+
+        writer = ShardWriter(output_dir, shard_size=1 << 30)
+        for sample in samples:
+            writer.write(*sample)
+        writer.close()
+
+        ShardWriter(output_dir, shard_size=1 << 30, resume=True).close()
+
+        dataset = PackedLRS3(SimpleNamespace(packed_dir=self.get_temp_path(), modality="audiovisual"))
+        self.assertEqual(dataset.num_shards, 1)
+        self.assertEqual(len(dataset), 2)
+        for n, (audio, video, transcript) in enumerate(samples):
+            packed_audio, packed_video, packed_transcript = dataset[n]
+            self.assertEqual(packed_audio, audio)
+            self.assertEqual(packed_video, video)
+            self.assertEqual(packed_transcript, transcript)
+
+    def test_empty_transcripts(self):
+        """Empty transcripts, also the last one before a resume, keep every transcript aligned with its clip."""
+        output_dir = self.get_temp_path("train")
+        os.makedirs(output_dir)
+        samples = [_get_sample(seed, num_frames) for seed, num_frames in enumerate([3, 5, 2])]
+        samples[1] = (*samples[1][:2], "")
+
+        writer = ShardWriter(output_dir, shard_size=1 << 30)
+        writer.write(*samples[0])
+        writer.write(*samples[1])
+        writer.close()
+
+        writer = ShardWriter(output_dir, shard_size=1 << 30, resume=True)
+        writer.write(*samples[2])
+        writer.close()
+
+        dataset = PackedLRS3(SimpleNamespace(packed_dir=self.get_temp_path(), modality="audio"))
+        self.assertEqual(len(dataset), 3)
+        self.assertEqual(dataset.transcripts, ["sample 0", "", "sample 2"])
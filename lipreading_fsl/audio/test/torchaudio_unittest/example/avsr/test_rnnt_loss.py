@@ -0,0 +1,74 @@
+import torch
+import torchaudio
+from parameterized import parameterized
+from torchaudio.models import emformer_rnnt_model
+from torchaudio_unittest.common_utils import TorchaudioTestCase
+
+from rnnt_loss import chunked_rnnt_loss
+
+
+def _get_model():
+    return emformer_rnnt_model(
+        input_dim=16,
+        encoding_dim=32,
+        num_symbols=20,
+        segment_length=8,
+        right_context_length=0,
+        time_reduction_input_dim=32,
+        time_reduction_stride=1,
+        transformer_num_heads=2,
+        transformer_ffn_dim=32,
+        transformer_num_layers=2,
+        transformer_dropout=0.0,
+        transformer_activation="relu",
+        transformer_left_context_length=8,
+        transformer_max_memory_size=0,
+        transformer_weight_init_scale_strategy="depthwise",
+        transformer_tanh_on_mem=True,
+        symbol_embedding_dim=16,
+        num_lstm_layers=1,
+        lstm_layer_norm=True,
+        lstm_layer_norm_epsilon=1e-3,
+        lstm_dropout=0.0,
+    )
+
+
+class TestChunkedRNNTLoss(TorchaudioTestCase):
+    @parameterized.expand([(1,), (2,), (3,), (5,)])
+    def test_matches_full_loss(self, chunk_size):
+        """The chunked loss and its gradients equal the loss of the joiner output of the whole batch."""
+        torch.manual_seed(0)
+        model = _get_model()
+        loss_fn = torchaudio.transforms.RNNTLoss(reduction="sum")
+        blank_idx = 19
+        B, T, U = 5, 24, 6
+        sources = torch.rand(B, T, 16)
+        source_lengths = torch.tensor([24, 10, 17, 24, 3], dtype=torch.int32)
+        targets = torch.randint(0, blank_idx, (B, U), dtype=torch.int32)
+        target_lengths = torch.tensor([6, 2, 4, 1, 3], dtype=torch.int32)
+        prepended_targets = torch.cat([torch.full((B, 1), blank_idx, dtype=torch.int32), targets], dim=1)
+
+        output, output_lengths, _, _ = model(sources, source_lengths, prepended_targets, target_lengths + 1)
+        expected = loss_fn(output, targets, output_lengths, target_lengths)
+        expected.backward()
+        expected_grads = [p.grad.clone() for p in model.parameters()]
+        model.zero_grad()
+
+        source_encodings, output_lengths = model.transcribe(sources, source_lengths)
+        target_encodings, target_encoding_lengths, _ = model.predict(prepended_targets, target_lengths + 1, None)
+        loss = chunked_rnnt_loss(
+            model.join,
+            loss_fn,
+            source_encodings,
+            output_lengths,
+            target_encodings,
+            target_encoding_lengths,
+            targets,
+            target_lengths,
+            chunk_size,
+        )
+        loss.backward()
+
+        self.assertEqual(loss, expected, atol=1e-4, rtol=1e-5)
+        for param, expected_grad in zip(model.parameters(), expected_grads):
+            self.assertEqual(param.grad, expected_grad, atol=1e-4, rtol=1e-4)
@@ -0,0 +1,108 @@
+import torch
+from torchaudio._internal.module_utils import is_module_available
+from torchaudio.models import emformer_rnnt_model
+from torchaudio_unittest.common_utils import skipIfNoModule, TorchaudioTestCase
+
+if is_module_available("pytorch_lightning", "sentencepiece"):
+    from models.fusion import fusion_module
+    from models.resnet import video_resnet
+    from models.resnet1d import audio_resnet
+    from streaming import batch_states, split_state, StreamingAVSREngine
+
+
+class _AVModel(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.video_frontend = video_resnet()
+        self.audio_frontend = audio_resnet()
+        self.fusion = fusion_module(1024, 64, 16, dropout=0.0)
+        self.model = emformer_rnnt_model(
+            input_dim=16,
+            encoding_dim=32,
+            num_symbols=20,
+            segment_length=4,
+            right_context_length=0,
+            time_reduction_input_dim=32,
+            time_reduction_stride=1,
+            transformer_num_heads=2,
+            transformer_ffn_dim=32,
+            transformer_num_layers=2,
+            transformer_dropout=0.0,
+            transformer_activation="relu",
+            transformer_left_context_length=4,
+            transformer_max_memory_size=0,
+            transformer_weight_init_scale_strategy="depthwise",
+            transformer_tanh_on_mem=True,
+            symbol_embedding_dim=16,
+            num_lstm_layers=1,
+            lstm_layer_norm=True,
+            lstm_layer_norm_epsilon=1e-3,
+            lstm_dropout=0.0,
+        )
+        self.blank_idx = 19
+
+
+def _get_streams(num_frames):
+    torch.manual_seed(0)
+    return {
+        session_id: (torch.randn(n, 1, 32, 32), torch.randn(n * 640, 1)) for session_id, n in num_frames.items()
+    }
+
+
+def _decode(module, streams, max_batch_size, chunk_size=3):
+    engine = StreamingAVSREngine(module, beam_width=3, context_length=2, max_batch_size=max_batch_size)
+    for session_id in streams:
+        engine.open_session(session_id)
+    for start in range(0, max(video.size(0) for video, _ in streams.values()), chunk_size):
+        for session_id, (video, audio) in streams.items():
+            if start < video.size(0):
+                engine.push(
+                    session_id, video[start : start + chunk_size], audio[start * 640 : (start + chunk_size) * 640]
+                )
+        engine._decode_step()
+    for session in engine.sessions.values():
+        session.closing = True
+    while engine._decode_step():
+        pass
+    return {session_id: session.hypotheses for session_id, session in engine.sessions.items()}
+
+
+@skipIfNoModule("pytorch_lightning")
+@skipIfNoModule("sentencepiece")
+class TestStreamingAVSREngine(TorchaudioTestCase):
+    def test_batched_sessions_match_single_sessions(self):
+        """Decoding the segments of several sessions together yields the hypotheses of decoding them one by one."""
+        module = _AVModel().eval()
+        streams = _get_streams({"a": 13, "b": 9, "c": 4})
+        expected = _decode(module, streams, max_batch_size=1)
+        res = _decode(module, streams, max_batch_size=3)
+        for session_id in streams:
+            self.assertEqual([h[0] for h in res[session_id]], [h[0] for h in expected[session_id]])
+            self.assertEqual(
+                torch.tensor([h[3] for h in res[session_id]]),
+                torch.tensor([h[3] for h in expected[session_id]]),
+                atol=1e-4,
+                rtol=1e-4,
+            )
+
+    def test_batch_and_split_states(self):
+        """Batching the Emformer states of several streams and splitting them again returns the same states."""
+        module = _AVModel().eval()
+        states = []
+        for seed in range(3):
+            torch.manual_seed(seed)
+            _, _, state = module.model.transcribe_streaming(torch.randn(1, 4, 16), torch.tensor([4]), None)
+            states.append(state)
+        batched = batch_states(states)
+        for i, state in enumerate(states):
+            for layer, split_layer in zip(state, split_state(batched, i)):
+                for s, split_s in zip(layer, split_layer):
+                    self.assertEqual(s, split_s)
+        self.assertIsNone(batch_states([None, None]))
+
+    def test_push_rejects_unsynchronized_chunks(self):
+        """A chunk whose audio does not cover its video frames is rejected."""
+        engine = StreamingAVSREngine(_AVModel().eval())
+        engine.open_session("a")
+        with self.assertRaises(ValueError):
+            engine.push("a", torch.randn(2, 1, 32, 32), torch.randn(3 * 640, 1))
@@ -0,0 +1,66 @@
+import torch
+from parameterized import parameterized
+from torchaudio._internal.module_utils import is_module_available
+from torchaudio_unittest.common_utils import skipIfNoModule, TorchaudioTestCase
+
+if is_module_available("pytorch_lightning", "sentencepiece", "torchvision"):
+    import torchvision
+    from transforms import AdaptiveTimeMask, LengthAwareCollate
+
+
+@skipIfNoModule("pytorch_lightning")
+@skipIfNoModule("sentencepiece")
+@skipIfNoModule("torchvision")
+class TestAdaptiveTimeMask(TorchaudioTestCase):
+    @parameterized.expand(
+        [
+            ((8, 120, 1, 4, 4),),
+            ((8, 120 * 640, 1),),
+        ]
+    )
+    def test_padding_is_not_masked(self, shape):
+        """Masks only cover the valid frames of every sample."""
+        torch.manual_seed(0)
+        x = torch.ones(shape)
+        lengths = torch.randint(1, shape[1] + 1, (shape[0],))
+        for i, length in enumerate(lengths):
+            x[i, length:] = 2
+        AdaptiveTimeMask(10, 25)(x, lengths)
+        for i, length in enumerate(lengths):
+            self.assertTrue((x[i, length:] == 2).all())
+
+    def test_masks_are_drawn_per_sample(self):
+        """Samples of the same length are masked at different positions and masked windows are short."""
+        torch.manual_seed(0)
+        x = AdaptiveTimeMask(10, 25)(torch.ones(4, 500, 1))
+        masked = x[..., 0] == 0
+        self.assertTrue(masked.any())
+        self.assertFalse(all(torch.equal(masked[0], masked[i]) for i in range(1, 4)))
+        self.assertLessEqual(int(masked.sum(dim=1).max()), 20 * 9)
+
+
+@skipIfNoModule("pytorch_lightning")
+@skipIfNoModule("sentencepiece")
+@skipIfNoModule("torchvision")
+class TestLengthAwareCollate(TorchaudioTestCase):
+    def test_lengths_and_padding(self):
+        """Lengths are taken before padding and the padded frames stay zero."""
+        clips = [torch.randint(0, 256, (length, 3, 96, 96), dtype=torch.uint8) for length in (7, 3, 5)]
+        collate = LengthAwareCollate(
+            clip_transform=torch.nn.Sequential(
+                torchvision.transforms.CenterCrop(88),
+                torchvision.transforms.Grayscale(),
+            ),
+        )
+        videos, lengths = collate(clips)
+        self.assertEqual(videos.shape, (3, 7, 1, 88, 88))
+        self.assertEqual(videos.dtype, torch.uint8)
+        self.assertEqual(lengths.tolist(), [7, 3, 5])
+        self.assertTrue((videos[1, 3:] == 0).all())
+        self.assertTrue((videos[2, 5:] == 0).all())
+
+    def test_normalize(self):
+        """Frames are scaled and normalized like the former batch pipeline."""
+        clips = [torch.randint(0, 256, (length, 1, 4, 4), dtype=torch.uint8) for length in (2, 4)]
+        videos, _ = LengthAwareCollate(normalize=(0.5, 0.25))(clips)
+        self.assertEqual(videos[0, :2], (clips[0].float() / 255.0 - 0.5) / 0.25)
@@ -0,0 +1,65 @@
+import numpy as np
+from parameterized import parameterized
+from torchaudio_unittest.common_utils import TorchaudioTestCase
+
+from detectors.strided import detect_strided, needs_redetection
+
+
+def _box(x, y, size=40.0):
+    return np.array([[x, y], [x + size, y + size]])
+
+
+class _StubDetector:
+    """Returns the detection given for a frame index, the same box with score 1 by default, and records the calls."""
+
+    def __init__(self, detections=None):
+        self.detections = detections or {}
+        self.calls = []
+
+    def __call__(self, frame):
+        self.calls.append(frame)
+        return self.detections.get(frame, (_box(100.0, 100.0), 1.0))
+
+
+class TestDetectStrided(TorchaudioTestCase):
+    def test_keyframes(self):
+        """Every stride-th frame and the last frame are detected, and the frames in between are left to interpolate."""
+        detector = _StubDetector()
+        landmarks = detect_strided(list(range(11)), detector, stride=4)
+
+        self.assertEqual(detector.calls, [0, 4, 8, 10])
+        self.assertEqual([idx for idx, lm in enumerate(landmarks) if lm is not None], [0, 4, 8, 10])
+        self.assertEqual(landmarks[10].tolist(), _box(100.0, 100.0).tolist())
+
+    def test_stride_1(self):
+        """With stride 1, every frame is detected once."""
+        detector = _StubDetector()
+        landmarks = detect_strided(list(range(5)), detector, stride=1)
+
+        self.assertEqual(detector.calls, [0, 1, 2, 3, 4])
+        self.assertTrue(all(lm is not None for lm in landmarks))
+
+    @parameterized.expand(
+        [
+            ("missing", (None, 0.0)),
+            ("unconfident", (_box(100.0, 100.0), 0.5)),
+            ("shifted", (_box(120.0, 100.0), 1.0)),
+        ]
+    )
+    def test_redetection(self, _, detection):
+        """The frames on both sides of a missing, unconfident or shifted key frame are detected."""
+        detector = _StubDetector({4: detection})
+        landmarks = detect_strided(list(range(9)), detector, stride=4, min_confidence=0.9, max_shift=0.1)
+
+        self.assertEqual(detector.calls, [0, 4, 8, 1, 2, 3, 5, 6, 7])
+        self.assertEqual(landmarks[4] is None, detection[0] is None)
+        self.assertTrue(all(landmarks[idx] is not None for idx in [1, 2, 3, 5, 6, 7]))
+
+    def test_needs_redetection(self):
+        """Key frames are trusted if both found a confident face that moved by at most max_shift of its size."""
+        start = (_box(100.0, 100.0), 0.95)
+        self.assertFalse(needs_redetection(start, (_box(103.0, 100.0), 0.95), 0.9, 0.1))
+        self.assertTrue(needs_redetection(start, (_box(105.0, 100.0), 0.95), 0.9, 0.1))
+        self.assertTrue(needs_redetection(start, (_box(100.0, 100.0), 0.85), 0.9, 0.1))
+        self.assertTrue(needs_redetection(start, (None, 0.0), 0.9, 0.1))
+        self.assertTrue(needs_redetection((None, 0.0), start, 0.9, 0.1))
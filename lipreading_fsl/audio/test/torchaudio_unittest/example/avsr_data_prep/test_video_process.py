@@ -0,0 +1,94 @@
+import importlib
+
+import numpy as np
+from parameterized import parameterized
+from torchaudio._internal.module_utils import is_module_available
+from torchaudio_unittest.common_utils import skipIfNoModule, TorchaudioTestCase
+
+if is_module_available("cv2", "skimage"):
+    import cv2
+
+_MODULES = [("detectors.mediapipe.video_process",), ("detectors.retinaface.video_process",)]
+
+
+def _get_video(num_frames=4, height=240, width=320):
+    """Returns smooth RGB frames, so that interpolating them once or twice gives almost the same pixels."""
+    y, x = np.mgrid[:height, :width].astype(np.float64)
+    frames = []
+    for t in range(num_frames):
+        channels = [
+            128 + 100 * np.sin(x / 17.0 + t) * np.cos(y / 23.0),
+            128 + 100 * np.cos(x / 29.0 - y / 31.0 + t),
+            255 * (x + y) / (width + height),
+        ]
+        frames.append(np.stack(channels, axis=-1).round().astype(np.uint8))
+    return np.stack(frames)
+
+
+def _get_landmarks(num_frames=4, seed=0):
+    """Returns (2, 2) face box corners per frame, a scaled, rotated and shifted copy of the reference points."""
+    rng = np.random.default_rng(seed)
+    reference = np.array([[51.64568, 0.70204943], [171.95107, 159.59505]])
+    landmarks = []
+    for _ in range(num_frames):
+        angle = rng.uniform(-0.1, 0.1)
+        rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+        scale = rng.uniform(0.7, 0.9)
+        landmarks.append(scale * reference @ rotation.T + np.array([80.0, 50.0]) + rng.uniform(-5, 5, 2))
+    return landmarks
+
+
+def _reference_crop_patch(video_process, video, landmarks, target_size=(224, 224)):
+    """Aligns, cuts and resizes every frame separately, as ``crop_patch`` did before it was folded into one warp."""
+    stable_reference = video_process.get_stable_reference(video_process.reference, (0, 1), target_size, target_size)
+    height, width = video_process.crop_height // 2, video_process.crop_width // 2
+    sequence = []
+    for frame, frame_landmarks in zip(video, landmarks):
+        transform = cv2.estimateAffinePartial2D(
+            frame_landmarks.astype(np.float32), stable_reference.astype(np.float32), method=cv2.LMEDS
+        )[0]
+        aligned = cv2.warpAffine(
+            frame, transform, dsize=target_size, flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=0
+        )
+        aligned_landmarks = frame_landmarks @ transform[:, :2].T + transform[:, 2]
+        center_x, center_y = aligned_landmarks[video_process.start_idx : video_process.stop_idx].mean(axis=0)
+        y_min = int(round(np.clip(center_y - height, 0, target_size[1])))
+        y_max = int(round(np.clip(center_y + height, 0, target_size[1])))
+        x_min = int(round(np.clip(center_x - width, 0, target_size[0])))
+        x_max = int(round(np.clip(center_x + width, 0, target_size[0])))
+        sequence.append(cv2.resize(aligned[y_min:y_max, x_min:x_max], video_process.resize))
+    return np.array(sequence)
+
+
+@skipIfNoModule("cv2")
+@skipIfNoModule("skimage")
+class TestVideoProcess(TorchaudioTestCase):
+    @parameterized.expand(_MODULES)
+    def test_estimate_similarity_transforms(self, module_name):
+        """The closed-form transforms match the ones estimated by OpenCV for every frame."""
+        video_process = importlib.import_module(module_name)
+        landmarks = np.stack(_get_landmarks(num_frames=6))
+        reference = np.array([[51.64568, 0.70204943], [171.95107, 159.59505]])
+
+        transforms = video_process.estimate_similarity_transforms(landmarks, reference)
+
+        self.assertEqual(transforms.shape, (6, 2, 3))
+        for frame_landmarks, transform in zip(landmarks, transforms):
+            expected = cv2.estimateAffinePartial2D(frame_landmarks, reference, method=cv2.LMEDS)[0]
+            np.testing.assert_allclose(transform, expected, atol=1e-4)
+
+    @parameterized.expand(_MODULES)
+    def test_crop_patch(self, module_name):
+        """One warp per frame gives the patches of aligning, cutting and resizing the frame in turn."""
+        video_process = importlib.import_module(module_name).VideoProcess()
+        video = _get_video()
+        landmarks = _get_landmarks()
+
+        sequence = video_process.crop_patch(video, landmarks)
+        expected = _reference_crop_patch(video_process, video, landmarks)
+
+        self.assertEqual(sequence.shape, (4, 96, 96, 3))
+        self.assertEqual(sequence.dtype, np.uint8)
+        diff = np.abs(sequence.astype(np.float64) - expected.astype(np.float64))
+        self.assertLess(diff.mean(), 1.5)
+        self.assertLessEqual(diff.max(), 12)
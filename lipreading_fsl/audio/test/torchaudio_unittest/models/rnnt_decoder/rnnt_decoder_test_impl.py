@@ -1,5 +1,13 @@
 import torch
-from torchaudio.models import emformer_rnnt_model, RNNTBeamSearch
+from parameterized import parameterized
+from torchaudio.models import (
+    emformer_rnnt_model,
+    RNNTBatchBeamSearch,
+    RNNTBeamSearch,
+    RNNTGreedySearch,
+    RNNTModifiedBeamSearch,
+    RNNTTensorBeamSearch,
+)
 from torchaudio_unittest.common_utils import TestBaseMixin, torch_script
 
 
@@ -103,3 +111,354 @@ class RNNTBeamSearchTestImpl(TestBaseMixin):
 
             scripted_state = scripted_res[1]
             scripted_hypo = scripted_res[0]
+
+    def test_batch_search_matches_single_search(self):
+        r"""Verify that RNNTBatchBeamSearch finds the same hypotheses as RNNTBeamSearch for every utterance."""
+
+        input_config = self._get_input_config()
+        max_input_length = input_config["max_input_length"]
+        right_context_length = input_config["right_context_length"]
+        input_dim = input_config["input_dim"]
+        blank_idx = input_config["num_symbols"] - 1
+        beam_width = 5
+        batch_size = 3
+
+        torch.manual_seed(0)
+        input = torch.rand(batch_size, max_input_length + right_context_length, input_dim).to(
+            device=self.device, dtype=self.dtype
+        )
+        lengths = torch.tensor([max_input_length, 30, 45], device=self.device, dtype=torch.int32)
+
+        model = self._get_model()
+        enc_out, enc_lengths = model.transcribe(input, lengths)
+        batch_res = RNNTBatchBeamSearch(model, blank_idx)._batch_search(enc_out, enc_lengths, None, beam_width)
+        beam_search = RNNTBeamSearch(model, blank_idx)
+
+        self.assertEqual(len(batch_res), batch_size)
+        for i in range(batch_size):
+            res = beam_search._search(enc_out[i : i + 1, : enc_lengths[i]], None, beam_width)
+            self.assertEqual([h[0] for h in batch_res[i]], [h[0] for h in res])
+            self.assertEqual(
+                torch.tensor([h[3] for h in batch_res[i]]), torch.tensor([h[3] for h in res]), atol=1e-4, rtol=1e-4
+            )
+
+    def test_torchscript_consistency_batch_forward(self):
+        r"""Verify that scripting RNNTBatchBeamSearch does not change the behavior of method `forward`."""
+
+        input_config = self._get_input_config()
+        max_input_length = input_config["max_input_length"]
+        right_context_length = input_config["right_context_length"]
+        input_dim = input_config["input_dim"]
+        blank_idx = input_config["num_symbols"] - 1
+        beam_width = 5
+
+        input = torch.rand(3, max_input_length + right_context_length, input_dim).to(
+            device=self.device, dtype=self.dtype
+        )
+        lengths = torch.tensor([max_input_length, 30, 45], device=self.device, dtype=torch.int32)
+
+        beam_search = RNNTBatchBeamSearch(self._get_model(), blank_idx)
+        scripted = torch_script(beam_search)
+
+        self.assertEqual(beam_search(input, lengths, beam_width), scripted(input, lengths, beam_width))
+
+    def test_torchscript_consistency_batch_infer(self):
+        r"""Verify that scripting RNNTBatchBeamSearch does not change the behavior of method `infer`."""
+
+        input_config = self._get_input_config()
+        segment_length = input_config["segment_length"]
+        right_context_length = input_config["right_context_length"]
+        input_dim = input_config["input_dim"]
+        blank_idx = input_config["num_symbols"] - 1
+        beam_width = 5
+        batch_size = 2
+
+        beam_search = RNNTBatchBeamSearch(self._get_model(), blank_idx)
+        scripted = torch_script(beam_search)
+
+        state, hypo = None, None
+        scripted_state, scripted_hypo = None, None
+        for _ in range(2):
+            input = torch.rand(batch_size, segment_length + right_context_length, input_dim).to(
+                device=self.device, dtype=self.dtype
+            )
+            lengths = torch.full(
+                (batch_size,), segment_length + right_context_length, device=self.device, dtype=torch.int32
+            )
+            res = beam_search.infer(input, lengths, beam_width, state=state, hypothesis=hypo)
+            scripted_res = scripted.infer(input, lengths, beam_width, state=scripted_state, hypothesis=scripted_hypo)
+
+            self.assertEqual(res, scripted_res)
+
+            hypo, state = res
+            scripted_hypo, scripted_state = scripted_res
+
+    @parameterized.expand([(0,), (1,), (2,)])
+    def test_tensor_search_matches_search(self, seed):
+        r"""Verify that RNNTTensorBeamSearch finds the same hypotheses as RNNTBeamSearch."""
+
+        input_config = self._get_input_config()
+        max_input_length = input_config["max_input_length"]
+        right_context_length = input_config["right_context_length"]
+        input_dim = input_config["input_dim"]
+        blank_idx = input_config["num_symbols"] - 1
+        beam_width = 5
+
+        torch.manual_seed(seed)
+        input = torch.rand(1, max_input_length + right_context_length, input_dim).to(
+            device=self.device, dtype=self.dtype
+        )
+        lengths = torch.tensor([max_input_length], device=self.device, dtype=torch.int32)
+
+        model = self._get_model()
+        expected = RNNTBeamSearch(model, blank_idx)(input, lengths, beam_width)
+        res = RNNTTensorBeamSearch(model, blank_idx)(input, lengths, beam_width)
+
+        self.assertEqual([h[0] for h in res], [h[0] for h in expected])
+        self.assertEqual(
+            torch.tensor([h[3] for h in res]), torch.tensor([h[3] for h in expected]), atol=1e-4, rtol=1e-4
+        )
+
+    def test_tensor_search_matches_search_infer(self):
+        r"""Verify that RNNTTensorBeamSearch continues streaming hypotheses like RNNTBeamSearch."""
+
+        input_config = self._get_input_config()
+        segment_length = input_config["segment_length"]
+        right_context_length = input_config["right_context_length"]
+        input_dim = input_config["input_dim"]
+        blank_idx = input_config["num_symbols"] - 1
+        beam_width = 5
+
+        torch.manual_seed(0)
+        model = self._get_model()
+        beam_search = RNNTBeamSearch(model, blank_idx)
+        tensor_beam_search = RNNTTensorBeamSearch(model, blank_idx)
+
+        # The transcription network updates its state in place, so each decoder carries its own.
+        expected_state, state, hypo = None, None, None
+        for _ in range(3):
+            input = torch.rand(segment_length + right_context_length, input_dim).to(
+                device=self.device, dtype=self.dtype
+            )
+            lengths = torch.tensor(segment_length + right_context_length, device=self.device, dtype=torch.int32)
+            expected, expected_state = beam_search.infer(
+                input, lengths, beam_width, state=expected_state, hypothesis=hypo
+            )
+            res, state = tensor_beam_search.infer(input, lengths, beam_width, state=state, hypothesis=hypo)
+
+            self.assertEqual([h[0] for h in res], [h[0] for h in expected])
+            self.assertEqual(
+                torch.tensor([h[3] for h in res]), torch.tensor([h[3] for h in expected]), atol=1e-4, rtol=1e-4
+            )
+            hypo = expected
+
+    def test_torchscript_consistency_tensor_forward(self):
+        r"""Verify that scripting RNNTTensorBeamSearch does not change the behavior of method `forward`."""
+
+        input_config = self._get_input_config()
+        max_input_length = input_config["max_input_length"]
+        right_context_length = input_config["right_context_length"]
+        input_dim = input_config["input_dim"]
+        blank_idx = input_config["num_symbols"] - 1
+        beam_width = 5
+
+        input = torch.rand(1, max_input_length + right_context_length, input_dim).to(
+            device=self.device, dtype=self.dtype
+        )
+        lengths = torch.randint(1, max_input_length + 1, (1,)).to(device=self.device, dtype=torch.int32)
+
+        beam_search = RNNTTensorBeamSearch(self._get_model(), blank_idx)
+        scripted = torch_script(beam_search)
+
+        self.assertEqual(beam_search(input, lengths, beam_width), scripted(input, lengths, beam_width))
+
+    def test_torchscript_consistency_tensor_infer(self):
+        r"""Verify that scripting RNNTTensorBeamSearch does not change the behavior of method `infer`."""
+
+        input_config = self._get_input_config()
+        segment_length = input_config["segment_length"]
+        right_context_length = input_config["right_context_length"]
+        input_dim = input_config["input_dim"]
+        blank_idx = input_config["num_symbols"] - 1
+        beam_width = 5
+
+        beam_search = RNNTTensorBeamSearch(self._get_model(), blank_idx)
+        scripted = torch_script(beam_search)
+
+        state, hypo = None, None
+        scripted_state, scripted_hypo = None, None
+        for _ in range(2):
+            input = torch.rand(segment_length + right_context_length, input_dim).to(
+                device=self.device, dtype=self.dtype
+            )
+            lengths = torch.tensor(segment_length + right_context_length, device=self.device, dtype=torch.int32)
+            res = beam_search.infer(input, lengths, beam_width, state=state, hypothesis=hypo)
+            scripted_res = scripted.infer(input, lengths, beam_width, state=scripted_state, hypothesis=scripted_hypo)
+
+            self.assertEqual(res, scripted_res)
+
+            hypo, state = res
+            scripted_hypo, scripted_state = scripted_res
+
+    def test_greedy_search_matches_single_utterance(self):
+        r"""Verify that RNNTGreedySearch decodes every utterance of a batch as if it were decoded alone."""
+
+        input_config = self._get_input_config()
+        max_input_length = input_config["max_input_length"]
+        right_context_length = input_config["right_context_length"]
+        input_dim = input_config["input_dim"]
+        blank_idx = input_config["num_symbols"] - 1
+        batch_size = 3
+
+        torch.manual_seed(0)
+        input = torch.rand(batch_size, max_input_length + right_context_length, input_dim).to(
+            device=self.device, dtype=self.dtype
+        )
+        lengths = torch.tensor([max_input_length, 30, 45], device=self.device, dtype=torch.int32)
+
+        model = self._get_model()
+        enc_out, enc_lengths = model.transcribe(input, lengths)
+        greedy_search = RNNTGreedySearch(model, blank_idx, step_max_tokens=3)
+        batch_res = greedy_search._search(enc_out, enc_lengths)
+
+        self.assertEqual(len(batch_res), batch_size)
+        for i in range(batch_size):
+            res = greedy_search._search(enc_out[i : i + 1, : enc_lengths[i]], enc_lengths[i : i + 1])
+            self.assertEqual(len(batch_res[i]), 1)
+            self.assertEqual(batch_res[i][0][0], res[0][0][0])
+            self.assertEqual(batch_res[i][0][0][0], blank_idx)
+            self.assertEqual(torch.tensor(batch_res[i][0][3]), torch.tensor(res[0][0][3]), atol=1e-4, rtol=1e-4)
+
+    @parameterized.expand([(1,), (3,)])
+    def test_modified_beam_search_matches_greedy_search(self, step_max_tokens):
+        r"""Verify that RNNTModifiedBeamSearch with beam width 1 finds the hypothesis of RNNTGreedySearch."""
+
+        input_config = self._get_input_config()
+        max_input_length = input_config["max_input_length"]
+        right_context_length = input_config["right_context_length"]
+        input_dim = input_config["input_dim"]
+        blank_idx = input_config["num_symbols"] - 1
+
+        torch.manual_seed(0)
+        input = torch.rand(2, max_input_length + right_context_length, input_dim).to(
+            device=self.device, dtype=self.dtype
+        )
+        lengths = torch.tensor([max_input_length, 40], device=self.device, dtype=torch.int32)
+
+        model = self._get_model()
+        expected = RNNTGreedySearch(model, blank_idx, step_max_tokens=step_max_tokens)(input, lengths)
+        res = RNNTModifiedBeamSearch(model, blank_idx, step_max_tokens=step_max_tokens)(input, lengths, 1)
+
+        for hypos, expected_hypos in zip(res, expected):
+            self.assertEqual([h[0] for h in hypos], [h[0] for h in expected_hypos])
+            self.assertEqual(
+                torch.tensor([h[3] for h in hypos]),
+                torch.tensor([h[3] for h in expected_hypos]),
+                atol=1e-4,
+                rtol=1e-4,
+            )
+
+    def test_torchscript_consistency_greedy_forward(self):
+        r"""Verify that scripting RNNTGreedySearch does not change the behavior of method `forward`."""
+
+        input_config = self._get_input_config()
+        max_input_length = input_config["max_input_length"]
+        right_context_length = input_config["right_context_length"]
+        input_dim = input_config["input_dim"]
+        blank_idx = input_config["num_symbols"] - 1
+
+        input = torch.rand(2, max_input_length + right_context_length, input_dim).to(
+            device=self.device, dtype=self.dtype
+        )
+        lengths = torch.tensor([max_input_length, 40], device=self.device, dtype=torch.int32)
+
+        greedy_search = RNNTGreedySearch(self._get_model(), blank_idx)
+        scripted = torch_script(greedy_search)
+
+        self.assertEqual(greedy_search(input, lengths), scripted(input, lengths))
+
+    def test_torchscript_consistency_modified_beam_forward(self):
+        r"""Verify that scripting RNNTModifiedBeamSearch does not change the behavior of method `forward`."""
+
+        input_config = self._get_input_config()
+        max_input_length = input_config["max_input_length"]
+        right_context_length = input_config["right_context_length"]
+        input_dim = input_config["input_dim"]
+        blank_idx = input_config["num_symbols"] - 1
+        beam_width = 5
+
+        input = torch.rand(2, max_input_length + right_context_length, input_dim).to(
+            device=self.device, dtype=self.dtype
+        )
+        lengths = torch.tensor([max_input_length, 40], device=self.device, dtype=torch.int32)
+
+        beam_search = RNNTModifiedBeamSearch(self._get_model(), blank_idx, step_max_tokens=2)
+        scripted = torch_script(beam_search)
+
+        self.assertEqual(beam_search(input, lengths, beam_width), scripted(input, lengths, beam_width))
+
+    def test_modified_beam_search_hypotheses(self):
+        r"""Verify that RNNTModifiedBeamSearch returns distinct, ranked hypotheses within the symbol cap."""
+
+        input_config = self._get_input_config()
+        max_input_length = input_config["max_input_length"]
+        right_context_length = input_config["right_context_length"]
+        input_dim = input_config["input_dim"]
+        blank_idx = input_config["num_symbols"] - 1
+        beam_width = 5
+        step_max_tokens = 2
+
+        torch.manual_seed(0)
+        input = torch.rand(2, max_input_length + right_context_length, input_dim).to(
+            device=self.device, dtype=self.dtype
+        )
+        lengths = torch.tensor([max_input_length, 40], device=self.device, dtype=torch.int32)
+
+        model = self._get_model()
+        _, enc_lengths = model.transcribe(input, lengths)
+        res = RNNTModifiedBeamSearch(model, blank_idx, step_max_tokens=step_max_tokens)(input, lengths, beam_width)
+
+        self.assertEqual(len(res), 2)
+        for hypos, enc_length in zip(res, enc_lengths.tolist()):
+            self.assertGreater(len(hypos), 0)
+            self.assertLessEqual(len(hypos), beam_width)
+            tokens = [tuple(h[0]) for h in hypos]
+            self.assertEqual(len(set(tokens)), len(tokens))
+            for h in hypos:
+                self.assertEqual(h[0][0], blank_idx)
+                self.assertLessEqual(len(h[0]) - 1, enc_length * step_max_tokens)
+            sort_keys = [h[3] / (len(h[0]) + 1) for h in hypos]
+            self.assertEqual(sort_keys, sorted(sort_keys, reverse=True))
+
+    @parameterized.expand([(1024,), (2,)])
+    def test_predictor_cache_matches_uncached_search(self, predictor_cache_size):
+        r"""Verify that caching prediction network outputs does not change the hypotheses of RNNTBeamSearch."""
+
+        input_config = self._get_input_config()
+        max_input_length = input_config["max_input_length"]
+        right_context_length = input_config["right_context_length"]
+        input_dim = input_config["input_dim"]
+        blank_idx = input_config["num_symbols"] - 1
+        beam_width = 5
+
+        torch.manual_seed(0)
+        input = torch.rand(1, max_input_length + right_context_length, input_dim).to(
+            device=self.device, dtype=self.dtype
+        )
+        lengths = torch.tensor([max_input_length], device=self.device, dtype=torch.int32)
+
+        model = self._get_model()
+        uncached_search = RNNTBeamSearch(model, blank_idx, predictor_cache_size=0)
+        expected = uncached_search(input, lengths, beam_width)
+        beam_search = RNNTBeamSearch(model, blank_idx, predictor_cache_size=predictor_cache_size)
+        res = beam_search(input, lengths, beam_width)
+
+        self.assertEqual([h[0] for h in res], [h[0] for h in expected])
+        self.assertEqual(
+            torch.tensor([h[3] for h in res]), torch.tensor([h[3] for h in expected]), atol=1e-4, rtol=1e-4
+        )
+        self.assertEqual(uncached_search.predictor_cache_hits, 0)
+        self.assertEqual(
+            beam_search.predictor_cache_hits + beam_search.predictor_cache_misses,
+            uncached_search.predictor_cache_misses,
+        )